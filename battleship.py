@@ -4,13 +4,24 @@ battleship.py
 Contains core data structures and logic for Battleship, including:
  - Board class for storing ship positions, hits, misses
  - Utility function parse_coordinate for translating e.g. 'B5' -> (row, col)
+   (rows past 'Z' continue as 'AA', 'AB', ... so large boards are supported)
+ - parse_salvo for several coordinates in one line, e.g. 'B5 C6 D7'
+ - Board.render for cached text / run-length / JSON renderings of a viewport
  - A test harness run_single_player_game() to demonstrate the logic in a local, single-player mode
 
 """
 
 import random
+import re
+from functools import lru_cache
+from itertools import groupby
 
 BOARD_SIZE = 10
+VIEWPORT_SIZE = 10  # rows/columns rendered per board update unless a client asks otherwise
+COORDINATE_TABLE_MAX_SIZE = 256  # boards up to this size get a precomputed coordinate table
+COORDINATE_PATTERN = re.compile(r"([A-Z]+)([1-9][0-9]*)")  # ASCII only, no leading zeros: exactly the table's keys
+RENDER_FORMATS = ("text", "rle", "json")
+RENDER_CACHE_VIEWS = 32  # cached renderings per board; the oldest is dropped beyond this
 SHIPS = [
     ("Carrier", 5),
     ("Battleship", 4),
@@ -23,15 +34,23 @@ SHIPS = [
 class Board:
     """
     Represents a single Battleship board with hidden ships.
-    We store:
-      - self.hidden_grid: tracks real positions of ships ('S'), hits ('X'), misses ('o')
-      - self.display_grid: the version we show to the player ('.' for unknown, 'X' for hits, 'o' for misses)
+    The board is stored sparsely so that memory and per-move cost depend on the
+    number of ships and shots, not on size * size:
+      - self.ship_cells: maps (r, c) -> index into self.placed_ships for every ship cell
+      - self.shots: maps (r, c) -> 'X' (hit) or 'o' (miss) for every cell fired at
       - self.placed_ships: a list of dicts, each dict with:
           {
              'name': <ship_name>,
-             'positions': set of (r, c),
+             'positions': set of (r, c) not yet hit,
           }
         used to determine when a specific ship has been fully sunk.
+      - self.remaining: number of ship cells not yet hit
+
+    Any cell missing from both dicts is open water ('.').
+
+    Renderings are cached in self._renders, keyed by format and viewport. Each entry keeps
+    its rendered rows and a set of dirty rows; fire_at() only marks the row it changed, so
+    re-rendering rebuilds that row and an unchanged board is rendered for free.
 
     In a full 2-player networked game:
       - Each player has their own Board instance.
@@ -41,15 +60,16 @@ class Board:
 
     def __init__(self, size=BOARD_SIZE):
         self.size = size
-        # '.' for empty water
-        self.hidden_grid = [['.' for _ in range(size)] for _ in range(size)]
-        # display_grid is what the player or an observer sees (no 'S')
-        self.display_grid = [['.' for _ in range(size)] for _ in range(size)]
+        self.ship_cells = {}
+        self.shots = {}
         self.placed_ships = []  # e.g. [{'name': 'Destroyer', 'positions': {(r, c), ...}}, ...]
+        self.remaining = 0
+        self._renders = {}  # (fmt, top, left, height, width, show_hidden) -> [header, rows, dirty, result]
 
-    def place_ships_randomly(self, ships=SHIPS):
+    def place_ships_randomly(self, ships=SHIPS, rng=random):
         """
-        Randomly place each ship in 'ships' on the hidden_grid, storing positions for each ship.
+        Randomly place each ship in 'ships' on the board, storing positions for each ship.
+        Pass a seeded random.Random as 'rng' for a reproducible layout (e.g. in simulations).
         In a networked version, you might parse explicit placements from a player's commands
         (e.g. "PLACE A1 H BATTLESHIP") or prompt the user for board coordinates and placement orientations; 
         the self.place_ships_manually() can be used as a guide.
@@ -57,9 +77,9 @@ class Board:
         for ship_name, ship_size in ships:
             placed = False
             while not placed:
-                orientation = random.randint(0, 1)  # 0 => horizontal, 1 => vertical
-                row = random.randint(0, self.size - 1)
-                col = random.randint(0, self.size - 1)
+                orientation = rng.randint(0, 1)  # 0 => horizontal, 1 => vertical
+                row = rng.randint(0, self.size - 1)
+                col = rng.randint(0, self.size - 1)
 
                 if self.can_place_ship(row, col, ship_size, orientation):
                     occupied_positions = self.do_place_ship(row, col, ship_size, orientation)
@@ -84,7 +104,7 @@ class Board:
                 orientation_str = input("  Orientation? Enter 'H' (horizontal) or 'V' (vertical): ").strip().upper()
 
                 try:
-                    row, col = parse_coordinate(coord_str)
+                    row, col = parse_coordinate(coord_str, self.size)
                 except ValueError as e:
                     print(f"  [!] Invalid coordinate: {e}")
                     continue
@@ -119,32 +139,40 @@ class Board:
         if orientation == 0:  # Horizontal
             if col + ship_size > self.size:
                 return False
-            for c in range(col, col + ship_size):
-                if self.hidden_grid[row][c] != '.':
-                    return False
+            cells = ((row, c) for c in range(col, col + ship_size))
         else:  # Vertical
             if row + ship_size > self.size:
                 return False
-            for r in range(row, row + ship_size):
-                if self.hidden_grid[r][col] != '.':
-                    return False
-        return True
+            cells = ((r, col) for r in range(row, row + ship_size))
+        return not any(cell in self.ship_cells for cell in cells)
 
     def do_place_ship(self, row, col, ship_size, orientation):
         """
-        Place the ship on hidden_grid by marking 'S', and return the set of occupied positions.
+        Record the ship's cells in ship_cells, and return the set of occupied positions.
         """
-        occupied = set()
+        ship_index = len(self.placed_ships)
         if orientation == 0:  # Horizontal
-            for c in range(col, col + ship_size):
-                self.hidden_grid[row][c] = 'S'
-                occupied.add((row, c))
+            occupied = {(row, c) for c in range(col, col + ship_size)}
         else:  # Vertical
-            for r in range(row, row + ship_size):
-                self.hidden_grid[r][col] = 'S'
-                occupied.add((r, col))
+            occupied = {(r, col) for r in range(row, row + ship_size)}
+        for cell in occupied:
+            self.ship_cells[cell] = ship_index
+        self.remaining += ship_size
+        for r in {r for r, _ in occupied}:
+            self._mark_dirty(r)
         return occupied
 
+    def cell(self, row, col, show_hidden=False):
+        """
+        Return the character shown for (row, col): 'X', 'o', '.' or (if show_hidden) 'S'.
+        """
+        mark = self.shots.get((row, col))
+        if mark:
+            return mark
+        if show_hidden and (row, col) in self.ship_cells:
+            return 'S'
+        return '.'
+
     def fire_at(self, row, col):
         """
         Fire at (row, col). Return a tuple (result, sunk_ship_name).
@@ -156,27 +184,65 @@ class Board:
 
         The server can use this result to inform the firing player.
         """
-        cell = self.hidden_grid[row][col]
-        if cell == 'S':
+        if (row, col) in self.shots:
+            return ('already_shot', None)
+
+        if self._renders:
+            self._mark_dirty(row)
+        if (row, col) in self.ship_cells:
             # Mark a hit
-            self.hidden_grid[row][col] = 'X'
-            self.display_grid[row][col] = 'X'
+            self.shots[(row, col)] = 'X'
             # Check if that hit sank a ship
             sunk_ship_name = self._mark_hit_and_check_sunk(row, col)
             if sunk_ship_name:
                 return ('hit', sunk_ship_name)  # A ship has just been sunk
             else:
                 return ('hit', None)
-        elif cell == '.':
+        else:
             # Mark a miss
-            self.hidden_grid[row][col] = 'o'
-            self.display_grid[row][col] = 'o'
+            self.shots[(row, col)] = 'o'
             return ('miss', None)
-        elif cell == 'X' or cell == 'o':
-            return ('already_shot', None)
-        else:
-            # In principle, this branch shouldn't happen if 'S', '.', 'X', 'o' are all possibilities
-            return ('already_shot', None)
+
+    def to_state(self, shots=None):
+        """
+        A JSON-friendly snapshot of the board (ships and shots), for checkpoints.
+        'shots' is a copy of self.shots taken earlier, to build the state off the thread that
+        is firing at the board; by default the current shots are used.
+        """
+        if shots is None:
+            shots = self.shots
+        return {
+            'size': self.size,
+            'ships': [ship['name'] for ship in self.placed_ships],
+            'ship_cells': [[r, c, i] for (r, c), i in self.ship_cells.items()],
+            'shots': [[r, c, mark] for (r, c), mark in shots.items()],
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a board from to_state() output."""
+        board = cls(state['size'])
+        board.placed_ships = [{'name': name, 'positions': set()} for name in state['ships']]
+        board.shots = {(r, c): mark for r, c, mark in state['shots']}
+        for r, c, i in state['ship_cells']:
+            board.ship_cells[(r, c)] = i
+            if (r, c) not in board.shots:
+                board.placed_ships[i]['positions'].add((r, c))
+                board.remaining += 1
+        return board
+
+    def fire_salvo(self, targets):
+        """
+        Fire at every (row, col) in targets, in order, stopping early once the fleet is sunk.
+        Return a list of (row, col, result, sunk_ship_name), one per shot actually fired.
+        """
+        results = []
+        for row, col in targets:
+            result, sunk_ship_name = self.fire_at(row, col)
+            results.append((row, col, result, sunk_ship_name))
+            if self.all_ships_sunk():
+                break
+        return results
 
     def _mark_hit_and_check_sunk(self, row, col):
         """
@@ -184,26 +250,106 @@ class Board:
         If that ship's positions become empty, return the ship name (it's sunk).
         Otherwise return None.
         """
-        for ship in self.placed_ships:
-            if (row, col) in ship['positions']:
-                ship['positions'].remove((row, col))
-                if len(ship['positions']) == 0:
-                    return ship['name']
-                break
+        ship = self.placed_ships[self.ship_cells[(row, col)]]
+        ship['positions'].discard((row, col))
+        self.remaining -= 1
+        if len(ship['positions']) == 0:
+            return ship['name']
         return None
 
     def all_ships_sunk(self):
         """
-        Check if all ships are sunk (i.e. every ship's positions are empty).
+        Check if all ships are sunk (i.e. no ship cell is left unhit).
         """
-        for ship in self.placed_ships:
-            if len(ship['positions']) > 0:
-                return False
-        return True
+        return self.remaining == 0
+
+    def clamp_viewport(self, top=0, left=0, height=VIEWPORT_SIZE, width=VIEWPORT_SIZE):
+        """
+        Clip a requested viewport to the board, returning (top, left, height, width).
+        """
+        height = max(1, min(height, self.size))
+        width = max(1, min(width, self.size))
+        top = max(0, min(top, self.size - height))
+        left = max(0, min(left, self.size - width))
+        return top, left, height, width
+
+    def render_grid(self, top=0, left=0, height=VIEWPORT_SIZE, width=VIEWPORT_SIZE, show_hidden=False):
+        """
+        Render the rows [top, top + height) and columns [left, left + width) as text lines.
+        Only the requested region is visited, so the cost is independent of the board size.
+
+        The first line is the column header (1-based numbers), then one line per row
+        labelled with its row letters (A .. Z, AA, AB, ...).
+        """
+        header, rows = self._render_entry("text", top, left, height, width, show_hidden)[:2]
+        return [header] + rows
 
-    def print_display_grid(self, show_hidden_board=False):
+    def render(self, top=0, left=0, height=VIEWPORT_SIZE, width=VIEWPORT_SIZE, show_hidden=False, fmt="text"):
+        """
+        Render a viewport in one of RENDER_FORMATS:
+          - "text": the render_grid() lines joined with newlines (what clients see after GRID)
+          - "rle": each row run-length encoded, rows joined by '/', e.g. "3.X6." for "...X......"
+          - "json": {'top': ..., 'left': ..., 'rows': ["...X......", ...]}
+
+        The result is cached and shared, so callers must not modify it.
+        """
+        top, left, height, width = self.clamp_viewport(top, left, height, width)
+        entry = self._render_entry(fmt, top, left, height, width, show_hidden)
+        if entry[3] is None:
+            header, rows = entry[:2]
+            if fmt == "text":
+                entry[3] = header + "\n" + "\n".join(rows)
+            elif fmt == "rle":
+                entry[3] = "/".join(rows)
+            else:
+                entry[3] = {'top': top, 'left': left, 'rows': list(rows)}
+        return entry[3]
+
+    def _render_entry(self, fmt, top, left, height, width, show_hidden):
+        """Return the cache entry for a viewport, first rebuilding any rows marked dirty."""
+        if fmt not in RENDER_FORMATS:
+            raise ValueError(f"Unknown render format: {fmt}")
+        top, left, height, width = self.clamp_viewport(top, left, height, width)
+        key = (fmt, top, left, height, width, show_hidden)
+        entry = self._renders.get(key)
+        if entry is None:
+            if len(self._renders) >= RENDER_CACHE_VIEWS:
+                del self._renders[next(iter(self._renders))]
+            header = None
+            if fmt == "text":
+                label_width = max(2, len(row_label(self.size - 1)))
+                cell_width = max(2, len(str(self.size)))
+                header = " " * label_width + " " + " ".join(str(c + 1).rjust(cell_width) for c in range(left, left + width))
+            rows = [self._render_row(fmt, r, left, width, show_hidden) for r in range(top, top + height)]
+            entry = self._renders[key] = [header, rows, set(), None]
+        elif entry[2]:
+            for r in entry[2]:
+                entry[1][r - top] = self._render_row(fmt, r, left, width, show_hidden)
+            entry[2].clear()
+        return entry
+
+    def _render_row(self, fmt, row, left, width, show_hidden):
+        marks = "".join([self.cell(row, c, show_hidden) for c in range(left, left + width)])
+        if fmt == "text":
+            label_width = max(2, len(row_label(self.size - 1)))
+            cell_width = max(2, len(str(self.size)))
+            # Every mark right-aligned in cell_width columns, separated by single spaces
+            return f"{row_label(row):{label_width}} " + " " * (cell_width - 1) + (" " * cell_width).join(marks)
+        if fmt == "rle":
+            runs = ((mark, len(list(run))) for mark, run in groupby(marks))
+            return "".join(f"{count}{mark}" if count > 1 else mark for mark, count in runs)
+        return marks
+
+    def _mark_dirty(self, row):
+        """Flag 'row' for rebuilding in every cached rendering that shows it."""
+        for (_, top, _, height, _, _), entry in self._renders.items():
+            if top <= row < top + height:
+                entry[2].add(row)
+                entry[3] = None
+
+    def print_display_grid(self, show_hidden_board=False, top=0, left=0, height=VIEWPORT_SIZE, width=VIEWPORT_SIZE):
         """
-        Print the board as a 2D grid.
+        Print the board (or the given viewport of it) as a 2D grid.
         
         If show_hidden_board is False (default), it prints the 'attacker' or 'observer' view:
         - '.' for unknown cells,
@@ -216,34 +362,92 @@ class Board:
         - 'o' for misses,
         - '.' for empty water.
         """
-        # Decide which grid to print
-        grid_to_print = self.hidden_grid if show_hidden_board else self.display_grid
+        for line in self.render_grid(top, left, height, width, show_hidden=show_hidden_board):
+            print(line)
+
 
-        # Column headers (1 .. N)
-        print("  " + "".join(str(i + 1).rjust(2) for i in range(self.size)))
-        # Each row labeled with A, B, C, ...
-        for r in range(self.size):
-            row_label = chr(ord('A') + r)
-            row_str = " ".join(grid_to_print[r][c] for c in range(self.size))
-            print(f"{row_label:2} {row_str}")
+def row_label(row):
+    """
+    Convert a zero-based row index into its label, spreadsheet style:
+    0 => 'A', 25 => 'Z', 26 => 'AA', 27 => 'AB', ...
+    """
+    label = ""
+    row += 1
+    while row > 0:
+        row, rem = divmod(row - 1, 26)
+        label = chr(ord('A') + rem) + label
+    return label
 
 
-def parse_coordinate(coord_str):
+def row_index(label):
+    """
+    Inverse of row_label(): 'A' => 0, 'Z' => 25, 'AA' => 26.
+    """
+    index = 0
+    for ch in label:
+        if not 'A' <= ch <= 'Z':
+            raise ValueError(f"Invalid row '{label}'.")
+        index = index * 26 + (ord(ch) - ord('A') + 1)
+    return index - 1
+
+
+@lru_cache(maxsize=8)
+def coordinate_table(size):
+    """
+    Every valid coordinate string on a size x size board mapped to its (row, col),
+    e.g. {'A1': (0, 0), ..., 'J10': (9, 9)}. Built once per board size.
+    """
+    return {f"{row_label(r)}{c + 1}": (r, c) for r in range(size) for c in range(size)}
+
+
+def parse_coordinate(coord_str, size=None):
     """
     Convert something like 'B5' into zero-based (row, col).
-    Example: 'A1' => (0, 0), 'C10' => (2, 9)
-    HINT: you might want to add additional input validation here...
+    Example: 'A1' => (0, 0), 'C10' => (2, 9), 'AA1' => (26, 0)
+    Rows beyond 'Z' use multiple letters, so the format scales to any board size.
+    If size is given, the coordinate must also lie on a size x size board.
+    Raises ValueError for anything that is not a valid coordinate.
     """
     coord_str = coord_str.strip().upper()
-    row_letter = coord_str[0]
-    col_digits = coord_str[1:]
-
-    row = ord(row_letter) - ord('A')
-    col = int(col_digits) - 1  # zero-based
+    if size is not None and size <= COORDINATE_TABLE_MAX_SIZE:
+        position = coordinate_table(size).get(coord_str)
+        if position is None:
+            # Not a key of the table; the pattern only picks the error message
+            if COORDINATE_PATTERN.fullmatch(coord_str):
+                raise ValueError("Out of bounds.")
+            raise ValueError(f"Expected a coordinate like B5, got '{coord_str}'.")
+        return position
+
+    # Boards too big for a table: the pattern accepts the same strings the table would hold
+    match = COORDINATE_PATTERN.fullmatch(coord_str)
+    if match is None:
+        raise ValueError(f"Expected a coordinate like B5, got '{coord_str}'.")
+    row = row_index(match.group(1))
+    col = int(match.group(2)) - 1  # zero-based
+
+    if size is not None and (row >= size or col >= size):
+        raise ValueError("Out of bounds.")
 
     return (row, col)
 
 
+def parse_salvo(line, size, max_shots):
+    """
+    Parse up to max_shots coordinates separated by spaces or commas, e.g. 'B5 C6,D7'.
+    Returns a list of (row, col). Raises ValueError if any coordinate is invalid,
+    repeated, or if there are too many or none at all.
+    """
+    words = line.replace(",", " ").split()
+    if not words:
+        raise ValueError("Expected at least one coordinate.")
+    if len(words) > max_shots:
+        raise ValueError(f"At most {max_shots} shots per turn, got {len(words)}.")
+    targets = [parse_coordinate(word, size) for word in words]
+    if len(set(targets)) != len(targets):
+        raise ValueError("The same coordinate appears twice.")
+    return targets
+
+
 def run_single_player_game_locally():
     """
     A test harness for local single-player mode, demonstrating two approaches:
@@ -271,7 +475,7 @@ def run_single_player_game_locally():
             return
 
         try:
-            row, col = parse_coordinate(guess)
+            row, col = parse_coordinate(guess, board.size)
             result, sunk_name = board.fire_at(row, col)
             moves += 1
 
@@ -311,11 +515,8 @@ def run_single_player_game_online(rfile, wfile):
 
     def send_board(board):
         wfile.write("GRID\n")
-        wfile.write("  " + " ".join(str(i + 1).rjust(2) for i in range(board.size)) + '\n')
-        for r in range(board.size):
-            row_label = chr(ord('A') + r)
-            row_str = " ".join(board.display_grid[r][c] for c in range(board.size))
-            wfile.write(f"{row_label:2} {row_str}\n")
+        for line in board.render_grid():
+            wfile.write(line + '\n')
         wfile.write('\n')
         wfile.flush()
 
@@ -337,7 +538,7 @@ def run_single_player_game_online(rfile, wfile):
             return
 
         try:
-            row, col = parse_coordinate(guess)
+            row, col = parse_coordinate(guess, board.size)
             result, sunk_name = board.fire_at(row, col)
             moves += 1
 
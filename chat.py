@@ -0,0 +1,125 @@
+"""
+chat.py
+
+Chat throttling and delivery for the server.
+
+ - TokenBucket: each session may send CHAT_BURST messages at once and then CHAT_RATE per
+   second on average. Sessions get a bucket the first time they chat, so idle spectators
+   cost nothing extra.
+ - ChatDispatcher: post() only appends to a buffer and returns, so the thread that read
+   the chat packet (a reader or match thread) never sends to other clients. A dispatcher
+   thread collects messages for up to 'window' seconds and hands each batch to a deliver
+   callback, which sends every recipient one packet for the whole batch. Recipients that
+   cannot take it yet are retried through an optional flush callback, every 'window'
+   seconds for as long as it reports something still waiting.
+"""
+
+import threading
+import time
+import traceback
+
+CHAT_RATE = 1.0          # messages per second a session may send on average...
+CHAT_BURST = 5           # ...after a burst of up to this many
+BATCH_WINDOW = 0.1       # seconds a message may wait for others to join its batch
+MAX_BATCH_MESSAGES = 50  # deliver early once this many are waiting
+MAX_BATCH_BYTES = 16384  # or once the batch holds this many UTF-8 bytes (frames are at most 64 KiB)
+MAX_MESSAGE_BYTES = 1024  # longer chat messages are refused, so one batch always fits a frame
+
+
+def _size(message):
+    return len(message.encode("utf-8"))
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate=CHAT_RATE, burst=CHAT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Spend one token if there is one; False means the caller is over its limit."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class ChatDispatcher:
+    def __init__(self, deliver, window=BATCH_WINDOW, flush=None):
+        self.deliver = deliver  # deliver([(sender, message), ...]) on the dispatcher thread
+        self.flush = flush      # flush() -> True while deliveries are still waiting for slow recipients
+        self.window = window
+        self._pending = []
+        self._pending_bytes = 0
+        self._cond = threading.Condition()
+        self._closing = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="chat", daemon=True)
+            self._thread.start()
+        return self
+
+    def post(self, sender, message):
+        """Queue a message for everyone but sender. Returns immediately."""
+        with self._cond:
+            self._pending.append((sender, message))
+            self._pending_bytes += _size(message)
+            if len(self._pending) == 1 or self._full():
+                self._cond.notify()
+
+    def close(self):
+        """Deliver what is still buffered and stop the dispatcher thread."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _full(self):
+        return len(self._pending) >= MAX_BATCH_MESSAGES or self._pending_bytes >= MAX_BATCH_BYTES
+
+    def _take_pending(self):
+        # Up to MAX_BATCH_MESSAGES / MAX_BATCH_BYTES (but at least one message); the rest
+        # waits for the next batch
+        count = size = 0
+        for _, message in self._pending:
+            length = _size(message)
+            if count == MAX_BATCH_MESSAGES or (count and size + length > MAX_BATCH_BYTES):
+                break
+            count += 1
+            size += length
+        batch = self._pending[:count]
+        del self._pending[:count]
+        self._pending_bytes -= size
+        return batch
+
+    def _run(self):
+        backlog = False
+        while True:
+            with self._cond:
+                # With a backlog, wake up every window to retry it even if nobody chats
+                self._cond.wait_for(lambda: self._pending or self._closing,
+                                    timeout=self.window if backlog else None)
+                if self._pending:
+                    # Give more messages a chance to join this batch
+                    self._cond.wait_for(lambda: self._full() or self._closing, timeout=self.window)
+                batch = self._take_pending()
+                closing = self._closing and not self._pending
+            try:
+                if batch:
+                    self.deliver(batch)
+                if self.flush is not None:
+                    backlog = self.flush()
+            except Exception as e:
+                print(f"[ERROR] Chat delivery failed: {e}")
+                traceback.print_exc()
+            if closing:
+                return
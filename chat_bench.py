@@ -0,0 +1,173 @@
+"""
+chat_bench.py
+
+Turn latency of a match while spectators flood the chat.
+
+Each run starts the server in this process on an inproc:// address (see transport.py) and
+connects two players and a crowd of spectators. Some spectators ("spammers") send chat
+as fast as --chat-rate allows; all of them count what they receive. The players take
+--moves turns, and the time from a player's shot to its HIT!/MISS! reply is recorded.
+
+Two configurations are compared, each in its own process:
+ - unbatched: no chat limit and CHAT_BATCH_WINDOW = 0, i.e. every chat message is sent
+   to every client from the sender's thread (how the server used to work)
+ - batched: the server defaults (chat.py token buckets and the batching chat thread)
+
+    python chat_bench.py --spectators 20 --spammers 5 --chat-rate 100
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from protocol import encode_packet, new_sequence, PacketReader, PING, PONG
+from transport import connect
+
+ADDRESS = "inproc://chat-bench"
+MODES = ("unbatched", "batched")
+
+
+class BenchClient:
+    def __init__(self, name, lines=None):
+        self.sock = connect(ADDRESS)
+        self.reader = PacketReader(self.sock)
+        self.seq = new_sequence()
+        self.lines = lines  # queue of (client, payload) for game messages, or None to only count
+        self.packets = 0
+        self.chat_lines = 0
+        self.send(1, name)
+        threading.Thread(target=self._receive, daemon=True).start()
+
+    def send(self, packet_type, payload):
+        self.sock.sendall(encode_packet(next(self.seq), packet_type, payload))
+
+    def _receive(self):
+        while True:
+            try:
+                _, packet_type, payload = self.reader.read_packet()
+            except ValueError:
+                continue
+            except OSError:
+                return
+            if packet_type == PING:
+                self.send(PONG, payload)
+                continue
+            self.packets += 1
+            if packet_type == 2:
+                self.chat_lines += payload.count("\n") + 1
+            elif self.lines is not None:
+                self.lines.put((self, payload))
+
+
+def spam(client, rate, stop):
+    interval = 1 / rate
+    next_send = time.monotonic()
+    n = 0
+    while not stop.is_set():
+        client.send(2, f"spam {n} " + "lol " * 10)
+        n += 1
+        next_send += interval
+        time.sleep(max(0.0, next_send - time.monotonic()))
+    return n
+
+
+def run(mode, args):
+    import server
+    workdir = tempfile.mkdtemp()
+    server.LISTEN_ADDRESS = ADDRESS
+    server.STATS_DB = os.path.join(workdir, "stats.db")
+    server.CHECKPOINT_FILE = os.path.join(workdir, "checkpoint.json")
+    server.MAX_SESSIONS = server.MAX_HANDSHAKES = args.spectators + 10
+    if mode == "unbatched":
+        server.CHAT_RATE = 0
+        server.CHAT_BATCH_WINDOW = 0
+
+    log = open(os.devnull, "w")
+    def serve():
+        with contextlib.redirect_stdout(log):
+            server.main()
+    threading.Thread(target=serve, daemon=True).start()
+    time.sleep(0.3)
+
+    lines = queue.Queue()
+    players = [BenchClient("p1", lines), BenchClient("p2", lines)]
+    time.sleep(0.2)
+    crowd = [BenchClient(f"s{i}") for i in range(args.spectators)]
+    time.sleep(0.5)
+
+    stop = threading.Event()
+    sent = []
+    spammers = [threading.Thread(target=lambda c=c: sent.append(spam(c, args.chat_rate, stop)), daemon=True)
+                for c in crowd[:args.spammers]]
+    for t in spammers:
+        t.start()
+    time.sleep(0.5)  # let the chat load build up
+
+    latencies = []
+    shots = {}  # player -> time of the shot still waiting for its result
+    targets = [f"{row}{col}" for row in "ABCDEFGHIJ" for col in range(1, 11)]
+    fired = {players[0]: 0, players[1]: 0}
+    deadline = time.monotonic() + 60
+    while len(latencies) < args.moves and time.monotonic() < deadline:
+        try:
+            player, payload = lines.get(timeout=1)
+        except queue.Empty:
+            continue
+        if payload.startswith("Your turn"):
+            shots[player] = time.perf_counter()
+            player.send(1, targets[fired[player]])
+            fired[player] += 1
+        elif player in shots and (payload == "MISS!" or payload.startswith("HIT!")):
+            latencies.append((time.perf_counter() - shots.pop(player)) * 1000)
+        elif "win" in payload:
+            break
+
+    stop.set()
+    for t in spammers:
+        t.join()
+    latencies.sort()
+    received = crowd[args.spammers:] or crowd
+    return {
+        "moves": len(latencies),
+        "p50_ms": latencies[len(latencies) // 2] if latencies else 0.0,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+        "max_ms": latencies[-1] if latencies else 0.0,
+        "chat_sent": sum(sent),
+        "chat_lines_per_spectator": sum(c.chat_lines for c in received) / len(received),
+        "packets_per_spectator": sum(c.packets for c in received) / len(received),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure turn latency under chat load.")
+    parser.add_argument("--moves", type=int, default=30)
+    parser.add_argument("--spectators", type=int, default=20)
+    parser.add_argument("--spammers", type=int, default=5, help="spectators that chat flat out")
+    parser.add_argument("--chat-rate", type=float, default=100, help="messages/sec each spammer tries to send")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)  # one run, in a child process
+    args = parser.parse_args()
+
+    if args.mode:
+        sys.__stdout__.write(json.dumps(run(args.mode, args)) + "\n")  # the server's log goes to devnull
+        return
+
+    print(f"{args.spectators} spectators, {args.spammers} chatting at {args.chat_rate:g} msgs/sec each, {args.moves} moves")
+    print(f"  {'mode':>9} {'turn p50 ms':>12} {'p95 ms':>8} {'max ms':>8} {'chat sent':>10} "
+          f"{'chat lines/spec':>16} {'packets/spec':>13}")
+    for mode in MODES:
+        child = subprocess.run([sys.executable, __file__, "--mode", mode] + sys.argv[1:],
+                               capture_output=True, text=True, check=True)
+        r = json.loads(child.stdout.strip().splitlines()[-1])
+        print(f"  {mode:>9} {r['p50_ms']:>12.2f} {r['p95_ms']:>8.2f} {r['max_ms']:>8.2f} {r['chat_sent']:>10,} "
+              f"{r['chat_lines_per_spectator']:>16,.0f} {r['packets_per_spectator']:>13,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+checkpoint.py
+
+Crash-safe checkpoints of server state (matches, boards, turn pointers, the waiting queue),
+so a restarted server can put everyone back where they were.
+
+ - State is kept as named sections. put() stores a snapshot the caller has already taken
+   (or a function the writer calls to build it from copies the caller took);
+   register() + mark() let the writer build a section itself, only when it has changed.
+ - A background writer wakes at most every CHECKPOINT_INTERVAL seconds, re-encodes only the
+   sections changed since the last write (the others reuse their cached JSON), and writes
+   the file to a temporary name before an atomic rename. A crash mid-write leaves the
+   previous checkpoint intact.
+ - load_checkpoint() reads the whole checkpoint back in a single json.loads().
+"""
+
+import json
+import os
+import threading
+import time
+import traceback
+
+CHECKPOINT_FILE = "battleship_checkpoint.json"
+CHECKPOINT_INTERVAL = 1.0  # seconds between writes while state keeps changing
+FORMAT_VERSION = 1
+
+
+def load_checkpoint(path=CHECKPOINT_FILE):
+    """Return the saved sections as a dict, or {} if there is no usable checkpoint."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] Ignoring unreadable checkpoint {path}: {e}")
+        return {}
+    if data.get('version') != FORMAT_VERSION:
+        print(f"[ERROR] Ignoring checkpoint {path} with unknown version {data.get('version')}")
+        return {}
+    return data['sections']
+
+
+class Checkpointer:
+    def __init__(self, path=CHECKPOINT_FILE, interval=CHECKPOINT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._values = {}    # section -> snapshot waiting to be encoded
+        self._sources = {}   # section -> callable that builds the snapshot
+        self._marked = set() # sections whose source must be called again
+        self._encoded = {}   # section -> cached JSON text
+        self._removed = set() # sections removed while the writer was encoding
+        self._cond = threading.Condition()
+        self._dirty = False
+        self._closing = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def put(self, key, value):
+        """
+        Replace a section with a JSON-friendly snapshot, or with a function the writer calls
+        to build one. The caller must not mutate the snapshot (or what the function reads)
+        afterwards.
+        """
+        with self._cond:
+            self._values[key] = value
+            self._removed.discard(key)
+            self._set_dirty()
+
+    def remove(self, key):
+        with self._cond:
+            self._values.pop(key, None)
+            self._marked.discard(key)
+            self._removed.add(key)
+            if self._encoded.pop(key, None) is not None:
+                self._set_dirty()
+
+    def register(self, key, source):
+        """Build section 'key' by calling source() on the writer thread whenever it is marked."""
+        with self._cond:
+            self._sources[key] = source
+        self.mark(key)
+
+    def mark(self, key):
+        with self._cond:
+            self._marked.add(key)
+            self._set_dirty()
+
+    def close(self):
+        """Write any pending changes and stop the writer thread."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _set_dirty(self):
+        # Caller holds self._cond
+        if not self._dirty:
+            self._dirty = True
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._dirty or self._closing)
+                # Let changes pile up for one interval so a busy server writes once per interval
+                self._cond.wait_for(lambda: self._closing, timeout=self.interval)
+                values, self._values = self._values, {}
+                marked, self._marked = self._marked, set()
+                dirty, self._dirty = self._dirty, False
+                self._removed.clear()
+                closing = self._closing
+            if dirty:
+                try:
+                    self._write(values, marked)
+                except Exception as e:
+                    print(f"[ERROR] Checkpoint write failed: {e}")
+                    traceback.print_exc()
+            if closing:
+                return
+
+    def _write(self, values, marked):
+        start = time.perf_counter()
+        for key, value in values.items():
+            if callable(value):
+                values[key] = value()
+        for key in marked:
+            source = self._sources.get(key)
+            if source is not None:
+                values[key] = source()
+        encoded = {key: json.dumps(value, separators=(",", ":")) for key, value in values.items()}
+
+        with self._cond:
+            for key, text in encoded.items():
+                if key not in self._removed:
+                    self._encoded[key] = text
+            sections = ",".join(f"{json.dumps(key)}:{text}" for key, text in self._encoded.items())
+        text = f'{{"version":{FORMAT_VERSION},"saved_at":{time.time()},"sections":{{{sections}}}}}'
+
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)  # atomic: readers see the old or the new checkpoint, never half
+        print(f"[DEBUG] Checkpoint: {len(encoded)} of {len(self._encoded)} sections re-encoded, "
+              f"{len(text)} bytes in {(time.perf_counter() - start) * 1000:.1f} ms")
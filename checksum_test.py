@@ -2,9 +2,9 @@ import random
 from protocol import encode_packet, decode_packet
 
 def flip_random_bit(packet: bytes) -> bytes:
-    """Flip a random bit in the packet (excluding checksum byte at index 0)."""
+    """Flip a random bit in the packet (excluding the length prefix)."""
     packet = bytearray(packet)
-    index = random.randint(1, len(packet) - 1)
+    index = random.randint(2, len(packet) - 1)
     bit = 1 << random.randint(0, 7)
     packet[index] ^= bit
     return bytes(packet)
@@ -1,28 +1,57 @@
 import socket
+import sys
 import threading
-from protocol import decode_packet, encode_packet
+import time
+from protocol import encode_packet, new_sequence, PacketReader, PING, PONG, OPTIONS, COMPRESSION, HEARTBEAT_MISSES
+from transport import connect
 
 HOST = '127.0.0.1'
 PORT = 5000
 running = True
+send_lock = threading.Lock()  # the main thread and the receiving thread (pongs) both send
+last_heard = 0.0  # time.monotonic() of the last packet from the server
+silent = False  # set by the watchdog when the server stops responding
 
-def main():
+def send(sock, packet):
+    with send_lock:
+        sock.sendall(packet)
+
+def watchdog(sock, limit):
+    # Shut the socket down once the server has been silent for 'limit' seconds, which wakes
+    # the receiving thread. The socket itself has no timeout, so sends are never cut short.
+    global silent
+    while running:
+        time.sleep(limit / HEARTBEAT_MISSES)
+        if time.monotonic() - last_heard > limit:
+            silent = True
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            return
+
+def main(address=None):
+    # address picks the transport, e.g. unix:///tmp/battleship.sock; default tcp://HOST:PORT
     global running
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        seq = 0
-        s.connect((HOST, PORT))
+    with connect(address or f"tcp://{HOST}:{PORT}") as s:
+        seq = new_sequence()  # shared with the receiving thread, which sends the pongs
+        reader = PacketReader(s)
+        send(s, encode_packet(next(seq), OPTIONS, COMPRESSION))  # we can inflate compressed payloads
 
         # Username negotiation loop
         while True:
-            data = s.recv(1024)
             try:
-                _, packet_type, payload = decode_packet(data)
+                _, packet_type, payload = reader.read_packet()
+                if packet_type == PING:
+                    send(s, encode_packet(next(seq), PONG, payload))
+                    continue
                 print(payload)
 
+                if payload.startswith("[BUSY]"):
+                    return  # turned away by admission control; try again later
                 if "Enter your username" in payload or "already taken" in payload:
                     username = input(">> ")
-                    s.sendall(encode_packet(seq, 1, username))
-                    seq += 1
+                    send(s, encode_packet(next(seq), 1, username))
                 elif "Type 'quit'" in payload or "Enter coordinate" in payload or "connected as a spectator" in payload:
                     break  # Game has started, stop prompting for username
             except Exception as e:
@@ -30,57 +59,61 @@ def main():
                 return
 
         # Start receiving thread
-        recv_thread = threading.Thread(target=receive_messages, args=(s,))
+        recv_thread = threading.Thread(target=receive_messages, args=(reader, seq))
         recv_thread.daemon = True
         recv_thread.start()
 
         try:
             while running:
                 user_input = input()
+                if not running:
+                    break  # the receiving thread has lost the server
 
                 if user_input.lower() == "quit":
-                    s.sendall(encode_packet(seq, 1, "quit"))
+                    send(s, encode_packet(next(seq), 1, "quit"))
                     print("You exited the game.")
                     running = False
                     break
 
                 if user_input.startswith("CHAT "):
                     msg = user_input[5:]
-                    s.sendall(encode_packet(seq, 2, msg))
+                    send(s, encode_packet(next(seq), 2, msg))
                 else:
-                    s.sendall(encode_packet(seq, 1, user_input))
-
-                seq += 1
+                    send(s, encode_packet(next(seq), 1, user_input))
 
         except KeyboardInterrupt:
             print("\n[INFO] Client interrupted. Exiting...")
             running = False
+        except OSError as e:
+            print("[ERROR] Connection lost:", e)
+            running = False
 
-def receive_messages(sock):
-    buffer = b''
+def receive_messages(reader, seq):
+    global last_heard, running
+    watching = False
     while running:
         try:
-            chunk = sock.recv(4096)
-            if not chunk:
-                break
-            buffer += chunk
-
-            while len(buffer) >= 1:
-                checksum = buffer[0]
-                # Try to decrypt the rest and validate checksum
-                try:
-                    # Minimum valid length: 1 checksum + 8 nonce + something encrypted
-                    _, _, payload = decode_packet(buffer)
-                    print(f"\n{payload}")
-                    print(">> ", end="", flush=True)
-                    buffer = b''  # Clear after successful decode
-                    break
-                except ValueError:
-                    # wait for more data to form a full packet
-                    break
+            _, packet_type, payload = reader.read_packet()
+            last_heard = time.monotonic()
+            if packet_type == PING:
+                # Answer the heartbeat, and give up on the server if the next few never come
+                send(reader.sock, encode_packet(next(seq), PONG, payload))
+                if not watching:
+                    watching = True
+                    limit = float(payload) * HEARTBEAT_MISSES
+                    threading.Thread(target=watchdog, args=(reader.sock, limit), daemon=True).start()
+                continue
+            print(f"\n{payload}")
+            print(">> ", end="", flush=True)
+        except ValueError as e:
+            print("[ERROR] Dropped corrupted packet:", e)
         except Exception as e:
-            print("[ERROR]", e)
+            if silent:
+                print(f"\n[ERROR] Server stopped responding (missed {HEARTBEAT_MISSES} heartbeats). Press Enter to exit.")
+            else:
+                print("[ERROR]", e)
+            running = False
             break
 
 if __name__ == "__main__":
-    main()
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
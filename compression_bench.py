@@ -0,0 +1,93 @@
+"""
+compression_bench.py
+
+Outbound bytes per spectator per move, with and without payload compression.
+
+Games are played by simulator.py strategies; after every shot a spectator receives what the
+server broadcasts for it (the board of the player fired at, rendered with render_board(),
+and the "[Spectator] ... HIT!" / "MISS!" line), plus on average --chat chat lines. Every
+message is encoded as a full frame both plainly and with compress=True, so the figures
+include headers, authentication tags and the COMPRESS_MIN_SIZE cut-off. The CPU cost of
+encoding and of decoding on the spectator's side is reported per move.
+
+    python compression_bench.py --games 200 --chat 0.5
+"""
+
+import argparse
+import random
+import time
+
+from battleship import Board, SHIPS, row_label
+from protocol import encode_packet, decode_packet
+from server import render_board
+from simulator import HuntTargetStrategy
+
+
+def spectator_messages(games, chat, seed):
+    """Yield the list of messages one spectator gets for each move of 'games' games."""
+    rng = random.Random(seed)
+    for _ in range(games):
+        boards = []
+        for _ in range(2):
+            board = Board()
+            board.place_ships_randomly(SHIPS, rng)
+            boards.append(board)
+        players = [HuntTargetStrategy(boards[0].size, rng) for _ in range(2)]
+        turn = 0
+        while True:
+            board = boards[1 - turn]
+            row, col = players[turn].choose()
+            result, sunk = board.fire_at(row, col)
+            players[turn].observe(row, col, result, sunk)
+            guess = f"{row_label(row)}{col + 1}"
+            if result == 'hit':
+                event = f"[Spectator] {guess}: HIT!{' Sank ' + sunk if sunk else ''}"
+            else:
+                event = f"[Spectator] {guess}: MISS!"
+            messages = [render_board(board), event]
+            while rng.random() < chat / (1 + chat):  # geometric, mean 'chat' lines per move
+                messages.append(f"[CHAT] viewer{rng.randint(1, 99)}: " + "nice shot " * rng.randint(1, 6))
+            if board.all_ships_sunk():
+                messages.append(f"[Spectator] Player {turn + 1} wins!")
+                yield messages
+                break
+            yield messages
+            turn = 1 - turn
+
+
+def measure(moves, compress):
+    sent = 0
+    start = time.perf_counter()
+    packets = [[encode_packet(seq, 1, message, compress) for seq, message in enumerate(messages)] for messages in moves]
+    encode_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for move in packets:
+        for packet in move:
+            decode_packet(packet)
+            sent += len(packet)
+    decode_time = time.perf_counter() - start
+    return sent, encode_time, decode_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure spectator bytes per move with and without compression.")
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--chat", type=float, default=0.5, help="average chat lines per move")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    moves = list(spectator_messages(args.games, args.chat, args.seed))
+    payload = sum(len(m.encode()) for messages in moves for m in messages)
+    print(f"{args.games} games, {len(moves)} moves, {payload / len(moves):,.0f} payload bytes per move")
+    print(f"  {'mode':>10} {'bytes/move':>11} {'encode us/move':>15} {'decode us/move':>15}")
+    results = {}
+    for name, compress in (("plain", False), ("compressed", True)):
+        sent, encode_time, decode_time = measure(moves, compress)
+        results[name] = sent
+        print(f"  {name:>10} {sent / len(moves):>11,.0f} {encode_time / len(moves) * 1e6:>15.1f} "
+              f"{decode_time / len(moves) * 1e6:>15.1f}")
+    print(f"Outbound bytes per spectator per move: {1 - results['compressed'] / results['plain']:.0%} fewer with compression")
+
+
+if __name__ == "__main__":
+    main()
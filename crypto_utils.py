@@ -3,16 +3,18 @@ from Crypto.Cipher import AES
 import struct
 
 SHARED_KEY = b'supersecretkey12'  # 16 bytes
+TAG_SIZE = 16  # AES-OCB authentication tag appended to every ciphertext
 
 def get_nonce(seq: int) -> bytes:
-    return struct.pack(">Q", seq)  # 8-byte nonce from sequence number
+    return struct.pack(">4xQ", seq)  # 12-byte OCB nonce: 4 zero bytes + the 64-bit sequence number
 
 def encrypt(plaintext: bytes, seq: int) -> bytes:
-    nonce = get_nonce(seq)
-    cipher = AES.new(SHARED_KEY, AES.MODE_CTR, nonce=nonce)
-    return cipher.encrypt(plaintext)
+    """Encrypt and authenticate in one native pass (AES-OCB). Returns ciphertext + tag."""
+    cipher = AES.new(SHARED_KEY, AES.MODE_OCB, nonce=get_nonce(seq), mac_len=TAG_SIZE)
+    ciphertext, tag = cipher.encrypt_and_digest(plaintext)
+    return ciphertext + tag
 
-def decrypt(ciphertext: bytes, seq: int) -> bytes:
-    nonce = get_nonce(seq)
-    cipher = AES.new(SHARED_KEY, AES.MODE_CTR, nonce=nonce)
-    return cipher.decrypt(ciphertext)
+def decrypt(data, seq: int) -> bytes:
+    """Check the tag and decrypt output of encrypt(). Raises ValueError if anything was altered."""
+    cipher = AES.new(SHARED_KEY, AES.MODE_OCB, nonce=get_nonce(seq), mac_len=TAG_SIZE)
+    return cipher.decrypt_and_verify(data[:-TAG_SIZE], data[-TAG_SIZE:])
@@ -1,38 +1,43 @@
 import threading, time
 import socket
-from protocol import encode_packet, decode_packet
+from protocol import encode_packet, new_sequence, PacketReader, PING, PONG
 
 HOST = '127.0.0.1'
 PORT = 5000
+pongs = new_sequence()  # heartbeat replies; the test packets pick their own seqs
 
-def recv_and_print(sock):
+def recv_and_print(reader):
     try:
-        data = sock.recv(1024)
-        if not data:
-            return ""
         try:
-            seq, typ, payload = decode_packet(data)
+            seq, typ, payload = reader.read_packet()
+            while typ == PING:  # answer heartbeats and wait for the real message
+                reader.sock.sendall(encode_packet(next(pongs), PONG, payload))
+                seq, typ, payload = reader.read_packet()
             print(f"[Server] seq={seq}, type={typ}, payload='{payload}'")
             return payload
-        except Exception as e:
-            print(f"[ERROR] Failed to decode: {e} (raw={data})")
+        except ValueError as e:
+            print(f"[ERROR] Failed to decode: {e}")
             return ""
     except socket.timeout:
         print("[ERROR] Socket timeout")
         return ""
+    except ConnectionError:
+        return ""
     
 def dummy_victim():
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
         sock.settimeout(5)
         sock.connect((HOST, PORT))
-        recv_and_print(sock)
+        reader = PacketReader(sock)
+        recv_and_print(reader)
         sock.sendall(encode_packet(1, 1, "victim"))
         while True:
-            payload = recv_and_print(sock)
+            payload = recv_and_print(reader)
             if "Enter coordinate" in payload:
                 time.sleep(0.2)  # Slight delay to let attacker send first
                 sock.sendall(encode_packet(2, 1, "A1"))  # Legit move
                 break
+        time.sleep(10)  # Stay connected so the opponent's disconnect notice doesn't mask the result
 
 # Start victim thread
 threading.Thread(target=dummy_victim, daemon=True).start()
@@ -44,25 +49,30 @@ time.sleep(0.5)
 with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
     s.settimeout(5)
     s.connect((HOST, PORT))
-    recv_and_print(s)
+    reader = PacketReader(s)
+    recv_and_print(reader)
     s.sendall(encode_packet(1, 1, "attacker"))
 
     # Wait for coordinate prompt
     while True:
-        payload = recv_and_print(s)
+        payload = recv_and_print(reader)
         if "Enter coordinate" in payload:
             break
 
     print("[*] Sending valid move with seq=50")
     pkt = encode_packet(50, 1, "B5")
     s.sendall(pkt)
-    recv_and_print(s)
+    # Drain the board update and the result of the legitimate move
+    while True:
+        payload = recv_and_print(reader)
+        if not payload or "HIT" in payload or "MISS" in payload:
+            break
 
     print("[!] Replaying same move (seq=50)")
     replay_pkt = encode_packet(50, 1, "B5")  # regenerate to avoid socket state issues
     s.sendall(replay_pkt)
     time.sleep(0.3)
-    response = recv_and_print(s)
+    response = recv_and_print(reader)
 
     if not response:
         print("[✓] Replay attack was detected and dropped (no response).")
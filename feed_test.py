@@ -0,0 +1,117 @@
+"""
+feed_test.py
+
+Loopback test for the UDP spectator feed (spectator_feed.py).
+
+A random game is played through a SpectatorFeed on 127.0.0.1 while many FeedWatchers
+follow it. Each watcher randomly drops a share of the datagrams it receives (including
+snapshots), so gaps are common. At the end every watcher must have resynchronised to
+exactly the server's board state. Also reports how fast one delta fans out to all watchers.
+
+    python feed_test.py --watchers 200 --loss 0.05
+"""
+
+import argparse
+import random
+import select
+import socket
+import time
+
+from battleship import Board, SHIPS
+from spectator_feed import SpectatorFeed, FeedWatcher
+
+KEY = "match:p1-p2"
+
+
+def drain(watchers, rng, loss):
+    """Deliver everything waiting on the watchers' sockets, dropping a share at random."""
+    by_sock = {w.sock: w for w in watchers}
+    while True:
+        readable = select.select(list(by_sock), [], [], 0)[0]
+        if not readable:
+            return
+        for sock in readable:
+            data, _ = sock.recvfrom(65535)
+            if rng.random() >= loss:
+                by_sock[sock].handle_datagram(data)
+
+
+def in_sync(feed, watcher):
+    state = watcher.matches.get(KEY)
+    return (watcher.last_seq == feed.seq and not watcher.held and state is not None
+            and state['boards'] == feed.matches[KEY]['boards'] and state['turn'] == feed.matches[KEY]['turn'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the UDP spectator feed recovers from datagram loss.")
+    parser.add_argument("--watchers", type=int, default=200)
+    parser.add_argument("--loss", type=float, default=0.05, help="share of datagrams each watcher drops")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    feed = SpectatorFeed("127.0.0.1", 0).start()
+    watchers = [FeedWatcher(feed.address) for _ in range(args.watchers)]
+    for watcher in watchers:
+        watcher.sock.bind(("127.0.0.1", 0))
+        watcher.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        watcher.subscribe()
+    deadline = time.time() + 5
+    while len(feed.subscribers) < len(watchers) and time.time() < deadline:
+        time.sleep(0.01)
+        drain(watchers, rng, args.loss)  # answers the feed's return-path challenges
+        for watcher in watchers:
+            watcher.tick()
+
+    boards = [Board(), Board()]
+    for board in boards:
+        board.place_ships_randomly(SHIPS)
+    feed.start_match(KEY, ["p1", "p2"], boards)
+
+    targets = [[(r, c) for r in range(board.size) for c in range(board.size)] for board in boards]
+    for cells in targets:
+        rng.shuffle(cells)
+    turn = 0
+    publish_time = 0.0
+    published = 0
+    while not any(board.all_ships_sunk() for board in boards):
+        defender = 1 - turn
+        row, col = targets[defender].pop()
+        result, _ = boards[defender].fire_at(row, col)
+        start = time.perf_counter()
+        feed.update(KEY, defender, [(row, col, boards[defender].shots[(row, col)])], defender, f"{row},{col}: {result}")
+        publish_time += time.perf_counter() - start
+        published += 1
+        turn = defender
+        drain(watchers, rng, args.loss)
+        for watcher in watchers:
+            watcher.tick()
+
+    # Let outstanding snapshot requests complete
+    deadline = time.time() + 10
+    while time.time() < deadline and not all(in_sync(feed, w) for w in watchers):
+        time.sleep(0.05)
+        drain(watchers, rng, args.loss)
+        for watcher in watchers:
+            watcher.tick()
+
+    synced = sum(in_sync(feed, w) for w in watchers)
+    print(f"Watchers              : {len(watchers)}")
+    print(f"Deltas published      : {published} (+1 match start)")
+    print(f"Datagram loss         : {args.loss:.0%}")
+    print(f"Gaps detected         : {sum(w.gaps for w in watchers)}")
+    print(f"Snapshots applied     : {sum(w.snapshots for w in watchers)}")
+    print(f"Corrupt datagrams     : {sum(w.corrupt for w in watchers)}")
+    print(f"Datagrams sent/sec    : {published * len(watchers) / publish_time:,.0f}")
+    print(f"Watchers in sync      : {synced}/{len(watchers)}")
+
+    for watcher in watchers:
+        watcher.unsubscribe()
+        watcher.sock.close()
+    feed.close()
+    if synced != len(watchers):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
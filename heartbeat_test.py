@@ -0,0 +1,129 @@
+"""
+heartbeat_test.py
+
+Checks heartbeats on a whole server, run in this process on an inproc:// address with a
+short HEARTBEAT_INTERVAL:
+
+ - A player whose client stops answering PING (but keeps its connection open) must be
+   marked disconnected within HEARTBEAT_INTERVAL * (HEARTBEAT_MISSES + 1) seconds, which
+   its opponent hears about.
+ - Logging in again with the same name must resume the match: the returning player gets
+   its turn back and its next shot reaches the opponent.
+
+    python heartbeat_test.py --interval 0.2
+"""
+
+import argparse
+import contextlib
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+
+from protocol import encode_packet, new_sequence, PacketReader, PING, PONG
+from transport import connect
+
+ADDRESS = "inproc://heartbeat-test"
+
+
+def report(line):
+    sys.__stdout__.write(line + "\n")  # print() goes to the server's log, which is discarded
+
+
+class TestClient:
+    def __init__(self, name):
+        self.sock = connect(ADDRESS)
+        self.reader = PacketReader(self.sock)
+        self.seq = new_sequence()
+        self.messages = queue.Queue()
+        self.answering = True  # cleared to play a client that has hung
+        threading.Thread(target=self._receive, daemon=True).start()
+        self.send(name)
+
+    def _receive(self):
+        while True:
+            try:
+                _, packet_type, payload = self.reader.read_packet()
+            except ValueError:
+                continue
+            except OSError:
+                return
+            if packet_type == PING:
+                if self.answering:
+                    self.sock.sendall(encode_packet(next(self.seq), PONG, payload))
+            else:
+                self.messages.put(payload)
+
+    def send(self, text):
+        self.sock.sendall(encode_packet(next(self.seq), 1, text))
+
+    def wait_for(self, text, timeout=5):
+        """The first message containing text, or None if none arrives in time."""
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                message = self.messages.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            if text in message:
+                return message
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that silent players are cut off and can resume.")
+    parser.add_argument("--interval", type=float, default=0.2, help="HEARTBEAT_INTERVAL for the test server")
+    args = parser.parse_args()
+
+    import server
+    workdir = tempfile.mkdtemp()
+    server.LISTEN_ADDRESS = ADDRESS
+    server.STATS_DB = os.path.join(workdir, "stats.db")
+    server.CHECKPOINT_FILE = os.path.join(workdir, "checkpoint.json")
+    server.HEARTBEAT_INTERVAL = args.interval
+
+    log = open(os.devnull, "w")
+    def serve():
+        with contextlib.redirect_stdout(log):
+            server.main()
+    threading.Thread(target=serve, daemon=True).start()
+    time.sleep(0.3)
+
+    players = {name: TestClient(name) for name in ("p1", "p2")}
+    deadline = time.monotonic() + 5
+    while server.clients.get("p1") is None or server.clients["p1"].match is None:
+        if time.monotonic() > deadline:
+            report("Result                  : FAILED, the match never started")
+            raise SystemExit(1)
+        time.sleep(0.01)
+    match = server.clients["p1"].match
+    name = match.players[match.turn].id
+    first, second = players[name], players[match.players[1 - match.turn].id]
+    first.wait_for("Your turn")
+
+    # The player on turn hangs: connected, but silent
+    first.answering = False
+    hung = time.monotonic()
+    limit = server.HEARTBEAT_INTERVAL * (server.HEARTBEAT_MISSES + 1)
+    noticed = second.wait_for("Opponent disconnected", limit + 2) is not None
+    took = time.monotonic() - hung
+    cut_off = noticed and server.clients[name].disconnected and took <= limit + 0.5
+    report(f"silent player cut off   : {'yes' if noticed else 'no'} after {took:.2f}s (limit {limit:.2f}s)")
+
+    back = TestClient(name)
+    resumed = back.wait_for("Reconnected successfully") is not None and back.wait_for("Welcome back") is not None
+    if resumed:
+        back.send("A1")
+        resumed = second.wait_for("Opponent fired at A1") is not None
+    report(f"reconnect resumes match : {'yes' if resumed else 'no'}")
+
+    ok = cut_off and resumed
+    report("Result                  : " + ("OK" if ok else "FAILED"))
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+login_test.py
+
+Checks login and admission control on a whole server, run in this process on an inproc://
+address:
+
+ - Races: pairs of clients send the same username at the same moment, over and over.
+   Exactly one of each pair may get the name; the other is told it is taken.
+ - Reconnect when full: with the server at MAX_SESSIONS a new username is turned away
+   with [BUSY], but a player dropped from a match in progress is let back in and resumes it.
+
+    python login_test.py --races 20
+"""
+
+import argparse
+import contextlib
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+
+from protocol import encode_packet, new_sequence, PacketReader, PING, PONG
+from transport import connect
+
+ADDRESS = "inproc://login-test"
+TAKEN = "Username already exists"
+
+
+def report(line):
+    sys.__stdout__.write(line + "\n")  # print() goes to the server's log, which is discarded
+
+
+class TestClient:
+    def __init__(self):
+        self.sock = connect(ADDRESS)
+        self.reader = PacketReader(self.sock)
+        self.seq = new_sequence()
+        self.messages = queue.Queue()
+        threading.Thread(target=self._receive, daemon=True).start()
+
+    def _receive(self):
+        while True:
+            try:
+                _, packet_type, payload = self.reader.read_packet()
+            except ValueError:
+                continue
+            except OSError:
+                return
+            if packet_type == PING:
+                self.sock.sendall(encode_packet(next(self.seq), PONG, payload))
+            else:
+                self.messages.put(payload)
+
+    def send(self, text):
+        self.sock.sendall(encode_packet(next(self.seq), 1, text))
+
+    def next_message(self, timeout=5):
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def wait_for(self, text, timeout=5):
+        """The first message containing text, or None if none arrives in time."""
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            message = self.next_message(remaining)
+            if message is not None and text in message:
+                return message
+        return None
+
+    def close(self):
+        self.sock.close()
+
+
+def log_in(client, name, barrier=None):
+    """Send name once the username prompt is in; True if the server took it."""
+    client.wait_for("Enter your username")
+    if barrier is not None:
+        barrier.wait()
+    client.send(name)
+    reply = client.next_message()
+    return reply is not None and TAKEN not in reply
+
+
+def check_races(server, races):
+    winners = []
+    split = 0
+    for i in range(races):
+        name = f"race{i}"
+        pair = [TestClient(), TestClient()]
+        barrier = threading.Barrier(2)
+        results = [None, None]
+        def race(k):
+            results[k] = log_in(pair[k], name, barrier)
+        threads = [threading.Thread(target=race, args=(k,)) for k in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if results.count(True) == 1:
+            split += 1
+            winners.append((name, pair[results.index(True)]))
+            pair[results.index(False)].close()
+    report(f"same-name races         : {split}/{races} went to exactly one client")
+    return split == races and all(server.clients.get(name) is not None for name, _ in winners), winners
+
+
+def check_reconnect_when_full(server, winners):
+    if len(winners) < 2:
+        report("reconnect when full     : FAILED, too few logins got through to start a match")
+        return False
+    (name, player), (other, _) = winners[0], winners[1]
+    if server.clients[name].match is None or server.clients[other].match is None:
+        report("reconnect when full     : FAILED, the first two logins were not paired")
+        return False
+    server.MAX_SESSIONS = len(server.clients)  # no room for anyone new
+
+    newcomer = TestClient()
+    newcomer.wait_for("Enter your username")
+    newcomer.send("newcomer")
+    turned_away = newcomer.wait_for("[BUSY]") is not None
+    newcomer.close()
+
+    player.close()
+    deadline = time.monotonic() + 5
+    while not server.clients[name].disconnected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    returning = TestClient()
+    returning.wait_for("Enter your username")
+    returning.send(name)
+    let_in = returning.wait_for("Reconnected successfully") is not None
+    report(f"new name when full      : {'turned away' if turned_away else 'let in'}")
+    report(f"player back when full   : {'resumed the match' if let_in else 'turned away'}"
+           f" ({len(server.clients)} sessions, MAX_SESSIONS {server.MAX_SESSIONS})")
+    return turned_away and let_in and len(server.clients) <= server.MAX_SESSIONS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check username claims and reconnects at the session limit.")
+    parser.add_argument("--races", type=int, default=20, help="pairs of clients racing for one username")
+    args = parser.parse_args()
+
+    import server
+    workdir = tempfile.mkdtemp()
+    server.LISTEN_ADDRESS = ADDRESS
+    server.STATS_DB = os.path.join(workdir, "stats.db")
+    server.CHECKPOINT_FILE = os.path.join(workdir, "checkpoint.json")
+
+    log = open(os.devnull, "w")
+    def serve():
+        with contextlib.redirect_stdout(log):
+            server.main()
+    threading.Thread(target=serve, daemon=True).start()
+    time.sleep(0.3)
+
+    ok, winners = check_races(server, max(2, args.races))
+    ok = check_reconnect_when_full(server, winners) and ok
+    report("Result                  : " + ("OK" if ok else "FAILED"))
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+matchmaking.py
+
+Skill-based matchmaking for the server's waiting pool.
+
+ - Every player has an Elo rating (DEFAULT_RATING until they have played).
+ - Waiting players are indexed twice:
+     * a heap ordered by the time they joined the queue, so the longest-waiting player
+       is always served first (O(log n) push, removals are lazy). pop_pairs() walks it in
+       order without popping, so players left waiting are not re-pushed on every retry;
+     * a list sorted by rating, searched with bisect, to find the closest-rated partner.
+       Inserts and removals shift the list (O(n)), which is kept on purpose: everyone
+       waiting is a logged-in session, so the server bounds the queue by MAX_SESSIONS
+       (500), and shifting a few thousand bytes is cheaper than any tree kept in Python.
+ - A player only accepts partners within a rating window that widens the longer they
+   wait, so nobody is stuck forever when the pool is small or lopsided.
+
+pop_pairs() can form as many matches as there are free rooms in one call.
+"""
+
+import bisect
+import heapq
+import itertools
+import time
+
+DEFAULT_RATING = 1000
+K_FACTOR = 32
+BASE_WINDOW = 100        # rating difference accepted straight away
+WIDEN_PER_SECOND = 10    # extra rating difference accepted per second waited
+MAX_WAIT = 30            # after this many seconds any partner will do
+
+
+class Matchmaker:
+    def __init__(self, ratings=None):
+        self.ratings = dict(ratings or {})  # player id -> rating
+        self._by_wait = []    # heap of (enqueued_at, ticket, player id)
+        self._by_rating = []  # sorted list of (rating, ticket, player id)
+        self._waiting = {}    # player id -> (enqueued_at, ticket, rating)
+        self._tickets = itertools.count()
+
+    def __len__(self):
+        return len(self._waiting)
+
+    def __contains__(self, player_id):
+        return player_id in self._waiting
+
+    def rating(self, player_id):
+        return self.ratings.get(player_id, DEFAULT_RATING)
+
+    def enqueue(self, player_id, now=None):
+        """Add a player to the back of the queue (no-op if already waiting)."""
+        if player_id in self._waiting:
+            return
+        now = time.monotonic() if now is None else now
+        ticket = next(self._tickets)
+        rating = self.rating(player_id)
+        self._waiting[player_id] = (now, ticket, rating)
+        heapq.heappush(self._by_wait, (now, ticket, player_id))
+        bisect.insort(self._by_rating, (rating, ticket, player_id))
+
+    def remove(self, player_id):
+        """Take a player out of the queue. The wait-heap entry is dropped lazily."""
+        entry = self._waiting.pop(player_id, None)
+        if entry is None:
+            return False
+        _, ticket, rating = entry
+        i = bisect.bisect_left(self._by_rating, (rating, ticket, player_id))
+        del self._by_rating[i]
+        return True
+
+    def snapshot(self, now=None):
+        """Waiting players as [(player_id, seconds waited)], longest-waiting first."""
+        now = time.monotonic() if now is None else now
+        entries = sorted(self._waiting.items(), key=lambda item: item[1][:2])
+        return [(player_id, now - enqueued_at) for player_id, (enqueued_at, _, _) in entries]
+
+    def _walk_by_wait(self):
+        """Waiting players, longest-waiting first, read from the heap without popping it."""
+        heap = self._by_wait
+        frontier = [(heap[0], 0)] if heap else []  # (heap entry, its index): children are 2i+1, 2i+2
+        while frontier:
+            (_, ticket, player_id), i = heapq.heappop(frontier)
+            entry = self._waiting.get(player_id)
+            if entry is not None and entry[1] == ticket:
+                yield player_id
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
+
+    def _prune(self):
+        """Drop stale heap entries on top, and rebuild once they outnumber live ones."""
+        heap = self._by_wait
+        while heap and self._waiting.get(heap[0][2], (None, None))[1] != heap[0][1]:
+            heapq.heappop(heap)
+        if len(heap) > 2 * len(self._waiting) + 16:
+            self._by_wait = [(at, ticket, player_id) for player_id, (at, ticket, _) in self._waiting.items()]
+            heapq.heapify(self._by_wait)
+
+    def _window(self, player_id, now):
+        waited = now - self._waiting[player_id][0]
+        if waited >= MAX_WAIT:
+            return float('inf')
+        return BASE_WINDOW + WIDEN_PER_SECOND * waited
+
+    def _closest(self, player_id):
+        """Closest-rated other waiting player, or None."""
+        _, ticket, rating = self._waiting[player_id]
+        i = bisect.bisect_left(self._by_rating, (rating, ticket, player_id))
+        best = None
+        for j in (i - 1, i + 1):
+            if 0 <= j < len(self._by_rating):
+                other_rating, _, other = self._by_rating[j]
+                if best is None or abs(other_rating - rating) < abs(best[0] - rating):
+                    best = (other_rating, other)
+        return best
+
+    def pop_pairs(self, max_pairs, now=None):
+        """
+        Form up to max_pairs matches, longest-waiting players first.
+        Returns a list of (player_id, player_id); paired players leave the queue.
+        """
+        now = time.monotonic() if now is None else now
+        pairs = []
+        if max_pairs <= 0:
+            return pairs
+        # Players we cannot pair yet stay where they are in the heap; the walk never
+        # changes it, as remove() leaves heap entries to be pruned afterwards
+        for player_id in self._walk_by_wait():
+            best = self._closest(player_id)
+            if best is None or abs(best[0] - self.rating(player_id)) > self._window(player_id, now):
+                continue  # nobody close enough yet
+            partner = best[1]
+            pairs.append((player_id, partner))
+            self.remove(player_id)
+            self.remove(partner)
+            if len(pairs) == max_pairs:
+                break
+        self._prune()
+        return pairs
+
+    def record_result(self, winner_id, loser_id):
+        """Apply an Elo update; returns the (winner, loser) rating changes."""
+        winner = self.rating(winner_id)
+        loser = self.rating(loser_id)
+        expected = 1 / (1 + 10 ** ((loser - winner) / 400))
+        delta = round(K_FACTOR * (1 - expected))
+        self.ratings[winner_id] = winner + delta
+        self.ratings[loser_id] = loser - delta
+        return delta, -delta
@@ -0,0 +1,111 @@
+"""
+matchmaking_test.py
+
+Checks that players too far apart in rating to pair straight away still get a match once
+their rating windows have widened, with no further logins or match ends to trigger it.
+
+ - Matchmaker alone: pop_pairs() at increasing (injected) times.
+ - Whole server, in this process on an inproc:// address: two far-apart players log in
+   and must be paired by the server's periodic retry (PAIRING_RETRY_INTERVAL).
+
+    python matchmaking_test.py --gap 150
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import matchmaking
+from matchmaking import Matchmaker, DEFAULT_RATING
+from protocol import encode_packet, new_sequence, PacketReader, PING, PONG
+from transport import connect
+
+ADDRESS = "inproc://matchmaking-test"
+
+
+def report(line):
+    sys.__stdout__.write(line + "\n")  # print() goes to the server's log, which is discarded
+
+
+def expected_wait(gap):
+    """Seconds until a gap of this size falls inside the rating window."""
+    return min(matchmaking.MAX_WAIT, max(0, (gap - matchmaking.BASE_WINDOW) / matchmaking.WIDEN_PER_SECOND))
+
+
+def check_pop_pairs(gap):
+    mm = Matchmaker({"low": DEFAULT_RATING, "high": DEFAULT_RATING + gap})
+    mm.enqueue("low", now=0)
+    mm.enqueue("high", now=0)
+    wait = expected_wait(gap)
+    early = mm.pop_pairs(1, now=max(0, wait - 1))
+    late = mm.pop_pairs(1, now=wait + 0.01)
+    report(f"pop_pairs before {wait:.1f}s : {early}")
+    report(f"pop_pairs after {wait:.1f}s  : {late}")
+    return (wait == 0 or early == []) and late == [("low", "high")] and len(mm) == 0
+
+
+class TestClient:
+    def __init__(self, name):
+        self.sock = connect(ADDRESS)
+        self.reader = PacketReader(self.sock)
+        self.seq = new_sequence()
+        self.started = threading.Event()
+        self.sock.sendall(encode_packet(next(self.seq), 1, name))
+        threading.Thread(target=self._receive, daemon=True).start()
+
+    def _receive(self):
+        while True:
+            try:
+                _, packet_type, payload = self.reader.read_packet()
+            except ValueError:
+                continue
+            except OSError:
+                return
+            if packet_type == PING:
+                self.sock.sendall(encode_packet(next(self.seq), PONG, payload))
+            elif "Game started!" in payload:
+                self.started.set()
+
+
+def check_server(gap):
+    import server
+    workdir = tempfile.mkdtemp()
+    server.LISTEN_ADDRESS = ADDRESS
+    server.STATS_DB = os.path.join(workdir, "stats.db")
+    server.CHECKPOINT_FILE = os.path.join(workdir, "checkpoint.json")
+
+    log = open(os.devnull, "w")
+    def serve():
+        with contextlib.redirect_stdout(log):
+            server.main()
+    threading.Thread(target=serve, daemon=True).start()
+    time.sleep(0.3)
+    server.matchmaker.ratings.update({"low": DEFAULT_RATING, "high": DEFAULT_RATING + gap})
+
+    start = time.monotonic()
+    players = [TestClient("low"), TestClient("high")]
+    limit = expected_wait(gap) + 2 * server.PAIRING_RETRY_INTERVAL + 2
+    paired = all(p.started.wait(max(0.0, start + limit - time.monotonic())) for p in players)
+    waited = time.monotonic() - start
+    report(f"server paired them    : {'yes' if paired else 'no'} after {waited:.1f}s (limit {limit:.1f}s)")
+    return paired and waited >= expected_wait(gap) - 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that waiting players are paired once their windows widen.")
+    parser.add_argument("--gap", type=int, default=150, help="rating difference between the two players")
+    args = parser.parse_args()
+
+    ok = check_pop_pairs(args.gap)
+    ok = check_server(args.gap) and ok
+    report("Result                : " + ("OK" if ok else "FAILED"))
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,199 @@
 # protocol.py
+import itertools
+import secrets
 import struct
-from crypto_utils import encrypt, decrypt
+import zlib
+from crypto_utils import encrypt, decrypt, TAG_SIZE
 
-def encode_packet(seq, packet_type, payload):
-    raw = f"{packet_type}:{payload}".encode()
-    encrypted = encrypt(raw, seq)
-    checksum = (sum(encrypted) + seq) % 256
-    return struct.pack("!BB", checksum, seq) + encrypted  # checksum + seq + ciphertext
+LENGTH = struct.Struct("!H")    # number of bytes that follow the length field
+HEADER = struct.Struct("!HQ")   # length + 64-bit seq (also the cipher nonce)
+MAX_FRAME = LENGTH.size + 0xFFFF  # largest frame the length field can describe
+READ_BUFFER_SIZE = 4096  # initial receive buffer per connection; grows for larger frames
+
+# Heartbeats (packet types 1 and 2 are game commands and chat). The server pings every
+# connection each HEARTBEAT_INTERVAL seconds with the interval as the payload; the peer
+# answers with a PONG. A peer not heard from for HEARTBEAT_MISSES intervals is dead.
+PING = 3
+PONG = 4
+HEARTBEAT_INTERVAL = 2.0
+HEARTBEAT_MISSES = 3
+
+# Compression. A client that can inflate sends an OPTIONS packet with COMPRESSION at login;
+# the server then deflates payloads of at least COMPRESS_MIN_SIZE bytes it sends to that
+# client and marks them by adding COMPRESSED to the packet type. Payloads are compressed
+# one at a time against PRESET_DICTIONARY, so one compressed broadcast packet can go to
+# every client that asked for it. Compression happens before encryption.
+OPTIONS = 5
+COMPRESSION = "deflate-1"  # the number is the dictionary version; change both together
+COMPRESSED = 0x40
+COMPRESS_MIN_SIZE = 96
+MAX_INFLATED = 1 << 20  # larger payloads are rejected instead of inflated
+
+def _preset_dictionary():
+    # Text the server sends over and over. deflate finds matches nearer the end of the
+    # dictionary more cheaply, so the board templates go last.
+    messages = [
+        "[SERVER] You are connected as a spectator.", "[INFO] Next match: ", " vs ",
+        "[INFO] Only the player whose turn it is can chat.", "[CHAT SENT] ",
+        "Opponent fired at ", " and missed.", "Your ship was hit at ", "! You sank the ",
+        "Opponent's salvo: ", "SALVO: ", " MISS, ", " HIT, ", " HIT (sank ",
+        "Carrier", "Battleship", "Cruiser", "Submarine", "Destroyer",
+        "[Spectator] Player 1 wins!", "[Spectator] Player 2 wins!", "[Spectator] Player 1 salvo: ",
+        "[Spectator] Player 2 salvo: ", "Enter coordinate to fire at (e.g. B5):",
+        "[CHAT] ", "[Spectator] ", ": MISS!", ": HIT! Sank ", ": HIT!",
+    ]
+    header = "GRID\n    " + "".join(f"{c:>3}" for c in range(1, 11)).lstrip() + "\n"
+    rows = "".join(f"{label}   " + "  ".join("." * 10) + "\n" for label in "ABCDEFGHIJ")  # an untouched 10x10 board
+    return ("\n".join(messages) + "\n" + header + rows + "\n").encode()
+
+PRESET_DICTIONARY = _preset_dictionary()
+
+def compress_payload(data):
+    deflate = zlib.compressobj(6, zlib.DEFLATED, -15, 8, zlib.Z_DEFAULT_STRATEGY, PRESET_DICTIONARY)
+    return deflate.compress(data) + deflate.flush()
+
+def decompress_payload(data):
+    inflate = zlib.decompressobj(-15, PRESET_DICTIONARY)
+    try:
+        raw = inflate.decompress(data, MAX_INFLATED)
+    except zlib.error as e:
+        raise ValueError(f"Bad compressed payload: {e}") from None
+    if inflate.unconsumed_tail or not inflate.eof:
+        raise ValueError("Compressed payload too large or truncated")
+    return raw
+
+def new_sequence():
+    """
+    Sequence numbers for one sender: next(sequence) for every packet it sends. They are
+    also the cipher nonce, which must never repeat under the shared key, so every sender
+    starts at its own random 62-bit offset (leaving room to count up) rather than at 0.
+    """
+    return itertools.count(secrets.randbits(62))
+
+def encode_packet(seq, packet_type, payload, compress=False):
+    # compress: the peer asked for COMPRESSION at login
+    data = payload.encode()
+    if compress and len(data) >= COMPRESS_MIN_SIZE:
+        packed = compress_payload(data)
+        if len(packed) < len(data):
+            packet_type |= COMPRESSED
+            data = packed
+    raw = b"%d:" % packet_type + data
+    sealed = encrypt(raw, seq)  # ciphertext + authentication tag
+    if HEADER.size + len(sealed) > MAX_FRAME:
+        raise ValueError("Packet too large")
+    length = HEADER.size - LENGTH.size + len(sealed)
+    return HEADER.pack(length, seq) + sealed  # length + seq + ciphertext + tag
 
 def decode_packet(data):
-    if len(data) < 2:
+    """
+    Decode exactly one frame. 'data' may be bytes, a bytearray or a memoryview (e.g. a slice
+    of a PacketReader buffer). The cipher checks the tag while it decrypts, in one native
+    pass; any altered byte, including the length and seq, makes the frame fail with ValueError.
+    """
+    if len(data) < HEADER.size + TAG_SIZE:
         raise ValueError("Incomplete packet")
 
-    recv_checksum, seq = struct.unpack("!BB", data[:2])
-    encrypted = data[2:]
-    if (sum(encrypted) + seq) % 256 != recv_checksum:
-        raise ValueError("Checksum mismatch")
+    length, seq = HEADER.unpack_from(data)
+    if LENGTH.size + length != len(data):
+        raise ValueError("Frame length mismatch")
 
-    raw = decrypt(encrypted, seq)
-    parts = raw.decode().split(":", 1)
-    if len(parts) != 2:
+    try:
+        # The only copy of the frame: pycryptodome is much faster on bytes than on views
+        raw = decrypt(memoryview(data)[HEADER.size:].tobytes(), seq)
+    except ValueError:
+        raise ValueError("Authentication failed") from None
+    sep = raw.find(b":", 0, 4)  # packet types are at most a few digits
+    if sep <= 0:
         raise ValueError("Malformed decrypted content")
 
-    packet_type = int(parts[0])
-    payload = parts[1]
+    packet_type = int(raw[:sep])
+    if packet_type & COMPRESSED:
+        packet_type &= ~COMPRESSED
+        payload = str(decompress_payload(memoryview(raw)[sep + 1:]), "utf-8")
+    else:
+        payload = str(memoryview(raw)[sep + 1:], "utf-8")
     return seq, packet_type, payload
+
+
+class PacketReader:
+    """
+    Reassembles frames from a stream socket without re-copying what has already arrived.
+
+    Data is received with recv_into() straight into a preallocated bytearray. Complete
+    frames are decoded from memoryview slices of that buffer, so a packet costs its
+    plaintext and payload string instead of a chain of slices and concatenations.
+    """
+
+    def __init__(self, sock, capacity=READ_BUFFER_SIZE):
+        self.sock = sock
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._start = 0  # first byte not yet consumed
+        self._end = 0    # end of received data
+
+    def buffered(self):
+        return self._end - self._start
+
+    def has_packet(self):
+        """True if a complete frame is already buffered."""
+        if self.buffered() < LENGTH.size:
+            return False
+        (length,) = LENGTH.unpack_from(self._buf, self._start)
+        return self.buffered() >= LENGTH.size + length
+
+    def fill(self):
+        """
+        Receive whatever the socket has into the free tail of the buffer.
+        Raises ConnectionResetError if the peer closed the connection.
+        """
+        if self._end == len(self._buf):
+            self._make_room()
+        n = self.sock.recv_into(self._view[self._end:])
+        if n == 0:
+            raise ConnectionResetError("Connection closed by peer")
+        self._end += n
+        return n
+
+    def _make_room(self):
+        pending = self.buffered()
+        needed = LENGTH.size
+        if pending >= LENGTH.size:
+            (length,) = LENGTH.unpack_from(self._buf, self._start)
+            needed = LENGTH.size + length
+        if self._start > 0 and needed <= len(self._buf):
+            # Slide the partial frame to the front of the buffer
+            self._view[:pending] = self._view[self._start:self._end]
+        else:
+            # Frame larger than the buffer: grow once to fit it (no frame exceeds MAX_FRAME)
+            grown = bytearray(max(needed, min(2 * len(self._buf), MAX_FRAME)))
+            grown[:pending] = self._view[self._start:self._end]
+            self._view.release()
+            self._buf = grown
+            self._view = memoryview(grown)
+        self._start, self._end = 0, pending
+
+    def next_packet(self):
+        """
+        Decode the next buffered frame and return (seq, packet_type, payload), or None if
+        no complete frame has arrived yet. A corrupted frame is consumed and raises ValueError.
+        """
+        if not self.has_packet():
+            return None
+        (length,) = LENGTH.unpack_from(self._buf, self._start)
+        frame = self._view[self._start:self._start + LENGTH.size + length]
+        self._start += LENGTH.size + length
+        if self._start == self._end:
+            self._start = self._end = 0
+        try:
+            return decode_packet(frame)
+        finally:
+            frame.release()
+
+    def read_packet(self):
+        """Block until a full packet has arrived, then decode and return it."""
+        while True:
+            packet = self.next_packet()
+            if packet is not None:
+                return packet
+            self.fill()
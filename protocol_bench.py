@@ -0,0 +1,205 @@
+"""
+protocol_bench.py
+
+Microbenchmarks and a corruption fuzzer for protocol.py and crypto_utils.py.
+
+ - Throughput: encode/decode packets/sec and bytes/sec for several payload sizes,
+   plus the raw encrypt/decrypt helpers underneath them.
+ - Fuzzing: builds frames in batches and mutates them by flipping bits, truncating,
+   splicing two frames together and appending oversized garbage. Every mutated frame
+   must be rejected with ValueError; anything that decodes counts as undetected and any
+   other exception type counts as a crash.
+
+Results can be stored as a baseline and later runs compared against it:
+
+    python protocol_bench.py --save-baseline        # record bench_baseline.json
+    python protocol_bench.py --check                # exit 1 on regression
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from crypto_utils import encrypt, decrypt
+from protocol import encode_packet, decode_packet
+
+PAYLOAD_SIZES = [8, 64, 512, 4096]
+SEQS = range(2**40, 2**40 + 256)  # sequence numbers are 64-bit; use some that need all the header bytes
+MUTATIONS = ["bitflip", "multiflip", "truncate", "splice", "oversize"]
+BASELINE_FILE = "bench_baseline.json"
+THROUGHPUT_TOLERANCE = 0.20  # fail if packets/sec drops by more than 20%
+DETECTION_TOLERANCE = 0.01   # fail if a detection rate drops by more than 1 point
+
+
+def _rate(fn, args_list, min_time):
+    """Call fn(*args) over args_list repeatedly for at least min_time seconds; return calls/sec."""
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        for args in args_list:
+            fn(*args)
+        calls += len(args_list)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return calls / elapsed
+
+
+def bench_throughput(min_time=0.5):
+    results = {}
+    for size in PAYLOAD_SIZES:
+        payload = "x" * size
+        packets = [encode_packet(seq, 1, payload) for seq in SEQS]
+        raw = f"1:{payload}".encode()
+        ciphertexts = [encrypt(raw, seq) for seq in SEQS]
+
+        rates = {
+            "encode": _rate(encode_packet, [(seq, 1, payload) for seq in SEQS], min_time),
+            "decode": _rate(decode_packet, [(p,) for p in packets], min_time),
+            "encrypt": _rate(encrypt, [(raw, seq) for seq in SEQS], min_time),
+            "decrypt": _rate(decrypt, [(c, seq) for seq, c in zip(SEQS, ciphertexts)], min_time),
+        }
+        results[str(size)] = {
+            name: {"packets_per_sec": rate, "bytes_per_sec": rate * size}
+            for name, rate in rates.items()
+        }
+    return results
+
+
+def _flip_bits(frame, rng, count):
+    # Flip 'count' random bits at once by XOR-ing the whole frame with a mask
+    mask = 0
+    for _ in range(count):
+        mask |= 1 << rng.randrange(len(frame) * 8)
+    value = int.from_bytes(frame, "big") ^ mask
+    return value.to_bytes(len(frame), "big")
+
+
+def mutate(kind, frame, other, rng):
+    if kind == "bitflip":
+        return _flip_bits(frame, rng, 1)
+    if kind == "multiflip":
+        return _flip_bits(frame, rng, rng.randint(2, 8))
+    if kind == "truncate":
+        return frame[:rng.randrange(len(frame))]
+    if kind == "splice":
+        # Two frames glued together, or the head of one followed by the tail of another
+        if rng.random() < 0.5:
+            return frame + other
+        return frame[:rng.randrange(1, len(frame))] + other[rng.randrange(len(other)):]
+    if kind == "oversize":
+        return frame + rng.randbytes(rng.randint(1, 65536))
+    raise ValueError(f"Unknown mutation '{kind}'")
+
+
+def fuzz(count=20000, batch=1000, seed=0):
+    rng = random.Random(seed)
+    results = {}
+    for kind in MUTATIONS:
+        detected = undetected = crashed = 0
+        done = 0
+        while done < count:
+            n = min(batch, count - done)
+            frames = [
+                encode_packet(rng.getrandbits(63), 1, "FIRE " + "B5" * rng.randint(1, 64))
+                for _ in range(n)
+            ]
+            mutated = [mutate(kind, frames[i], frames[i - 1], rng) for i in range(n)]
+            for frame in mutated:
+                try:
+                    decode_packet(frame)
+                    undetected += 1
+                except ValueError:
+                    detected += 1
+                except Exception:
+                    crashed += 1
+            done += n
+        results[kind] = {
+            "trials": count,
+            "detected": detected,
+            "undetected": undetected,
+            "crashed": crashed,
+            "detection_rate": detected / count,
+        }
+    return results
+
+
+def compare(current, baseline):
+    """Return a list of human-readable regressions of current against baseline."""
+    failures = []
+    for size, ops in baseline.get("throughput", {}).items():
+        for op, stats in ops.items():
+            now = current["throughput"].get(size, {}).get(op)
+            if now is None:
+                continue
+            floor = stats["packets_per_sec"] * (1 - THROUGHPUT_TOLERANCE)
+            if now["packets_per_sec"] < floor:
+                failures.append(
+                    f"{op} @ {size}B: {now['packets_per_sec']:.0f} pkt/s < {floor:.0f} pkt/s "
+                    f"(baseline {stats['packets_per_sec']:.0f})"
+                )
+    for kind, stats in baseline.get("fuzz", {}).items():
+        now = current["fuzz"].get(kind)
+        if now is None:
+            continue
+        if now["detection_rate"] < stats["detection_rate"] - DETECTION_TOLERANCE:
+            failures.append(
+                f"{kind}: detection {now['detection_rate']:.2%} < baseline {stats['detection_rate']:.2%}"
+            )
+        if now["crashed"] > stats["crashed"]:
+            failures.append(f"{kind}: {now['crashed']} non-ValueError exceptions (baseline {stats['crashed']})")
+    return failures
+
+
+def print_report(results):
+    print("Throughput")
+    print(f"  {'size':>6} {'op':>8} {'packets/sec':>14} {'MB/sec':>10}")
+    for size, ops in results["throughput"].items():
+        for op, stats in ops.items():
+            print(f"  {size:>6} {op:>8} {stats['packets_per_sec']:>14,.0f} {stats['bytes_per_sec'] / 1e6:>10.2f}")
+    print("\nCorruption fuzzing")
+    print(f"  {'mutation':>10} {'trials':>8} {'detected':>9} {'missed':>7} {'crashed':>8} {'rate':>8}")
+    for kind, stats in results["fuzz"].items():
+        print(f"  {kind:>10} {stats['trials']:>8} {stats['detected']:>9} {stats['undetected']:>7} "
+              f"{stats['crashed']:>8} {stats['detection_rate']:>8.2%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark and fuzz the packet protocol.")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds per throughput measurement")
+    parser.add_argument("--fuzz-count", type=int, default=20000, help="mutated frames per mutation type")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--check", action="store_true", help="exit 1 if this run regresses against the baseline")
+    args = parser.parse_args()
+
+    results = {
+        "throughput": bench_throughput(args.min_time),
+        "fuzz": fuzz(args.fuzz_count, seed=args.seed),
+    }
+    print_report(results)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if args.check:
+        if not os.path.exists(args.baseline):
+            print(f"\n[ERROR] No baseline at {args.baseline}; run with --save-baseline first.")
+            sys.exit(2)
+        with open(args.baseline) as f:
+            failures = compare(results, json.load(f))
+        if failures:
+            print("\n[FAIL] Regressions against baseline:")
+            for failure in failures:
+                print("  - " + failure)
+            sys.exit(1)
+        print("\n[OK] No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
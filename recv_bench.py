@@ -0,0 +1,136 @@
+"""
+recv_bench.py
+
+Allocation benchmark for the receive path under heavy chat load.
+
+A stream of chat packets is cut into random-sized fragments (as TCP may deliver it under
+load) and pushed through a real socketpair to two receivers:
+ - legacy: recv(4096) into new bytes, 'buffer += chunk', then slice/decrypt/decode/split
+ - reader: PacketReader with recv_into() into a preallocated buffer and memoryview decoding
+
+Fragments are sent one at a time and drained before the next one is sent, so each recv
+sees at most one fragment. tracemalloc measures the peak transient bytes allocated by
+each recv + decode step; the sum is reported per packet together with packets/sec.
+
+    python recv_bench.py --packets 20000 --max-fragment 4096
+"""
+
+import argparse
+import random
+import select
+import socket
+import time
+import tracemalloc
+
+from crypto_utils import decrypt
+from protocol import encode_packet, PacketReader, LENGTH, HEADER
+
+
+def legacy_decode(data):
+    # The decode path before PacketReader: slice, decrypt to bytes, decode, split
+    _, seq = HEADER.unpack(data[:HEADER.size])
+    encrypted = data[HEADER.size:]
+    raw = decrypt(encrypted, seq)
+    parts = raw.decode().split(":", 1)
+    return seq, int(parts[0]), parts[1]
+
+
+class LegacyReceiver:
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = b""
+
+    def step(self):
+        self.buffer += self.sock.recv(4096)
+        decoded = 0
+        while len(self.buffer) >= LENGTH.size:
+            (length,) = LENGTH.unpack_from(self.buffer)
+            if len(self.buffer) < LENGTH.size + length:
+                break
+            frame = self.buffer[:LENGTH.size + length]
+            self.buffer = self.buffer[LENGTH.size + length:]
+            legacy_decode(frame)
+            decoded += 1
+        return decoded
+
+
+class ReaderReceiver:
+    def __init__(self, sock):
+        self.reader = PacketReader(sock)
+
+    def step(self):
+        self.reader.fill()
+        decoded = 0
+        while self.reader.next_packet() is not None:
+            decoded += 1
+        return decoded
+
+
+def make_fragments(stream, max_fragment, rng):
+    view = memoryview(stream)
+    fragments = []
+    pos = 0
+    while pos < len(view):
+        n = rng.randint(1, max_fragment)
+        fragments.append(view[pos:pos + n])
+        pos += n
+    return fragments
+
+
+def run(receiver_cls, fragments, packets, measure_memory):
+    sender, receiver_sock = socket.socketpair()
+    receiver = receiver_cls(receiver_sock)
+
+    decoded = 0
+    allocated = 0
+    elapsed = 0.0
+    if measure_memory:
+        tracemalloc.start()
+    try:
+        for fragment in fragments:
+            sender.sendall(fragment)
+            while select.select([receiver_sock], [], [], 0)[0]:
+                if measure_memory:
+                    base = tracemalloc.get_traced_memory()[0]
+                    tracemalloc.reset_peak()
+                    decoded += receiver.step()
+                    allocated += tracemalloc.get_traced_memory()[1] - base
+                else:
+                    start = time.perf_counter()
+                    decoded += receiver.step()
+                    elapsed += time.perf_counter() - start
+    finally:
+        if measure_memory:
+            tracemalloc.stop()
+        sender.close()
+        receiver_sock.close()
+
+    assert decoded == packets, f"{receiver_cls.__name__} decoded {decoded}/{packets} packets"
+    return allocated, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare receive-path allocations per packet.")
+    parser.add_argument("--packets", type=int, default=20000)
+    parser.add_argument("--max-fragment", type=int, default=4096, help="largest fragment delivered per recv")
+    parser.add_argument("--max-words", type=int, default=40, help="longest chat message, in words")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    stream = b"".join(
+        encode_packet(seq, 2, f"[CHAT] user{rng.randint(1, 99)}: " + "gg wp " * rng.randint(1, args.max_words))
+        for seq in range(args.packets)
+    )
+    fragments = make_fragments(stream, args.max_fragment, rng)
+    print(f"{args.packets} chat packets, {len(stream)} bytes in {len(fragments)} fragments "
+          f"of 1..{args.max_fragment} bytes")
+    print(f"  {'receiver':>8} {'bytes alloc/packet':>19} {'packets/sec':>12}")
+    for name, receiver_cls in (("legacy", LegacyReceiver), ("reader", ReaderReceiver)):
+        allocated, _ = run(receiver_cls, fragments, args.packets, measure_memory=True)
+        _, elapsed = run(receiver_cls, fragments, args.packets, measure_memory=False)
+        print(f"  {name:>8} {allocated / args.packets:>19,.0f} {args.packets / elapsed:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,520 +1,1109 @@
 import socket
+import sys
 import threading
 import time
-import select
-from battleship import Board, parse_coordinate
-from protocol import encode_packet, decode_packet
+import queue
+import traceback
+import math
+import itertools
+from collections import deque
+from battleship import Board, parse_coordinate, parse_salvo, row_label, SHIPS, VIEWPORT_SIZE
+from protocol import encode_packet, new_sequence, PacketReader, PING, PONG, OPTIONS, COMPRESSION, HEARTBEAT_INTERVAL, HEARTBEAT_MISSES
+from timers import TimerService
+from matchmaking import Matchmaker
+from stats_store import StatsStore, STATS_DB
+from checkpoint import Checkpointer, CHECKPOINT_FILE, load_checkpoint
+from spectator_feed import SpectatorFeed
+from traffic_trace import TrafficRecorder
+from chat import ChatDispatcher, TokenBucket, CHAT_RATE, CHAT_BURST, BATCH_WINDOW as CHAT_BATCH_WINDOW, MAX_MESSAGE_BYTES
+from transport import listen, is_local_peer
+from session import Session, Role
 
 HOST = '127.0.0.1'
 PORT = 5000
+LISTEN_ADDRESS = None  # e.g. "unix:///tmp/battleship.sock" or "inproc://battleship"; None means tcp://HOST:PORT
 
-clients = []
-boards = []
-spectators = []
-waiting_queue = []
-player_last_active = [time.time(), time.time()]
+clients = {}  # id -> Session, for everyone logged in (players and spectators)
+spectators = set()  # Sessions that receive spectator broadcasts
 TIMEOUT = 30
+RECONNECT_WINDOW = 60
+HANDSHAKE_TIMEOUT = 30  # seconds a new connection gets to pick a username
+IDLE_SPECTATOR_TIMEOUT = 15 * 60  # spectators that send nothing for this long are dropped
+# HEARTBEAT_INTERVAL / HEARTBEAT_MISSES (from protocol.py) can be overridden here; an
+# interval of 0 turns heartbeats off
+# CHAT_RATE / CHAT_BURST / CHAT_BATCH_WINDOW (from chat.py) can be overridden here; a rate
+# of 0 turns chat limits off, a window of 0 sends each message from the sender's thread
 lock = threading.Lock()
-turn = 0  # Index of whose turn it is
-replay_ready = [False, False]
-num_players = 100
-disconnected = [False, False]
-disconnected_at = [0, 0]
+timers = TimerService()  # every deadline on the server is registered here
+MAX_MATCHES = 1  # rooms that can run at the same time
+matches = []
+match_ids = itertools.count(1)  # numbers the 'match:<id>' key of each new match (checkpoint section, feed)
+matchmaker = Matchmaker()  # waiting players, ordered by wait time and rating
+PAIRING_RETRY_INTERVAL = 1  # seconds between pairing attempts while players wait (rating windows widen)
+stats = None  # StatsStore, opened in main()
+checkpoints = None  # Checkpointer, opened in main()
+restored_waiting = {}  # id -> enqueue time, for queued players not back yet after a restart
+SPECTATOR_FEED_PORT = None  # e.g. 5001 to also stream matches over UDP (watch with spectator_feed.py)
+feed = None  # SpectatorFeed, opened in main() when SPECTATOR_FEED_PORT is set
+TRACE_FILE = None  # e.g. "traffic.trace.gz" to record inbound sessions for trace_replay.py
+recorder = None  # TrafficRecorder, opened in main() when TRACE_FILE is set
+chat_dispatcher = None  # ChatDispatcher, started in main() unless CHAT_BATCH_WINDOW is 0
+MAX_CHAT_BACKLOG = 8  # chat batches kept for a recipient that cannot take them yet; older ones are dropped
+chat_backlogged = set()  # Sessions with chat waiting in their backlog (chat thread only)
+
+# Admission control: connections beyond these limits get a "[BUSY] ... retry after N seconds" reply
+LISTEN_BACKLOG = 64  # pending connections the OS queues before accept()
+MAX_SESSIONS = 500  # logged-in clients (players + spectators); reconnecting players are always let in
+MAX_HANDSHAKES = 32  # connections still choosing a username
+RESERVED_HANDSHAKES = 8  # extra slots for connections over the limits, in case they are players returning to a match
+MAX_CONNECTIONS_PER_IP = 10  # new connections allowed from one address...
+RATE_WINDOW = 10  # ...within this many seconds
+BUSY_RETRY_AFTER = 5  # seconds suggested to rejected clients
+handshakes = 0
+reserved_handshakes = 0
+connection_times = {}  # ip -> deque of recent connection times
+
+BOARD_SIZE = 10  # e.g. 500 for large-map variants
+FLEET = SHIPS * 1  # repeat the fleet for bigger maps
+SALVO_SHOTS = 1  # shots per turn; above 1 plays the salvo variant (e.g. "B5 C6 D7" in one packet)
+SESSION_READ_BUFFER = 512  # initial receive buffer per session; grows for larger frames
+COMPRESS_PAYLOADS = True  # deflate large payloads (boards) for clients that ask for it at login
+# Flag for sends that must not block (send_nowait). Platforms without MSG_DONTWAIT (Windows)
+# have no per-call non-blocking send; there send_nowait() never sends, so main() refuses to
+# start unless heartbeats and the chat thread, which rely on it, are turned off.
+NONBLOCKING_SEND = getattr(socket, 'MSG_DONTWAIT', 0)
+outbound_seq = new_sequence()  # seq (and cipher nonce) of every packet the server sends, on any connection
+
+def turn_prompt():
+    if SALVO_SHOTS > 1:
+        return f"Enter coordinates to fire at, up to {SALVO_SHOTS} (e.g. B5 C6 D7):"
+    return "Enter coordinate to fire at (e.g. B5):"
+
+def new_board():
+    board = Board(BOARD_SIZE)
+    board.place_ships_randomly(FLEET)
+    return board
+
+def set_viewport(client, payload, board_size=BOARD_SIZE):
+    # input: VIEW <coordinate>, the top-left corner of the region to receive
+    try:
+        top, left = parse_coordinate(payload[5:], board_size)
+    except ValueError as e:
+        send(client, f"Invalid viewport: {e}")
+        return False
+    client.viewport = (top, left)
+    return True
 
 def broadcast_to_spectators(message):
+    packets = {}  # compressed or not -> packet, encoded once for everyone who takes it
     to_remove = []
-    for s in spectators:
+    for s in list(spectators):
+        if s.compress not in packets:
+            packets[s.compress] = encode_packet(next(outbound_seq), 1, message, s.compress)
         try:
-            packet = encode_packet(0, 1, message)
-            s.sendall(packet)
+            send_packet(s, packets[s.compress])
         except:
             to_remove.append(s)
     for s in to_remove:
-        spectators.remove(s)
-            
-def broadcast_chat(sender_client, message):
-    for client in clients:
-        if client is not sender_client:
-            try:
-                send(client, message, packet_type=2)
-            except:
+        remove_spectator(s)
+
+def broadcast_board_to_spectators(board):
+    # Spectators sharing a viewport (and compression setting) share one packet
+    rendered = {}
+    to_remove = []
+    for s in list(spectators):
+        key = (s.viewport, s.compress)
+        if key not in rendered:
+            rendered[key] = encode_packet(next(outbound_seq), 1, render_board(board, *s.viewport), s.compress)
+        try:
+            send_packet(s, rendered[key])
+        except:
+            to_remove.append(s)
+    for s in to_remove:
+        remove_spectator(s)
+
+def remove_spectator(client):
+    with lock:
+        spectators.discard(client)
+
+def post_chat(client, payload):
+    # The sender spends a token and gets its ack; everyone else gets the message in the
+    # next batch from the chat thread
+    if len(payload.encode("utf-8")) > MAX_MESSAGE_BYTES:
+        send(client, f"[INFO] Chat messages are limited to {MAX_MESSAGE_BYTES} bytes. Message not sent.")
+        return
+    if client.chat_bucket is None:
+        client.chat_bucket = TokenBucket(CHAT_RATE, CHAT_BURST)
+    if CHAT_RATE and not client.chat_bucket.take():
+        send(client, "[INFO] You are chatting too fast. Message not sent.")
+        return
+    message = f"[CHAT] {client.id}: {payload}"
+    if chat_dispatcher is not None:
+        chat_dispatcher.post(client, message)
+    else:
+        deliver_chat([(client, message)])
+    send(client, f"[CHAT SENT] {payload}")
+
+def deliver_chat(batch):
+    # One packet per recipient for the whole batch of (sender, message), leaving out the
+    # recipient's own messages. Everyone who sent nothing in the batch shares a packet.
+    # On the chat thread nothing may block on one peer, so packets go through each
+    # recipient's chat backlog (queue_chat); without a chat thread this runs on the
+    # sender's thread, which sends directly as it always has.
+    senders = {sender for sender, _ in batch}
+    shared = {}  # compressed or not -> packet with every message
+    for client in list(clients.values()):
+        if client.conn is None:
+            continue  # restored from a checkpoint, not reconnected yet
+        if client in senders:
+            text = "\n".join(message for sender, message in batch if sender is not client)
+            if not text:
                 continue
+            packet = encode_packet(next(outbound_seq), 2, text, client.compress)
+        else:
+            if client.compress not in shared:
+                text = "\n".join(message for _, message in batch)
+                shared[client.compress] = encode_packet(next(outbound_seq), 2, text, client.compress)
+            packet = shared[client.compress]
+        if chat_dispatcher is None:
+            try:
+                send_packet(client, packet)
+            except OSError:
+                continue  # the reader thread notices the broken connection
+        else:
+            queue_chat(client, packet)
+
+def queue_chat(client, packet):
+    # Chat thread only. A recipient whose socket is full (or busy with another thread's
+    # send) keeps up to MAX_CHAT_BACKLOG batches, retried by flush_chat_backlog(); beyond
+    # that its oldest batch is dropped. Chat never closes a connection, so a player on a
+    # slow link loses chat lines, not their match.
+    if client.outbox is None:
+        client.outbox = deque()
+    elif len(client.outbox) >= MAX_CHAT_BACKLOG:
+        client.outbox.popleft()
+        print(f"[INFO] {client.id} is behind on chat; dropped its oldest batch")
+    client.outbox.append(packet)
+    if flush_chat(client):
+        chat_backlogged.add(client)
+
+def flush_chat(client):
+    # Send what the socket takes now; True if anything is still waiting
+    outbox = client.outbox
+    while outbox:
+        if not send_nowait(client, outbox[0]):
+            return True
+        outbox.popleft()
+    client.outbox = None
+    return not finish_frame_nowait(client)
+
+def flush_chat_backlog():
+    # ChatDispatcher flush callback, on the chat thread
+    for client in list(chat_backlogged):
+        if clients.get(client.id) is not client or not flush_chat(client):
+            chat_backlogged.discard(client)  # caught up, or gone
+    return bool(chat_backlogged)
 
 def broadcast_to_all(message):
-    for client in clients:
+    for client in list(clients.values()):
         try:
             send(client, message)
         except:
             continue  # Ignore any broken connections
 
+def send_packet(client, packet):
+    # Match, chat, broadcast and timer threads all write to the same sockets; the session's
+    # send lock keeps one frame from landing in the middle of another
+    with client.send_lock:
+        conn = client.conn
+        if client.unsent is not None:
+            owner, rest = client.unsent
+            client.unsent = None
+            if owner is conn:
+                conn.sendall(rest)  # finish the frame send_nowait() started
+        conn.sendall(packet)
+
+def send_nowait(client, packet, wait=0):
+    # For threads that must never block on one peer. Frames are never cut short: if the
+    # socket takes only part of the packet, the rest is kept on the session and sent ahead
+    # of anything else. Returns False, having sent nothing, if the socket is full or still
+    # finishing an earlier frame, or another thread is still sending to it after 'wait'
+    # seconds.
+    conn = client.conn
+    if conn is None or not NONBLOCKING_SEND or not client.send_lock.acquire(timeout=wait):
+        return False
+    try:
+        if not _finish_frame(client, conn):
+            return False
+        try:
+            sent = conn.send(packet, NONBLOCKING_SEND)
+        except OSError:
+            return False  # full (BlockingIOError), or closed: the reader thread sees that
+        if sent < len(packet):
+            client.unsent = (conn, memoryview(packet)[sent:])
+        return True
+    finally:
+        client.send_lock.release()
+
+def finish_frame_nowait(client):
+    # True once no partly sent frame is waiting (never blocks)
+    conn = client.conn
+    if client.unsent is None or conn is None:
+        return True
+    if not client.send_lock.acquire(timeout=0):
+        return False
+    try:
+        return _finish_frame(client, conn)
+    finally:
+        client.send_lock.release()
+
+def _finish_frame(client, conn):
+    # Caller holds client.send_lock. Sends what fits of a partly sent frame; True if none is left.
+    if client.unsent is None:
+        return True
+    owner, rest = client.unsent
+    if owner is not conn:
+        client.unsent = None  # left over from a socket the client has since replaced
+        return True
+    try:
+        sent = conn.send(rest, NONBLOCKING_SEND)
+    except OSError:
+        return False
+    client.unsent = (conn, rest[sent:]) if sent < len(rest) else None
+    return client.unsent is None
+
 def send(client, msg, packet_type=1):
+    if client.conn is None:
+        return  # restored from a checkpoint, not reconnected yet
     try:
-        packet = encode_packet(0, packet_type, msg)
-        client['conn'].sendall(packet)
-        print(f"[DEBUG] Sent to {client['id']}: {msg}")
+        packet = encode_packet(next(outbound_seq), packet_type, msg, client.compress)
+        send_packet(client, packet)
+        print(f"[DEBUG] Sent to {client.id}: {msg}")
     except Exception as e:
-        print(f"[ERROR] Failed to send to {client['id']}: {e}")
+        print(f"[ERROR] Failed to send to {client.id}: {e}")
+
+def render_board(board, top=0, left=0):
+    # Only the VIEWPORT_SIZE x VIEWPORT_SIZE region starting at (top, left) is rendered
+    return "GRID\n" + board.render(top, left, VIEWPORT_SIZE, VIEWPORT_SIZE) + "\n\n"
 
 def send_board(client, board, broadcast=True):
-    board_str = "GRID\n"
-    board_str += "  " + " ".join(str(i + 1).rjust(2) for i in range(board.size)) + '\n'
-    for r in range(board.size):
-        row_label = chr(ord('A') + r)
-        row_str = " ".join(board.display_grid[r][c] for c in range(board.size))
-        board_str += f"{row_label:2} {row_str}\n"
-    board_str += '\n'
+    board_str = render_board(board, *client.viewport)
 
     send(client, board_str)
     if broadcast:
-        broadcast_to_spectators(board_str)
+        broadcast_board_to_spectators(board)
 
     return board_str
 
-def get_opponent_index(my_index):
-    for i, c in enumerate(clients):
-        if i != my_index and c.get('role') == 'player':
-            return i
-    return None
-
-def start_game(index, client):
-    global turn
-    print(f"[DEBUG] Entered start_game(): index={index}, turn={turn}, id={clients[index]['id']}")
-    print(f"[DEBUG] Player {index + 1} entering game loop...")
-    
-    opponent_index = 1 - index
-    if opponent_index < 0 or opponent_index >= len(clients):
-        send(client, "[ERROR] Opponent not found.")
-        return False
+class Match:
+    """
+    One game between two players. Everything that can affect the game -- packets from
+    either player, disconnects, reconnects and timer expiries -- is put on self.events
+    and handled in order by the match thread, so nothing has to poll.
+    """
+
+    def __init__(self, players, boards=None, key=None):
+        self.players = players  # [player 1, player 2]
+        self.boards = boards or [new_board(), new_board()]  # boards[i] holds player i's ships
+        # Checkpoint section and feed key; usernames may contain any character, so they are
+        # not part of it
+        self.key = key or f"match:{next(match_ids)}"
+        self.turn = 0  # Index of whose turn it is
+        self.events = queue.Queue()
+        self.over = False
+        # Each armed timer gets a serial; an expiry event that arrives after its timer
+        # was replaced (it fired just before being cancelled) carries a stale serial.
+        self.serial = 0
+        self.turn_timer = None
+        self.turn_serial = None
+        self.reconnect_timers = [None, None]
+        self.reconnect_serials = [None, None]
+        self.shots = [0, 0]
+        self.hits = [0, 0]
+
+    def next_serial(self):
+        self.serial += 1
+        return self.serial
+
+def save_match(match):
+    # Snapshot on the match thread (plain copies only); building the JSON-friendly state,
+    # encoding and disk I/O happen on the checkpoint writer
+    if checkpoints is not None:
+        players = [client.id for client in match.players]
+        boards = [(board, dict(board.shots)) for board in match.boards]  # ship cells are fixed once play starts
+        turn, shots, hits, serial = match.turn, list(match.shots), list(match.hits), match.serial
+        checkpoints.put(match.key, lambda: {
+            'players': players,
+            'boards': [board.to_state(board_shots) for board, board_shots in boards],
+            'turn': turn,
+            'shots': shots,
+            'hits': hits,
+            'serial': serial,
+        })
+
+def queue_state():
+    with lock:
+        now = time.monotonic()
+        return matchmaker.snapshot(now) + [(player_id, now - at) for player_id, at in restored_waiting.items()]
+
+def queue_changed():
+    if checkpoints is not None:
+        checkpoints.mark('queue')
+
+def cancel_timer(timer):
+    if timer is not None:
+        timer.cancel()
+
+def remove_client(client):
+    # Forget a departed client; everything else about it lives on the session
+    with lock:
+        if clients.get(client.id) is client:
+            del clients[client.id]
+
+def touch_spectator(client):
+    # (Re)start the idle deadline of a spectator
+    cancel_timer(client.idle_timer)
+    client.idle_timer = timers.schedule(IDLE_SPECTATOR_TIMEOUT, reap_idle_spectator, client)
+
+def reap_idle_spectator(client):
+    # Runs on the timer thread: shutting the socket down wakes the reader thread,
+    # which then drops the spectator.
+    if client.match is not None:
+        return
+    print(f"[INFO] Dropping idle spectator {client.id}")
+    # Best effort: the notice is skipped rather than block the timer thread on a full socket
+    send_nowait(client, encode_packet(next(outbound_seq), 1, "[SERVER] Disconnected for inactivity.", client.compress))
+    shutdown_quietly(client.conn)
 
-    # Ensure board mapping is correct regardless of client index
-    board = boards[1] if index == 0 else boards[0]
+def trace(trace_id, kind, *fields):
+    # Record an inbound event for replay; only buffered here, the recorder thread writes it
+    if recorder is not None and trace_id is not None:
+        recorder.record(trace_id, kind, *fields)
 
-    while True:
-        # print(f"[DEBUG] Checking turn: current={turn}, my_index={index}")
-        if turn != index:
-            time.sleep(0.05)  # Let other threads breathe
+def shutdown_quietly(conn):
+    try:
+        conn.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+def heartbeat():
+    # Ping every connection and cut off those not heard from for HEARTBEAT_MISSES intervals.
+    # Shutting the socket down ends its reader thread, which starts the reconnect window for
+    # a player or drops a spectator, exactly like a closed connection.
+    now = time.monotonic()
+    ping = encode_packet(next(outbound_seq), PING, f"{HEARTBEAT_INTERVAL:g}")
+    for client in list(clients.values()):
+        conn = client.conn
+        if conn is None:
+            continue
+        if now - client.last_heard > HEARTBEAT_INTERVAL * HEARTBEAT_MISSES:
+            print(f"[INFO] {client.id} missed {HEARTBEAT_MISSES} heartbeats, closing the connection")
+            shutdown_quietly(conn)
+            continue
+        # Never block the timer thread on a peer that has stopped reading; a skipped ping
+        # counts as silence only if the peer never answers the next ones either
+        send_nowait(client, ping)
+    timers.schedule(HEARTBEAT_INTERVAL, heartbeat)
+
+def drop_spectator(client):
+    cancel_timer(client.idle_timer)
+    client.idle_timer = None
+    with lock:
+        matchmaker.remove(client.id)
+    queue_changed()
+    remove_spectator(client)
+    try:
+        client.conn.close()
+    except OSError:
+        pass
+    remove_client(client)
+
+def begin_turn(match):
+    client = match.players[match.turn]
+    cancel_timer(match.turn_timer)
+    match.turn_timer = None
+    if client.disconnected:
+        return  # the reconnect deadline decides what happens next
+
+    print(f"[DEBUG] It's {client.id}'s turn")
+    send(client, f"Your turn. {turn_prompt()}")
+    arm_turn_timer(match)
+
+def arm_turn_timer(match):
+    cancel_timer(match.turn_timer)
+    match.turn_serial = match.next_serial()
+    match.turn_timer = timers.schedule(TIMEOUT, match.events.put, ('timeout', match.turn, match.turn_serial))
+
+def end_match(match, winner=None):
+    match.over = True
+    cancel_timer(match.turn_timer)
+    for timer in match.reconnect_timers:
+        cancel_timer(timer)
+    if checkpoints is not None:
+        checkpoints.remove(match.key)
+    if feed is not None:
+        feed.end_match(match.key, f"[Spectator] {match.players[winner].id} wins!" if winner is not None else "[Spectator] Match over.")
+
+    player_ids = [client.id for client in match.players]
+    if winner is not None:
+        with lock:
+            changes = matchmaker.record_result(player_ids[winner], player_ids[1 - winner])
+        for client, change in zip((match.players[winner], match.players[1 - winner]), changes):
+            send(client, f"[INFO] Rating: {matchmaker.rating(client.id)} ({change:+d})")
+    if stats is not None:
+        # Buffered; the stats writer thread does the disk I/O
+        stats.record_match(player_ids, player_ids[winner] if winner is not None else None,
+                           match.shots, match.hits, [matchmaker.rating(p) for p in player_ids])
+
+    # Demote BOTH players; those still connected become spectators and rejoin the back of the queue
+    for client in match.players:
+        with lock:
+            client.role = Role.WAITING
+            client.match = None
+            client.match_index = None
+            if client.reconnecting:
+                # Back on a new connection, but the match ended before 'reconnected' was handled
+                client.disconnected = False
+                client.reconnecting = False
+            gone = client.disconnected
+        if gone:
+            remove_client(client)
             continue
+        send(client, "Game over! Thanks for playing.")
+        touch_spectator(client)
+        with lock:
+            spectators.add(client)
+            matchmaker.enqueue(client.id)
+    queue_changed()
+
+def run_match(match, restored=False):
+    print(f"[DEBUG] Match thread started: {match.players[0].id} vs {match.players[1].id}")
+    if restored:
+        # Nobody is connected after a restart, so both players get a reconnect window
+        for index in range(2):
+            arm_reconnect_timer(match, index)
+    else:
+        announce_match(match)
+    save_match(match)
+    if feed is not None:
+        feed.start_match(match.key, [client.id for client in match.players], match.boards, match.turn)
 
-        print(f"[DEBUG] It's my turn: index={index}")
-        send(client, "Your turn. Enter coordinate to fire at (e.g. B5):")
+    try:
+        if not restored:
+            begin_turn(match)
+        while not match.over:
+            event = match.events.get()
+            before = (match.turn, *match.shots)
+            handle_match_event(match, event)
+            if not match.over and (match.turn, *match.shots) != before:
+                save_match(match)  # only shots change the boards and turn; VIEW, LEADERBOARD etc. do not
+    except Exception as e:
+        print(f"[ERROR] Match crashed: {e}")
+        traceback.print_exc()
+        if not match.over:
+            end_match(match)
+
+    with lock:
+        matches.remove(match)
+    promote_next_players()
+
+def announce_match(match):
+    players = match.players
+    # Notify everyone
+    broadcast_to_all("🔁 New match starting!")
+    broadcast_to_all(f"[INFO] Next match: {players[0].id} vs {players[1].id}")
+    time.sleep(1)
+    send(players[0], "Welcome Player 1! Game will start now.")
+    send(players[1], "Welcome Player 2! Game will start now.")
+    time.sleep(0.2)
+    instructions = (
+        "Game started!\n"
+        f"- Type 'quit' for temporary disconnection (you can reconnect within {RECONNECT_WINDOW}s).\n"
+        "- Type 'quit!' for immediate forfeit and transition to next match."
+    )
+    if SALVO_SHOTS > 1:
+        instructions += f"\n- Salvo mode: fire up to {SALVO_SHOTS} shots per turn, separated by spaces."
+
+    send(players[0], instructions)
+    send(players[1], instructions)
+
+def handle_match_event(match, event):
+    kind, index = event[0], event[1]
+    client = match.players[index]
+    opponent = match.players[1 - index]
+
+    if kind == 'packet':
+        handle_player_packet(match, index, event[2], event[3])
+
+    elif kind == 'timeout':
+        if event[2] != match.turn_serial:
+            return  # the turn ended just as the timer fired
+        send(client, "[TIMEOUT] You took too long. You forfeit.")
+        send(opponent, "[INFO] Opponent timed out. You win!")
+        end_match(match, winner=1 - index)
+
+    elif kind == 'disconnected':
+        player_disconnected(match, index)
+
+    elif kind == 'reconnected':
+        with lock:
+            if not client.disconnected:
+                client.reconnecting = False
+                return
+            client.disconnected = False
+            client.reconnecting = False
+        cancel_timer(match.reconnect_timers[index])
+        match.reconnect_serials[index] = None
+        send(client, "[INFO] Reconnected successfully.")
+        send_board(client, match.boards[1 - index], broadcast=False)
+        if index == match.turn:
+            send(client, f"Welcome back. {turn_prompt()}")
+            arm_turn_timer(match)
+
+    elif kind == 'reconnect_expired':
+        if event[2] != match.reconnect_serials[index]:
+            return  # the player made it back in time
+        if opponent.disconnected:
+            end_match(match)  # neither player came back
+            return
+        send(opponent, "[INFO] Opponent failed to reconnect. You win!")
+        end_match(match, winner=1 - index)
+
+def player_disconnected(match, index):
+    client = match.players[index]
+    if client.disconnected:
+        return
+    client.disconnected = True
+    if index == match.turn:
+        cancel_timer(match.turn_timer)
+        match.turn_serial = None
+
+    send(match.players[1 - index], f"[INFO] Opponent disconnected. Waiting {RECONNECT_WINDOW} seconds for reconnection...")
+    arm_reconnect_timer(match, index)
+
+def arm_reconnect_timer(match, index):
+    serial = match.next_serial()
+    match.reconnect_serials[index] = serial
+    match.reconnect_timers[index] = timers.schedule(RECONNECT_WINDOW, match.events.put, ('reconnect_expired', index, serial))
+
+def handle_player_packet(match, index, packet_type, payload):
+    client = match.players[index]
+    opponent = match.players[1 - index]
+    if client.disconnected:
+        return  # e.g. typed 'quit' but the socket has not closed yet
+
+    # input: CHAT <your message>
+    if packet_type == 2:
+        if index != match.turn:
+            send(client, "[INFO] Only the player whose turn it is can chat.")
+            return
+        post_chat(client, payload)
+        return
 
-        # Timeout logic
-        start_time = time.time()
-        sock = client['conn']
-        sock.setblocking(0)
+    elif packet_type != 1:
+        send(client, "[ERROR] Unknown packet type.")
+        return
 
-        buffer = b''
+    if payload.strip().upper() == "LEADERBOARD":
+        send(client, format_leaderboard())
+        return
 
-        while True:
-            elapsed = time.time() - start_time
-            if elapsed > TIMEOUT:
-                send(client, "[TIMEOUT] You took too long. You forfeit.")
-                send(clients[opponent_index], "[INFO] Opponent timed out. You win!")
-
-                # Demote BOTH players and re-add to spectators
-                clients[index]['role'] = 'waiting'
-                clients[index]['has_played'] = True
-                spectators.append(clients[index]['conn'])  # Add to spectators
-
-                clients[opponent_index]['role'] = 'waiting'
-                clients[opponent_index]['has_played'] = True
-                spectators.append(clients[opponent_index]['conn'])  # Add to spectators
-
-                promote_next_players()
-                return False
-
-            ready, _, _ = select.select([sock], [], [], 0.5)
-            if ready:
-                try:
-                    chunk = sock.recv(1024)
-                    if not chunk:
-                        raise ConnectionResetError
-                    buffer += chunk
-                    print(f"[DEBUG] Received raw chunk from {client['id']}: {chunk}")
-
-                    try:
-                        seq, packet_type, payload = decode_packet(buffer)
-                        print(f"[DEBUG] Decoded packet from {client['id']}: seq={seq}, type={packet_type}, payload='{payload}'")
-                        buffer = b''
-
-                        # Replay protection check — must happen before anything else
-                        last_seq = client.get('last_seq', -1)
-                        print(f"[DEBUG] Last accepted seq for {client['id']}: {last_seq}")
-                        if seq <= last_seq:
-                            print(f"[SECURITY] Replayed or out-of-order packet from {client['id']} (seq={seq} <= {last_seq})")
-                            send(client, "[SECURITY] Replayed or out-of-order packet ignored.")
-                            continue
-
-                        # Accept and store latest seq
-                        client['last_seq'] = seq
-                        print(f"[DEBUG] Updated last_seq for {client['id']} to {seq}")
-                        # input: CHAT <your message>
-                        if packet_type == 2:
-                            chat_message = f"[CHAT] {client['id']}: {payload}"
-                            broadcast_chat(client, chat_message)
-                            send(client, f"[CHAT SENT] {payload}")
-                            continue
-
-                        elif packet_type != 1:
-                            send(client, "[ERROR] Unknown packet type.")
-                            continue
-
-                        guess = payload.strip()
-                        player_last_active[index] = time.time()
-                        break
+    if index != match.turn:
+        send(client, "[INFO] Please wait for your turn.")
+        return
 
-                    except ValueError:
-                        send(client, "[ERROR] Packet corrupted. Ignoring...")
-                        buffer = b''
-                        continue  # jump to the next loop iteration
-
-                except Exception:
-                    disconnected[index] = True
-                    disconnected_at[index] = time.time()
-                    send(clients[opponent_index], "[INFO] Opponent disconnected. Waiting 60 seconds for reconnection...")
-
-                    reconnect_deadline = time.time() + 60
-                    while time.time() < reconnect_deadline:
-                        if not disconnected[index]:
-                            # Player reconnected
-                            client = clients[index]
-                            sock = client['conn']
-                            sock.setblocking(0)
-                            send(client, "[INFO] Reconnected successfully.")
-                            send_board(client, board, broadcast=False)
-                            send(client, "Welcome back. Enter coordinate to fire at (e.g. B5):")
-                            break
-                        time.sleep(1)
-                    else:
-                        # Timeout expired, end game safely
-                        if board.all_ships_sunk():  # opponent might have already won
-                            return True
-
-                        send(clients[opponent_index], "[INFO] Opponent failed to reconnect. You win!")
-                        clients[index]['role'] = 'waiting'
-                        clients[index]['has_played'] = True
-                        spectators.append(clients[index]['conn'])
-
-                        clients[opponent_index]['role'] = 'waiting'
-                        clients[opponent_index]['has_played'] = True
-                        spectators.append(clients[opponent_index]['conn'])
-
-                        promote_next_players()
-                        return False
-
-            time.sleep(0.1)
-
-        if guess.lower() == 'quit!':
-            send(client, "You have quit the game immediately.")
-            send(clients[opponent_index], "[INFO] Opponent quit the game. You win!")
-
-            # Demote both players
-            clients[index]['role'] = 'waiting'
-            clients[index]['has_played'] = True
-            spectators.append(clients[index]['conn'])
-
-            clients[opponent_index]['role'] = 'waiting'
-            clients[opponent_index]['has_played'] = True
-            spectators.append(clients[opponent_index]['conn'])
-
-            promote_next_players()
-            return False
+    guess = payload.strip()
+    board = match.boards[1 - index]
 
-        elif guess.lower() == 'quit':
-            send(client, "You quit the game. Waiting 60 seconds in case you reconnect.")
-            disconnected[index] = True
-            disconnected_at[index] = time.time()
-            send(clients[opponent_index], "[INFO] Opponent disconnected. Waiting 60 seconds for reconnection...")
-
-            reconnect_deadline = time.time() + 60
-            while time.time() < reconnect_deadline:
-                if not disconnected[index]:
-                    client = clients[index]
-                    sock = client['conn']
-                    sock.setblocking(0)
-                    send(client, "[INFO] Reconnected successfully.")
-                    send_board(client, board, broadcast=False)
-                    send(client, "Welcome back. Enter coordinate to fire at (e.g. B5):")
-                    break
-                time.sleep(1)
-            else:
-                if board.all_ships_sunk():
-                    return True
+    if guess.lower() == 'quit!':
+        send(client, "You have quit the game immediately.")
+        send(opponent, "[INFO] Opponent quit the game. You win!")
+        end_match(match, winner=1 - index)
+        return
+
+    elif guess.lower() == 'quit':
+        send(client, f"You quit the game. Waiting {RECONNECT_WINDOW} seconds in case you reconnect.")
+        player_disconnected(match, index)
+        shutdown_quietly(client.conn)  # ends the reader thread; a reconnect brings a new socket
+        return
+
+    # input: VIEW <coordinate> moves the region of the board this player receives
+    if guess.upper().startswith("VIEW "):
+        if set_viewport(client, guess, board.size):
+            send_board(client, board, broadcast=False)
+        begin_turn(match)
+        return
 
-                send(clients[opponent_index], "[INFO] Opponent failed to reconnect. You win!")
+    if SALVO_SHOTS > 1:
+        handle_salvo(match, index, guess)
+        return
 
-                clients[index]['role'] = 'waiting'
-                clients[index]['has_played'] = True
-                spectators.append(clients[index]['conn'])
+    try:
+        row, col = parse_coordinate(guess, board.size)
+    except ValueError as e:
+        send(client, f"Invalid coordinate: {e}")
+        begin_turn(match)
+        return
 
-                clients[opponent_index]['role'] = 'waiting'
-                clients[opponent_index]['has_played'] = True
-                spectators.append(clients[opponent_index]['conn'])
+    result, sunk_name = board.fire_at(row, col)
+    if result != 'already_shot':
+        match.shots[index] += 1
+        match.hits[index] += result == 'hit'
+    send_board(client, board)  # attacker sees the updated board, spectators get one copy
+
+    if result == 'hit':
+        msg = "HIT!"
+        if sunk_name:
+            msg += f" You sank the {sunk_name}!"
+        send(client, msg)
+        send(opponent, f"Your ship was hit at {guess}!")
+        event = f"[Spectator] {guess}: HIT!{' Sank ' + sunk_name if sunk_name else ''}"
+        broadcast_to_spectators(event)
+        feed_shots(match, index, [(row, col)], event)
+
+        if board.all_ships_sunk():
+            send(client, "You win!")
+            send(opponent, "You lose!")
+            broadcast_to_spectators(f"[Spectator] Player {index + 1} wins!")
+            end_match(match, winner=index)
+            return
+
+    elif result == 'miss':
+        send(client, "MISS!")
+        send(opponent, f"Opponent fired at {guess} and missed.")
+        broadcast_to_spectators(f"[Spectator] {guess}: MISS!")
+        feed_shots(match, index, [(row, col)], f"[Spectator] {guess}: MISS!")
+
+    elif result == 'already_shot':
+        send(client, "Already fired there. Try again.")
+        begin_turn(match)
+        return
 
-                promote_next_players()
-                return False
+    match.turn = 1 - index  # Switch turn
+    begin_turn(match)
 
-            continue
+def feed_shots(match, index, cells, event):
+    # UDP watchers get only the cells that changed on the board player 'index' fired at
+    if feed is not None:
+        board = match.boards[1 - index]
+        feed.update(match.key, 1 - index, [(r, c, board.shots[(r, c)]) for r, c in cells], 1 - index, event)
+
+def handle_salvo(match, index, guess):
+    # input: several coordinates, resolved together with one board update and one result line
+    client = match.players[index]
+    opponent = match.players[1 - index]
+    board = match.boards[1 - index]
+    try:
+        targets = parse_salvo(guess, board.size, SALVO_SHOTS)
+    except ValueError as e:
+        send(client, f"Invalid salvo: {e}")
+        begin_turn(match)
+        return
+
+    repeated = [f"{row_label(r)}{c + 1}" for r, c in targets if (r, c) in board.shots]
+    if repeated:
+        send(client, f"Already fired at {', '.join(repeated)}. Try again.")
+        begin_turn(match)
+        return
+
+    results = board.fire_salvo(targets)
+    match.shots[index] += len(results)
+    match.hits[index] += sum(result == 'hit' for _, _, result, _ in results)
+    send_board(client, board)  # one board update for the whole salvo
+
+    summary = ", ".join(
+        f"{row_label(r)}{c + 1} {result.upper()}{' (sank ' + sunk_name + ')' if sunk_name else ''}"
+        for r, c, result, sunk_name in results
+    )
+    send(client, f"SALVO: {summary}")
+    send(opponent, f"Opponent's salvo: {summary}")
+    broadcast_to_spectators(f"[Spectator] Player {index + 1} salvo: {summary}")
+    feed_shots(match, index, [(r, c) for r, c, _, _ in results], f"[Spectator] Player {index + 1} salvo: {summary}")
+
+    if board.all_ships_sunk():
+        send(client, "You win!")
+        send(opponent, "You lose!")
+        broadcast_to_spectators(f"[Spectator] Player {index + 1} wins!")
+        end_match(match, winner=index)
+        return
+
+    match.turn = 1 - index  # Switch turn
+    begin_turn(match)
 
+def format_leaderboard():
+    rows = stats.leaderboard() if stats is not None else []
+    if not rows:
+        return "[LEADERBOARD] No matches recorded yet."
+    lines = ["[LEADERBOARD]", f"{'#':>2} {'player':<16} {'rating':>6} {'W':>4} {'L':>4} {'acc':>5}"]
+    for rank, row in enumerate(rows, 1):
+        accuracy = row['hits'] / row['shots'] if row['shots'] else 0
+        lines.append(f"{rank:>2} {row['id']:<16} {row['rating']:>6} {row['wins']:>4} {row['losses']:>4} {accuracy:>5.0%}")
+    return "\n".join(lines)
+
+def promote_next_players():
+    # Fill every free room with the best pairs the matchmaker can make right now
+    with lock:
+        free_rooms = MAX_MATCHES - len(matches)
+        if free_rooms <= 0:
+            print("[DEBUG] Skipping promotion: all rooms are in use.")
+            return []
+
+        started = []
+        for first, second in matchmaker.pop_pairs(free_rooms):
+            players = [clients[first], clients[second]]
+            start_match(players)
+            started.extend(players)
+    if started:
+        queue_changed()
+    return started
+
+def retry_pairing():
+    # Players too far apart in rating to pair at login become acceptable partners as their
+    # windows widen, without waiting for another login or match end. start_match() only
+    # hands the match to a new thread, so this is cheap enough for the timer thread.
+    with lock:
+        ready = len(matchmaker) >= 2 and len(matches) < MAX_MATCHES
+    if ready:
+        promote_next_players()
+    timers.schedule(PAIRING_RETRY_INTERVAL, retry_pairing)
+
+def start_match(players):
+    # Caller holds the lock
+    match = Match(players)
+    matches.append(match)
+
+    for i, player in enumerate(players):
+        player.match = match
+        player.match_index = i
+        player.role = Role.PLAYER
+        player.last_seq = -1  # Reset sequence tracking
+        cancel_timer(player.idle_timer)
+        player.idle_timer = None
+        # Remove from spectator list if promoted
+        spectators.discard(player)
+
+    print(f"[DEBUG] Launching match thread for: {players[0].id} (index 0), {players[1].id} (index 1)")
+    threading.Thread(target=run_match, args=(match,), daemon=True).start()
+
+def restore_checkpoint(sections):
+    # Rebuild matches and the waiting queue saved by a previous run. Every restored player
+    # starts out disconnected and resumes by logging in again with the same username.
+    global match_ids
+    last_id = 0
+    for key, state in sections.items():
+        if not key.startswith("match:"):
+            continue
+        number = key[len("match:"):]
+        if number.isdigit():
+            last_id = max(last_id, int(number))  # new matches must not reuse a restored key
+        players = [Session(player_id, role=Role.PLAYER) for player_id in state['players']]
+        for player in players:
+            clients[player.id] = player
+        match = Match(players, [Board.from_state(board) for board in state['boards']], key)
+        match.turn = state['turn']
+        match.shots = state['shots']
+        match.hits = state['hits']
+        match.serial = state['serial']
+        for i, player in enumerate(players):
+            player.match = match
+            player.match_index = i
+        matches.append(match)
+        threading.Thread(target=run_match, args=(match, True), daemon=True).start()
+    match_ids = itertools.count(last_id + 1)
+
+    # Queued players keep their place if they are back within the reconnect window
+    for player_id, waited in sections.get('queue', []):
+        restored_waiting[player_id] = time.monotonic() - waited
+        timers.schedule(RECONNECT_WINDOW, forget_restored, player_id)
+
+def forget_restored(player_id):
+    with lock:
+        restored_waiting.pop(player_id, None)
+    queue_changed()
+
+def handle_connection(client):
+    # One reader thread per connection. Players' packets are forwarded to their match;
+    # everyone else is handled here as a spectator.
+    conn = client.conn
+    reader = client.reader
+    trace_id = client.trace_id
+    while True:
         try:
-            row, col = parse_coordinate(guess)
-            if not (0 <= row < 10 and 0 <= col < 10):
-                raise ValueError("Out of bounds.")
-        except ValueError as e:
-            send(client, f"Invalid coordinate: {e}")
+            seq, packet_type, payload = reader.read_packet()
+        except ValueError:
+            # corrupted frame; the reader has already skipped it
+            trace(trace_id, 'x')
+            if client.match is not None:
+                send(client, "[ERROR] Packet corrupted. Ignoring...")
             continue
+        except Exception:
+            break
 
-        result, sunk_name = board.fire_at(row, col)
-        send_board(client, board)  # attacker sees the updated board, spectators get one copy
-
-        if result == 'hit':
-            msg = "HIT!"
-            if sunk_name:
-                msg += f" You sank the {sunk_name}!"
-            send(client, msg)
-            send(clients[opponent_index], f"Your ship was hit at {guess}!")
-            broadcast_to_spectators(f"[Spectator] {guess}: HIT!{' Sank ' + sunk_name if sunk_name else ''}")
-
-            if board.all_ships_sunk():
-                send(client, "You win!")
-                send(clients[opponent_index], "You lose!")
-                broadcast_to_spectators(f"[Spectator] Player {index + 1} wins!")
-                if index == 0:
-                    promote_next_players()
-                return True  # End game
-
-        elif result == 'miss':
-            send(client, "MISS!")
-            send(clients[opponent_index], f"Opponent fired at {guess} and missed.")
-            broadcast_to_spectators(f"[Spectator] {guess}: MISS!")
-
-        elif result == 'already_shot':
-            send(client, "Already fired there. Try again.")
+        client.last_heard = time.monotonic()
+        if packet_type == PONG:
+            continue  # heartbeat reply, handled here so it never reaches the game loop
+        trace(trace_id, 'p', packet_type, payload)
+        if packet_type == PING:
+            send(client, payload, PONG)
             continue
 
-        turn = opponent_index  # Switch turn
+        match = client.match
+        print(f"[DEBUG] Decoded packet from {client.id}: seq={seq}, type={packet_type}, payload='{payload}'")
 
-def promote_next_players():
-    global clients, boards, turn
+        # Replay protection check — must happen before anything else
+        last_seq = client.last_seq
+        if seq <= last_seq:
+            print(f"[SECURITY] Replayed or out-of-order packet from {client.id} (seq={seq} <= {last_seq})")
+            if match is not None:
+                send(client, "[SECURITY] Replayed or out-of-order packet ignored.")
+            else:
+                send(client, "[SECURITY] Replayed chat packet ignored.")
+            continue
+        client.last_seq = seq
 
-    # Reset has_played flags if all waiting players have played
-    if all(c.get('has_played') for c in clients if c.get('role') == 'waiting'):
-        for c in clients:
-            if c.get('role') == 'waiting':
-                c['has_played'] = False
+        if match is not None:
+            match.events.put(('packet', client.match_index, packet_type, payload))
+        else:
+            handle_spectator_packet(client, packet_type, payload)
 
-    # Skip if game already running
-    if len([c for c in clients if c.get('role') == 'player']) >= 2:
-        print("[DEBUG] Skipping promotion: match already in progress.")
-        return
+    trace(trace_id, 'c')
+    if client.conn is not conn:
+        return  # the player has already reconnected on a new socket
 
-    # Pick next eligible players
-    eligible = [c for c in clients if c.get('role') == 'waiting' and not c.get('has_played')]
-    if len(eligible) >= 2:
-        players = [eligible[0], eligible[1]]
-        players[0]['role'] = 'player'
-        players[1]['role'] = 'player'
-        players[0]['has_played'] = True
-        players[1]['has_played'] = True
+    match = client.match
+    if match is not None:
+        match.events.put(('disconnected', client.match_index))
+    else:
+        print(f"[INFO] {client.id} left")
+        drop_spectator(client)
 
-        # Remove from spectator list if promoted
-        if players[0]['conn'] in spectators:
-            spectators.remove(players[0]['conn'])
-        if players[1]['conn'] in spectators:
-            spectators.remove(players[1]['conn'])
-
-        # Reset boards
-        boards.clear()
-        for _ in range(2):
-            board = Board()
-            board.place_ships_randomly()
-            boards.append(board)
-
-        turn = 0
-
-        # Notify everyone
-        broadcast_to_all("🔁 New match starting!")
-        broadcast_to_all(f"[INFO] Next match: {players[0]['id']} vs {players[1]['id']}")
-        time.sleep(1)
-        send(players[0], "Welcome Player 1! Game will start now.")
-        send(players[1], "Welcome Player 2! Game will start now.")
-        time.sleep(0.2)
-        instructions = (
-            "Game started!\n"
-            "- Type 'quit' for temporary disconnection (you can reconnect within 60s).\n"
-            "- Type 'quit!' for immediate forfeit and transition to next match."
-        )
-        send(players[0], instructions)
-        send(players[1], instructions)
-
-        # Reset sequence tracking
-        players[0]['last_seq'] = -1
-        players[1]['last_seq'] = -1
-
-        print(f"[DEBUG] Launching threads for: {players[0]['id']} (index 0), {players[1]['id']} (index 1)")
-        threading.Thread(target=handle_client, args=(0, players[0]), daemon=True).start()
-        threading.Thread(target=handle_client, args=(1, players[1]), daemon=True).start()
-
-        
-def handle_client(player_index, client):
-    global turn
-
-    print(f"[DEBUG] Starting handle_client thread for: {client['id']}")
-
-    while len(boards) < 2:
-        time.sleep(0.1)
+def handle_spectator_packet(client, packet_type, payload):
+    if client.role is Role.WAITING:
+        touch_spectator(client)
+
+    if packet_type == 2:  # Chat packet
+        post_chat(client, payload)
+
+    elif packet_type == 1 and payload.upper().startswith("VIEW "):
+        if set_viewport(client, payload):
+            send(client, "[INFO] Viewport updated.")
+
+    elif packet_type == 1 and payload.strip().upper() == "LEADERBOARD":
+        send(client, format_leaderboard())
+
+    # Ignore other packet types silently
+
+def main():
+    global stats, checkpoints, feed, recorder, chat_dispatcher
+    if not NONBLOCKING_SEND and (HEARTBEAT_INTERVAL or CHAT_BATCH_WINDOW):
+        print("[ERROR] This platform has no non-blocking send (MSG_DONTWAIT); "
+              "set HEARTBEAT_INTERVAL = 0 and CHAT_BATCH_WINDOW = 0 in server.py")
+        raise SystemExit(1)
+    timers.start()
+    if CHAT_BATCH_WINDOW:
+        chat_dispatcher = ChatDispatcher(deliver_chat, CHAT_BATCH_WINDOW, flush_chat_backlog).start()
+    if TRACE_FILE is not None:
+        recorder = TrafficRecorder(TRACE_FILE).start()
+        print(f"[INFO] Recording inbound traffic to {TRACE_FILE}")
+    if SPECTATOR_FEED_PORT is not None:
+        feed = SpectatorFeed(HOST, SPECTATOR_FEED_PORT).start()
+        print(f"[INFO] Spectator feed on udp://{HOST}:{SPECTATOR_FEED_PORT}")
+    stats = StatsStore(STATS_DB).start()
+    matchmaker.ratings.update(stats.ratings())
+
+    started = time.perf_counter()
+    sections = load_checkpoint(CHECKPOINT_FILE)
+    checkpoints = Checkpointer(CHECKPOINT_FILE).start()
+    restore_checkpoint(sections)
+    checkpoints.register('queue', queue_state)
+    if sections:
+        print(f"[INFO] Restored {len(matches)} matches and {len(restored_waiting)} queued players "
+              f"in {(time.perf_counter() - started) * 1000:.1f} ms")
 
     try:
-        start_game(player_index, client)
-    except Exception as e:
-        print(f"[ERROR] start_game crashed for {client['id']}: {e}")
-        import traceback
-        traceback.print_exc()
+        serve()
     finally:
-        try:
-            send(client, "Game over! Thanks for playing.")
-        except:
-            pass
-        try:
-            client['conn'].close()
-        except:
-            pass
+        checkpoints.close()  # write the latest state before exiting
+        stats.close()  # flush results still buffered
+        if recorder is not None:
+            recorder.close()
+        if chat_dispatcher is not None:
+            chat_dispatcher.close()
+
+def serve():
+    address = LISTEN_ADDRESS or f"tcp://{HOST}:{PORT}"
+    with listen(address, LISTEN_BACKLOG) as s:
+        print(f"[INFO] Server running on {address}")
+        timers.schedule(RATE_WINDOW, sweep_rate_limits)
+        if HEARTBEAT_INTERVAL:
+            timers.schedule(HEARTBEAT_INTERVAL, heartbeat)
+        timers.schedule(PAIRING_RETRY_INTERVAL, retry_pairing)
 
-def handle_spectator(client):
-    conn = client['conn']
-    while True:
-        try:
-            data = conn.recv(1024)
-            if not data:
-                break
+        while True:
+            conn, addr = s.accept()
+            print(f"[INFO] Connection from {addr}")
+            retry_after = admit(addr)
+            if retry_after and not reserve_handshake():
+                print(f"[INFO] Turning away {addr}: busy, retry after {retry_after}s")
+                reject_busy(conn, retry_after)
+                continue
+            # The login and then the packet loop run on the connection's own thread,
+            # so a slow handshake never holds up accept()
+            threading.Thread(target=login, args=(conn, addr, retry_after), daemon=True).start()
+
+def admit(addr):
+    # Returns 0 if a new connection may start its handshake, otherwise the number of
+    # seconds after which it should retry. Unix socket and in-process peers all share one
+    # placeholder address, so they are only subject to the handshake limit.
+    global handshakes
+    now = time.monotonic()
+    with lock:
+        if not is_local_peer(addr):
+            recent = connection_times.setdefault(addr[0], deque())
+            while recent and now - recent[0] > RATE_WINDOW:
+                recent.popleft()
+            if len(recent) >= MAX_CONNECTIONS_PER_IP:
+                return max(1, math.ceil(RATE_WINDOW - (now - recent[0])))
+            recent.append(now)
+        if handshakes >= MAX_HANDSHAKES:
+            return BUSY_RETRY_AFTER
+        handshakes += 1
+    return 0
+
+def reserve_handshake():
+    # A connection over the limits may still be a player returning to a match, which is
+    # only known once it sends its username. A few such connections at a time get a
+    # reserved slot; login() turns them away afterwards unless they resume a match.
+    global reserved_handshakes
+    with lock:
+        if reserved_handshakes >= RESERVED_HANDSHAKES:
+            return False
+        reserved_handshakes += 1
+    return True
+
+def release_handshake(reserved=False):
+    global handshakes, reserved_handshakes
+    with lock:
+        if reserved:
+            reserved_handshakes -= 1
+        else:
+            handshakes -= 1
+
+def sweep_rate_limits():
+    # Forget addresses that have not connected within the rate window
+    now = time.monotonic()
+    with lock:
+        for ip in [ip for ip, recent in connection_times.items() if now - recent[-1] > RATE_WINDOW]:
+            del connection_times[ip]
+    timers.schedule(RATE_WINDOW, sweep_rate_limits)
+
+def reject_busy(conn, retry_after):
+    try:
+        conn.setblocking(False)  # never let a rejected client stall the accept loop
+        conn.sendall(encode_packet(next(outbound_seq), 1, f"[BUSY] Server busy, retry after {retry_after} seconds."))
+    except OSError:
+        pass
+    conn.close()
+
+def login(conn, addr, busy=0):
+    # busy is the retry-after of a connection admitted over the limits: it may only resume a match
+    reader = PacketReader(conn, SESSION_READ_BUFFER)
+    # A client that never sends a username is cut off instead of holding a handshake slot
+    handshake_timer = timers.schedule(HANDSHAKE_TIMEOUT, shutdown_quietly, conn)
+    trace_id = recorder.open_session() if recorder is not None else None
+
+    client_obj = None
+    reconnected = None
+    reserved = busy > 0
+    compress = False
+    replies = ["[SERVER] Enter your username:"]
+    try:
+        while True:
             try:
-                seq, packet_type, payload = decode_packet(data)
+                for reply in replies:
+                    conn.sendall(encode_packet(next(outbound_seq), 1, reply))
+                replies = ["[SERVER] Enter your username:"]
+                _, packet_type, candidate = reader.read_packet()
+                if packet_type == OPTIONS:
+                    # Features the client supports, sent before its username
+                    trace(trace_id, 'p', packet_type, candidate)
+                    compress = COMPRESS_PAYLOADS and COMPRESSION in candidate.split(",")
+                    replies = []
+                    continue
+                trace(trace_id, 'u', packet_type, candidate)
 
-                # Replay protection
-                if seq <= client.get('last_seq', -1):
-                    send(client, "[SECURITY] Replayed chat packet ignored.")
+                if packet_type != 1:
+                    replies.insert(0, "[SERVER] Invalid packet for username.")
                     continue
-                client['last_seq'] = seq
 
-                if packet_type == 2:  # Chat packet
-                    chat_message = f"[CHAT] {client['id']}: {payload}"
-                    broadcast_chat(client, chat_message)
-                    send(client, f"[CHAT SENT] {payload}")
+                # The name is checked and claimed under one lock, so two logins with the
+                # same name cannot both take it (or both resume the same player)
+                with lock:
+                    existing = clients.get(candidate)
+                    if (existing is not None and existing.disconnected and existing.match is not None
+                            and not existing.reconnecting):
+                        # Players in a match are always let back in, even when the server is busy
+                        reconnected = existing
+                        reconnected.reconnecting = True  # until the match thread handles 'reconnected'
+                        reconnected.viewport = (0, 0)
+                        reconnected.conn = conn
+                        reconnected.reader = reader
+                        reconnected.last_seq = -1
+                        reconnected.last_heard = time.monotonic()
+                        reconnected.trace_id = trace_id
+                        reconnected.compress = compress
+                        match, index = reconnected.match, reconnected.match_index
+                        break
+                    if existing is None and not busy:
+                        busy = BUSY_RETRY_AFTER if len(clients) >= MAX_SESSIONS else 0
+                        if not busy:
+                            client_obj = Session(candidate, conn, reader)
+                            client_obj.trace_id = trace_id
+                            client_obj.compress = compress
+                            clients[candidate] = client_obj
+                            # Everyone waits as a spectator until the matchmaker pairs them
+                            spectators.add(client_obj)
+                            touch_spectator(client_obj)
+                            matchmaker.enqueue(candidate, restored_waiting.pop(candidate, None))
+                        break
+                    if busy:
+                        break  # over the limits and not resuming a match
 
-                # Ignore other packet types silently
-            except Exception:
-                continue
-        except:
-            break
+                # Taken by a connected client (or one already reconnecting)
+                replies.insert(0, "Username already exists. Please try again.")
 
-def main():
-    print(f"[INFO] Server running on {HOST}:{PORT}")
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind((HOST, PORT))
-        s.listen(10)  # Allow many queued connections
+            except OSError as e:
+                print(f"[INFO] {addr} left during login: {e}")
+                trace(trace_id, 'c')
+                conn.close()
+                return
 
-        while True:
-            conn, addr = s.accept()
-            print(f"[INFO] Connection from {addr}")
+            except Exception as e:
+                print(f"[ERROR] Username processing failed: {e}")
+                replies.insert(0, "Invalid input. Please try again.")
+    finally:
+        handshake_timer.cancel()
+        release_handshake(reserved)
 
-            username = None
-            found_reconnect = False
-            while True:
-                conn.sendall(encode_packet(0, 1, "[SERVER] Enter your username:"))
-                try:
-                    data = conn.recv(1024)
-                    _, packet_type, candidate = decode_packet(data)
-
-                    if packet_type != 1:
-                        conn.sendall(encode_packet(0, 1, "[SERVER] Invalid packet for username."))
-                        continue
-
-                    # Reconnect BEFORE duplicate check
-                    for i, client in enumerate(clients):
-                        if client.get('id') == candidate and disconnected[i]:
-                            print(f"[INFO] Reconnecting player {candidate}")
-                            client['conn'] = conn
-                            client['wfile'] = conn.makefile('w')
-                            player_last_active[i] = time.time()
-                            disconnected[i] = False
-                            client['last_seq'] = -1
-                            found_reconnect = True
-                            break
-
-                    if found_reconnect:
-                        break  # Skip rest; do not add new client object
-
-                    # Check for duplicate usernames (non-disconnected)
-                    if any(c['id'] == candidate for c in clients):
-                        conn.sendall(encode_packet(0, 1, "Username already exists. Please try again."))
-                        continue
-
-                    username = candidate
-                    break  # <- correctly escapes prompt loop
-
-                except Exception as e:
-                    print(f"[ERROR] Username processing failed: {e}")
-                    conn.sendall(encode_packet(0, 1, "Invalid input. Please try again."))
-
-            # If user was a reconnect, do NOT create new client_obj
-            if found_reconnect:
-                continue
+    if reconnected:
+        print(f"[INFO] Reconnecting player {reconnected.id}")
+        match.events.put(('reconnected', index))
+        handle_connection(reconnected)
+        return
 
-            # New client setup
-            client_obj = {
-                'conn': conn,
-                'role': None,  # will be set to 'player' or 'waiting' below
-                'id': username,
-                'has_played': False,
-                'wfile': conn.makefile('w'),
-                'last_seq': -1  # Initialize with -1 (no packets received yet)
-            }
-            clients.append(client_obj)
-            disconnected.append(False)
-            disconnected_at.append(0)
-            player_last_active.append(time.time())
-
-            # Count current players
-            current_players = [c for c in clients if c['role'] == 'player']
-
-            if len(current_players) < 2:
-                # Assign as player
-                board = Board()
-                board.place_ships_randomly()
-                boards.append(board)
-
-                client_obj['role'] = 'player'
-                client_obj['has_played'] = True
-
-                current_players = [c for c in clients if c['role'] == 'player']
-                if len(current_players) == 2:
-                    for i, client in enumerate(current_players):
-                        send(client, f"Welcome Player {i + 1}! Game will start now.")
-                    time.sleep(0.1)
-                    instructions = (
-                        "Game started!\n"
-                        "- Type 'quit' for temporary disconnection (you can reconnect within 60s).\n"
-                        "- Type 'quit!' for immediate forfeit and transition to next match."
-                    )
-                    for i, client in enumerate(current_players):
-                        send(client, instructions)
-                        threading.Thread(target=handle_client, args=(clients.index(client), client), daemon=True).start()
-            else:
-                # assign as waiting spectator
-                client_obj['role'] = 'waiting'
-                spectators.append(conn)
-                try:
-                    packet = encode_packet(0, 1, "[SERVER] You are connected as a spectator.")
-                    conn.sendall(packet)
-                except:
-                    pass
-
-                # Start spectator thread
-                threading.Thread(target=handle_spectator, args=(client_obj,), daemon=True).start()
-
-    # Keep the main thread alive while game threads run
-    while True:
-        time.sleep(1)
+    if busy:
+        print(f"[INFO] Turning away {candidate}: busy, retry after {busy}s")
+        trace(trace_id, 'c')
+        reject_busy(conn, busy)
+        return
+    queue_changed()
+
+    if client_obj not in promote_next_players():
+        send(client_obj, "[SERVER] You are connected as a spectator.")
+
+    handle_connection(client_obj)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if len(sys.argv) > 1:
+        LISTEN_ADDRESS = sys.argv[1]  # e.g. python server.py unix:///tmp/battleship.sock
+    main()
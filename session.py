@@ -0,0 +1,47 @@
+"""
+session.py
+
+Per-connection state kept by the server for every logged-in client.
+
+Sessions use __slots__ instead of a per-instance dict, and everything the server used to
+keep in parallel lists (disconnected flag, viewport) lives on the session itself, so it
+goes away together with the session.
+"""
+
+import enum
+import threading
+import time
+
+
+class Role(enum.Enum):
+    WAITING = "waiting"  # spectating while queued for a match
+    PLAYER = "player"
+
+
+class Session:
+    __slots__ = ("id", "conn", "reader", "role", "last_seq", "match", "match_index",
+                 "idle_timer", "viewport", "disconnected", "reconnecting", "last_heard",
+                 "trace_id", "compress", "chat_bucket", "send_lock", "unsent", "outbox")
+
+    def __init__(self, player_id, conn=None, reader=None, role=Role.WAITING):
+        self.id = player_id
+        self.conn = conn            # None while a restored player has not reconnected
+        self.reader = reader        # PacketReader for conn
+        self.role = role
+        self.last_seq = -1          # highest packet seq accepted on this connection
+        self.match = None
+        self.match_index = None     # 0 or 1 while in a match
+        self.idle_timer = None      # spectator idle deadline (timers.Timer)
+        self.viewport = (0, 0)      # top-left corner of the board region this client sees
+        self.disconnected = conn is None
+        self.reconnecting = False   # a login has claimed this disconnected player; the match thread has not resumed it yet
+        self.last_heard = time.monotonic()  # any packet from the peer, heartbeats included
+        self.trace_id = None        # session number in the traffic trace, when recording
+        self.compress = False       # peer asked for compressed payloads at login
+        self.chat_bucket = None     # chat.TokenBucket, created on the first chat message
+        self.send_lock = threading.Lock()  # held for every write to conn, so frames never interleave
+        self.unsent = None          # (conn, rest of a frame) a non-blocking send could only partly write
+        self.outbox = None          # deque of chat packets waiting for a slow socket (chat thread only)
+
+    def __repr__(self):
+        return f"Session({self.id!r}, {self.role.value})"
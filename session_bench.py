@@ -0,0 +1,180 @@
+"""
+session_bench.py
+
+Memory benchmark for idle spectator sessions.
+
+Builds N logged-in but idle spectators the way the server does (session object, packet
+reader, idle timer, matchmaker entry and the server's registries) and reports the bytes
+each one costs, measured with tracemalloc. The old layout (a dict per client with an
+unused makefile() wrapper, a 4096-byte reader and parallel lists) is measured the same
+way for comparison.
+
+Every session shares one real socket pair so that 100k sessions fit under the file
+descriptor limit; kernel socket buffers are therefore not counted, only Python objects.
+
+Those figures leave out the biggest cost of a connected session: its reader thread. That
+is measured separately, as the growth in resident memory (RSS, Linux only) while --threads
+threads sit blocked in read_packet() the way idle spectators' reader threads do, and
+added to the slotted figure. Each thread also reserves stack address space (not resident).
+
+    python session_bench.py --sessions 10000 100000 --threads 1000
+"""
+
+import argparse
+import gc
+import os
+import socket
+import threading
+import time
+import tracemalloc
+
+from matchmaking import Matchmaker
+from protocol import PacketReader, READ_BUFFER_SIZE
+from server import IDLE_SPECTATOR_TIMEOUT, SESSION_READ_BUFFER
+from session import Session
+from timers import TimerService
+
+
+def noop(*args):
+    pass
+
+
+def legacy_sessions(conn, count):
+    # The dict-per-client layout the server used before session.py
+    timers = TimerService()
+    matchmaker = Matchmaker()
+    clients, spectators = [], []
+    disconnected, disconnected_at, player_last_active = [], [], []
+    viewports = {}
+    for i in range(count):
+        client = {
+            'conn': conn,
+            'role': 'waiting',
+            'id': f"player{i}",
+            'wfile': conn.makefile('w'),
+            'reader': PacketReader(conn, READ_BUFFER_SIZE),
+            'last_seq': -1
+        }
+        clients.append(client)
+        disconnected.append(False)
+        disconnected_at.append(0)
+        player_last_active.append(time.time())
+        spectators.append(conn)
+        client['idle_timer'] = timers.schedule(IDLE_SPECTATOR_TIMEOUT, noop, client)
+        matchmaker.enqueue(client['id'])
+    return clients, spectators, disconnected, disconnected_at, player_last_active, viewports, timers, matchmaker
+
+
+def slotted_sessions(conn, count):
+    # The layout server.py uses now
+    timers = TimerService()
+    matchmaker = Matchmaker()
+    clients, spectators = {}, set()
+    for i in range(count):
+        client = Session(f"player{i}", conn, PacketReader(conn, SESSION_READ_BUFFER))
+        clients[client.id] = client
+        spectators.add(client)
+        client.idle_timer = timers.schedule(IDLE_SPECTATOR_TIMEOUT, noop, client)
+        matchmaker.enqueue(client.id)
+    return clients, spectators, timers, matchmaker
+
+
+def measure(build, conn, count):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    state = build(conn, count)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del state
+    gc.collect()
+    return (after - before) / count
+
+
+def resident_bytes():
+    # None where /proc is not available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def reserved_stack():
+    # Stack address space per thread: threading.stack_size() if set, else (on Unix) the
+    # RLIMIT_STACK soft limit that pthreads default to. None if unknown.
+    if threading.stack_size():
+        return threading.stack_size()
+    try:
+        import resource
+        limit = resource.getrlimit(resource.RLIMIT_STACK)[0]
+    except (ImportError, OSError):
+        return None
+    return None if limit == resource.RLIM_INFINITY else limit
+
+
+def measure_reader_threads(count):
+    """Resident bytes per reader thread blocked in read_packet(), or None if RSS is unavailable."""
+    conn, peer = socket.socketpair()
+    started = threading.Semaphore(0)
+
+    def reader():
+        packets = PacketReader(conn, SESSION_READ_BUFFER)
+        started.release()
+        try:
+            packets.read_packet()
+        except (OSError, ValueError):
+            pass
+
+    gc.collect()
+    before = resident_bytes()
+    threads = [threading.Thread(target=reader, daemon=True) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for _ in threads:
+        started.acquire()
+    time.sleep(0.2)  # let the last ones reach recv()
+    after = resident_bytes()
+    conn.shutdown(socket.SHUT_RDWR)  # wakes every blocked reader
+    for thread in threads:
+        thread.join()
+    conn.close()
+    peer.close()
+    if before is None or after is None:
+        return None
+    return (after - before) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure memory per idle spectator session.")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--threads", type=int, default=1000, help="blocked reader threads to measure")
+    args = parser.parse_args()
+
+    conn, peer = socket.socketpair()
+    slotted = None
+    try:
+        print("Python objects only (tracemalloc):")
+        print(f"{'sessions':>9} {'legacy B/session':>17} {'slotted B/session':>18} {'saved':>7}")
+        for count in args.sessions:
+            legacy = measure(legacy_sessions, conn, count)
+            slotted = measure(slotted_sessions, conn, count)
+            print(f"{count:>9,} {legacy:>17,.0f} {slotted:>18,.0f} {1 - slotted / legacy:>7.0%}")
+    finally:
+        conn.close()
+        peer.close()
+
+    per_thread = measure_reader_threads(args.threads)
+    stack = reserved_stack()
+    stack = f"{stack / 2**20:g} MiB" if stack else "the OS default"
+    if per_thread is None:
+        print("Reader thread per session: RSS not available on this platform (object figures above exclude it)")
+    else:
+        print(f"Reader thread per session: {per_thread:,.0f} B resident ({args.threads:,} blocked threads), "
+              f"plus {stack} of stack address space reserved (not resident)")
+        print(f"Slotted session including its reader thread: {slotted + per_thread:,.0f} B")
+
+
+if __name__ == "__main__":
+    main()
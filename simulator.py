@@ -0,0 +1,251 @@
+"""
+simulator.py
+
+Headless Battleship games between pluggable strategies, and a batch runner that spreads
+many games over a process pool.
+
+ - play_game() plays one complete game with no I/O and returns a GameResult.
+ - A strategy is any class taking (size, rng) with choose() -> (row, col) and
+   observe(row, col, result, sunk_ship_name); see Strategy. Built-in ones are listed in
+   STRATEGIES, others can be loaded as "module:Class".
+ - Every game gets its own seed derived from the batch seed and the game number, so a
+   batch gives the same results whatever the number of workers.
+
+    python simulator.py --games 1000000 --strategies hunt random --workers 8
+"""
+
+import argparse
+import importlib
+import os
+import random
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from battleship import Board, BOARD_SIZE, SHIPS
+
+CHUNK_SIZE = 2000  # games per task sent to a worker process
+
+GameResult = namedtuple("GameResult", "winner turns shots")  # winner is 0, 1 or None (turn limit hit)
+
+
+class Strategy:
+    """Picks targets on a size x size board and learns from the results."""
+
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+
+    def choose(self):
+        raise NotImplementedError
+
+    def observe(self, row, col, result, sunk_ship_name):
+        pass
+
+
+class RandomStrategy(Strategy):
+    """Fires at every cell once, in random order."""
+
+    def __init__(self, size, rng):
+        super().__init__(size, rng)
+        self.targets = [(r, c) for r in range(size) for c in range(size)]
+        rng.shuffle(self.targets)
+
+    def choose(self):
+        return self.targets.pop()
+
+
+class HuntTargetStrategy(Strategy):
+    """
+    Hunts on a checkerboard (every ship covers at least one of its cells), and after a hit
+    targets the neighbouring cells until the ship is sunk.
+    """
+
+    def __init__(self, size, rng):
+        super().__init__(size, rng)
+        cells = [(r, c) for r in range(size) for c in range(size)]
+        rng.shuffle(cells)
+        # Checkerboard cells last so they are popped first
+        self.hunt = [cell for cell in cells if sum(cell) % 2] + [cell for cell in cells if not sum(cell) % 2]
+        self.targets = []
+        self.tried = set()
+
+    def choose(self):
+        while self.targets:
+            cell = self.targets.pop()
+            if cell not in self.tried:
+                break
+        else:
+            cell = self.hunt.pop()
+            while cell in self.tried:
+                cell = self.hunt.pop()
+        self.tried.add(cell)
+        return cell
+
+    def observe(self, row, col, result, sunk_ship_name):
+        if result != 'hit':
+            return
+        if sunk_ship_name:
+            self.targets.clear()
+            return
+        for r, c in ((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)):
+            if 0 <= r < self.size and 0 <= c < self.size and (r, c) not in self.tried:
+                self.targets.append((r, c))
+
+
+STRATEGIES = {
+    "random": RandomStrategy,
+    "hunt": HuntTargetStrategy,
+}
+
+
+def load_strategy(name):
+    """A built-in strategy by name, or any class given as "module:Class"."""
+    if name in STRATEGIES:
+        return STRATEGIES[name]
+    module, sep, attr = name.partition(":")
+    if not sep:
+        raise ValueError(f"Unknown strategy '{name}' (built-in: {', '.join(STRATEGIES)}; or use module:Class)")
+    return getattr(importlib.import_module(module), attr)
+
+
+def play_game(strategies, seed, size=BOARD_SIZE, ships=SHIPS, salvo=1, first=0):
+    """
+    Play one game between two strategy classes and return a GameResult. Player 'first'
+    shoots first; each turn fires 'salvo' shots. 'turns' counts both players' turns.
+    """
+    rng = random.Random(seed)
+    boards = []  # boards[i] holds player i's ships
+    for _ in range(2):
+        board = Board(size)
+        board.place_ships_randomly(ships, rng)
+        boards.append(board)
+    players = [strategy(size, rng) for strategy in strategies]
+
+    shots = [0, 0]
+    turn = first
+    max_turns = 2 * size * size  # only reached by a strategy that keeps repeating cells
+    for turns in range(1, max_turns + 1):
+        player = players[turn]
+        target = boards[1 - turn]
+        if salvo == 1:
+            row, col = player.choose()
+            result, sunk = target.fire_at(row, col)
+            player.observe(row, col, result, sunk)
+            shots[turn] += 1
+        else:
+            volley = [player.choose() for _ in range(min(salvo, size * size - shots[turn]))]
+            for row, col, result, sunk in target.fire_salvo(volley):
+                player.observe(row, col, result, sunk)
+                shots[turn] += 1
+        if target.all_ships_sunk():
+            return GameResult(turn, turns, shots)
+        turn = 1 - turn
+    return GameResult(None, max_turns, shots)
+
+
+def run_chunk(strategy_names, seed, start, count, size, salvo):
+    """Play games start .. start + count - 1 and return (wins, lengths, shots) totals."""
+    strategies = [load_strategy(name) for name in strategy_names]
+    wins = Counter()
+    lengths = Counter()
+    shots = 0
+    for game in range(start, start + count):
+        # The seed depends only on the batch seed and the game number; players swap who
+        # starts each game so neither side gets the first-move advantage
+        result = play_game(strategies, (seed << 32) + game, size, SHIPS, salvo, first=game % 2)
+        wins[result.winner] += 1
+        lengths[result.turns] += 1
+        shots += sum(result.shots)
+    return wins, lengths, shots
+
+
+def run_batch(games, strategy_names, seed=0, workers=None, size=BOARD_SIZE, salvo=1, chunk_size=CHUNK_SIZE):
+    """Spread 'games' games over a process pool; returns a summary dict."""
+    wins = Counter()
+    lengths = Counter()
+    shots = 0
+    chunks = [(start, min(chunk_size, games - start)) for start in range(0, games, chunk_size)]
+    started = time.perf_counter()
+    if workers == 1:
+        results = (run_chunk(strategy_names, seed, start, count, size, salvo) for start, count in chunks)
+        for chunk_wins, chunk_lengths, chunk_shots in results:
+            wins.update(chunk_wins)
+            lengths.update(chunk_lengths)
+            shots += chunk_shots
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(run_chunk, strategy_names, seed, start, count, size, salvo) for start, count in chunks]
+            for future in futures:
+                chunk_wins, chunk_lengths, chunk_shots = future.result()
+                wins.update(chunk_wins)
+                lengths.update(chunk_lengths)
+                shots += chunk_shots
+    elapsed = time.perf_counter() - started
+    return {
+        'games': games,
+        'wins': wins,
+        'lengths': lengths,
+        'shots': shots,
+        'elapsed': elapsed,
+        'games_per_sec': games / elapsed if elapsed else 0.0,
+    }
+
+
+def length_percentile(lengths, share):
+    """Smallest game length that at least 'share' of the games did not exceed."""
+    total = sum(lengths.values())
+    seen = 0
+    for length in sorted(lengths):
+        seen += lengths[length]
+        if seen >= share * total:
+            return length
+    return 0
+
+
+def print_report(summary, strategy_names, workers, bins=12):
+    games, lengths = summary['games'], summary['lengths']
+    print(f"Games                 : {games:,} ({workers} workers)")
+    print(f"Throughput            : {summary['games_per_sec']:,.0f} games/sec ({summary['elapsed']:.1f} s)")
+    for i, name in enumerate(strategy_names):
+        print(f"Player {i + 1} ({name:<8})   : {summary['wins'][i] / games:.1%} wins")
+    if summary['wins'][None]:
+        print(f"Unfinished            : {summary['wins'][None]:,} (turn limit)")
+    mean = sum(length * n for length, n in lengths.items()) / games
+    print(f"Turns per game        : mean {mean:.1f}, min {min(lengths)}, p10 {length_percentile(lengths, 0.1)}, "
+          f"median {length_percentile(lengths, 0.5)}, p90 {length_percentile(lengths, 0.9)}, max {max(lengths)}")
+    print(f"Shots per game        : {summary['shots'] / games:.1f}")
+
+    # Text histogram of game lengths
+    low, high = min(lengths), max(lengths)
+    width = max(1, -(-(high - low + 1) // bins))
+    counts = Counter()
+    for length, n in lengths.items():
+        counts[(length - low) // width] += n
+    peak = max(counts.values())
+    print("\nGame length (turns)")
+    for b in range((high - low) // width + 1):
+        lo = low + b * width
+        label = f"{lo}-{lo + width - 1}" if width > 1 else f"{lo}"
+        print(f"  {label:>9} {counts[b]:>10,} {'#' * round(40 * counts[b] / peak)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play many headless Battleship games between strategies.")
+    parser.add_argument("--games", type=int, default=100000)
+    parser.add_argument("--strategies", nargs=2, default=["hunt", "random"], metavar=("P1", "P2"),
+                        help=f"built-in ({', '.join(STRATEGIES)}) or module:Class")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes (1 runs in this process)")
+    parser.add_argument("--size", type=int, default=BOARD_SIZE)
+    parser.add_argument("--salvo", type=int, default=1, help="shots per turn")
+    args = parser.parse_args()
+    for name in args.strategies:
+        load_strategy(name)  # fail early on a bad name
+
+    summary = run_batch(args.games, args.strategies, args.seed, args.workers, args.size, args.salvo)
+    print_report(summary, args.strategies, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,439 @@
+"""
+spectator_feed.py
+
+Optional UDP feed for spectators, who only need a lossy view of the latest state.
+
+ - A watcher sends SUBSCRIBE to the feed port (and again every RESUBSCRIBE_INTERVAL as a
+   keepalive). Before streaming anything the server checks the return path: a SUBSCRIBE
+   without a valid token only gets a CHALLENGE, a bare header no bigger than the request,
+   carrying a token for that address. The watcher repeats its SUBSCRIBE with the token,
+   and only then gets a SNAPSHOT of every running match (one datagram per match, so the
+   snapshot never outgrows a datagram). A spoofed source address therefore never receives
+   more than it was sent.
+ - Every change (match started, shots fired, match over) is a DELTA with the next sequence
+   number. It is encoded once and sent with one sendto() per watcher. The socket is
+   non-blocking and nothing is queued per watcher; a datagram that cannot be sent is lost.
+ - Watchers apply deltas in sequence order. A gap (lost or reordered datagram) makes the
+   watcher hold later deltas and send SNAPSHOT_REQUEST; the snapshot carries the sequence
+   number it is current to, and any held deltas after it are then applied.
+ - While nothing is published the server sends a bare HEARTBEAT with the current sequence
+   number every HEARTBEAT_INTERVAL, so a watcher that lost the last delta notices too.
+
+Datagrams are a FEED header (kind, seq) followed by a normal protocol frame (authenticated
+encryption) holding JSON. Requests from watchers are a bare header whose seq field carries
+their token. Watchers that stop resubscribing are dropped after SUBSCRIBER_TIMEOUT.
+
+    python spectator_feed.py [host] [port]     # watch a server's feed in the terminal
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+import traceback
+
+from battleship import Board
+from protocol import encode_packet, decode_packet, new_sequence
+
+FEED = struct.Struct("!BI")  # kind + sequence number
+_frame_seq = new_sequence()  # protocol frame seqs (cipher nonces), separate from the feed's own numbering
+SUBSCRIBE = 1
+SNAPSHOT_REQUEST = 2
+UNSUBSCRIBE = 3
+DELTA = 4
+SNAPSHOT = 5
+HEARTBEAT = 6
+CHALLENGE = 7
+
+FEED_PORT = 5001
+MAX_SUBSCRIBERS = 10000
+SUBSCRIBER_TIMEOUT = 30      # seconds without a SUBSCRIBE before a watcher is dropped
+RESUBSCRIBE_INTERVAL = 10    # how often watchers renew their subscription
+SNAPSHOT_INTERVAL = 0.5      # at most one snapshot per watcher this often
+HEARTBEAT_INTERVAL = 1.0     # idle time after which the server repeats its latest sequence number
+SNAPSHOT_RETRY = 0.5         # watchers re-request a snapshot that has not arrived after this long
+MAX_HELD_DELTAS = 1024       # deltas a watcher keeps while waiting for a snapshot
+MAX_DATAGRAM = 65507         # largest UDP payload over IPv4
+TOKEN_LIFETIME = 60          # seconds a return-path token stays valid (tokens rotate, the last one still counts)
+
+
+def encode_datagram(kind, seq, body=None):
+    """Raises ValueError if the datagram would be too large to send."""
+    datagram = FEED.pack(kind, seq)
+    if body is not None:
+        datagram += encode_packet(next(_frame_seq), 1, json.dumps(body, separators=(",", ":")))
+    if len(datagram) > MAX_DATAGRAM:
+        raise ValueError("Datagram too large")
+    return datagram
+
+
+def decode_datagram(data):
+    """Return (kind, seq, body). Raises ValueError for anything malformed or corrupted."""
+    if len(data) < FEED.size:
+        raise ValueError("Incomplete datagram")
+    kind, seq = FEED.unpack_from(data)
+    body = None
+    if len(data) > FEED.size:
+        _, _, text = decode_packet(memoryview(data)[FEED.size:])
+        body = json.loads(text)
+    return kind, seq, body
+
+
+class SpectatorFeed:
+    """Server side: keeps the public state of every match and streams changes to watchers."""
+
+    def __init__(self, host, port=FEED_PORT):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.address = self.sock.getsockname()
+        self.sock.setblocking(False)
+        self.seq = 0
+        self.published_at = time.monotonic()
+        self.matches = {}      # key -> {'players', 'size', 'turn', 'boards': [{(r, c): mark}, ...]}
+        self.subscribers = {}  # (ip, port) -> [last SUBSCRIBE time, last snapshot time]
+        self._secret = os.urandom(16)  # keys the return-path tokens; nothing is stored per token
+        self._snapshot = None  # (seq, datagrams) of the latest snapshot
+        self.lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="spectator-feed", daemon=True)
+            self._thread.start()
+        return self
+
+    # --- called by the server ---
+
+    def start_match(self, key, players, boards, turn=0):
+        state = {
+            'players': list(players),
+            'size': boards[0].size,
+            'turn': turn,
+            'boards': [dict(board.shots) for board in boards],
+        }
+        with self.lock:
+            self.matches[key] = state
+            self._publish({'m': key, 'start': self._public(state)})
+
+    def update(self, key, board_index, cells, turn=None, event=None):
+        """Publish shots on boards[board_index] as [(row, col, mark)], plus the next turn and an event line."""
+        with self.lock:
+            state = self.matches.get(key)
+            if state is None:
+                return
+            for r, c, mark in cells:
+                state['boards'][board_index][(r, c)] = mark
+            body = {'m': key, 'b': board_index, 'cells': [list(cell) for cell in cells]}
+            if turn is not None:
+                state['turn'] = body['turn'] = turn
+            if event is not None:
+                body['event'] = event
+            self._publish(body)
+
+    def end_match(self, key, event=None):
+        with self.lock:
+            if self.matches.pop(key, None) is not None:
+                self._publish({'m': key, 'end': True, 'event': event})
+
+    def close(self):
+        self.sock.close()
+
+    # --- internals (caller holds self.lock) ---
+
+    @staticmethod
+    def _public(state):
+        return dict(state, boards=[[[r, c, mark] for (r, c), mark in board.items()] for board in state['boards']])
+
+    def _publish(self, body):
+        self.seq += 1
+        try:
+            datagram = encode_datagram(DELTA, self.seq, body)
+        except ValueError as e:
+            print(f"[ERROR] Feed delta {self.seq} not sent: {e}")  # watchers see a gap and resync
+            return
+        self._broadcast(datagram)
+
+    def _broadcast(self, datagram):
+        self.published_at = time.monotonic()
+        for address in self.subscribers:
+            self._send(datagram, address)
+
+    def _send(self, datagram, address):
+        try:
+            self.sock.sendto(datagram, address)
+        except BlockingIOError:
+            pass  # socket buffer full: the watcher will see a gap and resync
+        except OSError as e:
+            print(f"[ERROR] Feed send to {address} failed: {e}")
+
+    def _send_snapshot(self, address, now):
+        entry = self.subscribers.get(address)
+        if entry is None or now - entry[1] < SNAPSHOT_INTERVAL:
+            return
+        entry[1] = now
+        for datagram in self._snapshot_datagrams():
+            self._send(datagram, address)
+
+    def _snapshot_datagrams(self):
+        # One datagram ('part') per match, all at the current seq; the watcher applies the
+        # snapshot once it has all 'parts'. Encoded once per seq and shared by every watcher.
+        if self._snapshot is not None and self._snapshot[0] == self.seq:
+            return self._snapshot[1]
+        items = list(self.matches.items()) or [(None, None)]
+        datagrams = []
+        for part, (key, state) in enumerate(items):
+            body = {'part': part, 'parts': len(items), 'matches': {}}
+            if key is not None:
+                body['matches'][key] = self._public(state)
+            try:
+                datagrams.append(encode_datagram(SNAPSHOT, self.seq, body))
+            except ValueError as e:
+                print(f"[ERROR] Match {key} left out of feed snapshots: {e}")
+                body['matches'] = {}
+                datagrams.append(encode_datagram(SNAPSHOT, self.seq, body))
+        self._snapshot = (self.seq, datagrams)
+        return datagrams
+
+    def _token(self, address, epoch):
+        digest = hmac.new(self._secret, f"{address[0]}:{address[1]}:{epoch}".encode(), hashlib.sha256).digest()
+        return int.from_bytes(digest[:4], "big")
+
+    def _valid_token(self, address, token, now):
+        epoch = int(now // TOKEN_LIFETIME)
+        return token in (self._token(address, epoch), self._token(address, epoch - 1))
+
+    def _challenge(self, address, now):
+        # A bare header, the same size as the request it answers
+        self._send(FEED.pack(CHALLENGE, self._token(address, int(now // TOKEN_LIFETIME))), address)
+
+    # --- receive thread ---
+
+    def _run(self):
+        last_sweep = time.monotonic()
+        while True:
+            try:
+                readable = select.select([self.sock], [], [], HEARTBEAT_INTERVAL / 2)[0]
+                data, address = self.sock.recvfrom(64) if readable else (None, None)
+            except (BlockingIOError, ConnectionRefusedError):
+                continue  # e.g. an ICMP error left over from an earlier send
+            except (OSError, ValueError):
+                return  # closed
+            now = time.monotonic()
+            try:
+                if data is not None:
+                    self._handle(data, address, now)
+                with self.lock:
+                    if now - self.published_at >= HEARTBEAT_INTERVAL:
+                        self._broadcast(encode_datagram(HEARTBEAT, self.seq))
+                if now - last_sweep >= 1.0:
+                    last_sweep = now
+                    with self.lock:
+                        for stale in [a for a, entry in self.subscribers.items() if now - entry[0] > SUBSCRIBER_TIMEOUT]:
+                            del self.subscribers[stale]
+            except Exception as e:
+                print(f"[ERROR] Spectator feed error: {e}")
+                traceback.print_exc()
+
+    def _handle(self, data, address, now):
+        if len(data) != FEED.size:
+            return  # requests are a bare header
+        kind, token = FEED.unpack(data)  # requests carry the watcher's return-path token as seq
+        with self.lock:
+            if kind == SUBSCRIBE:
+                if not self._valid_token(address, token, now):
+                    self._challenge(address, now)
+                    return
+                if address not in self.subscribers:
+                    if len(self.subscribers) >= MAX_SUBSCRIBERS:
+                        return
+                    self.subscribers[address] = [now, float('-inf')]
+                    self._send_snapshot(address, now)
+                self.subscribers[address][0] = now
+            elif kind == SNAPSHOT_REQUEST:
+                if address not in self.subscribers:
+                    self._challenge(address, now)  # e.g. dropped or never subscribed: subscribe first
+                    return
+                self._send_snapshot(address, now)
+            elif kind == UNSUBSCRIBE:
+                if self._valid_token(address, token, now):
+                    self.subscribers.pop(address, None)
+
+
+class FeedWatcher:
+    """Client side: mirrors the server's match state from the feed and recovers from gaps."""
+
+    def __init__(self, server_address, sock=None):
+        self.server_address = server_address
+        self.sock = sock or socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.matches = {}
+        self.last_seq = None   # None until the first snapshot arrives
+        self.held = {}         # seq -> body, deltas that arrived after a gap
+        self.token = 0         # return-path token from the server's last CHALLENGE
+        self.parts = {}        # part -> matches, of the snapshot being assembled
+        self.parts_seq = None  # seq of that snapshot
+        self.requested_at = None
+        self.subscribed_at = None
+        self.gaps = 0
+        self.snapshots = 0
+        self.corrupt = 0
+
+    def subscribe(self):
+        self.subscribed_at = time.monotonic()
+        self.sock.sendto(FEED.pack(SUBSCRIBE, self.token), self.server_address)
+        if self.last_seq is None and self.requested_at is None:
+            self.requested_at = self.subscribed_at  # the server answers with a snapshot
+
+    def unsubscribe(self):
+        self.sock.sendto(FEED.pack(UNSUBSCRIBE, self.token), self.server_address)
+
+    def request_snapshot(self):
+        self.requested_at = time.monotonic()
+        self.sock.sendto(FEED.pack(SNAPSHOT_REQUEST, self.token), self.server_address)
+
+    def tick(self):
+        """Call regularly: renews the subscription and retries a lost snapshot."""
+        now = time.monotonic()
+        if self.subscribed_at is None or now - self.subscribed_at >= RESUBSCRIBE_INTERVAL:
+            self.subscribe()
+        elif self.requested_at is not None and now - self.requested_at >= SNAPSHOT_RETRY:
+            self.request_snapshot()
+
+    def receive(self, timeout=None):
+        """Wait for one datagram, apply it, and return the event lines it produced."""
+        self.sock.settimeout(timeout)
+        try:
+            data, _ = self.sock.recvfrom(65535)
+        except socket.timeout:
+            return []
+        return self.handle_datagram(data)
+
+    def handle_datagram(self, data):
+        try:
+            kind, seq, body = decode_datagram(data)
+        except ValueError:
+            self.corrupt += 1
+            return []
+
+        if kind == CHALLENGE:
+            self.token = seq  # proves this address asked; subscribe again with it
+            self.subscribe()
+            return []
+
+        if kind in (SNAPSHOT, DELTA) and not isinstance(body, dict):
+            self.corrupt += 1  # e.g. a bare header: nothing authenticated to apply
+            return []
+
+        if kind == SNAPSHOT:
+            if not isinstance(body.get('matches'), dict):
+                self.corrupt += 1
+                return []
+            if self.parts_seq is None or seq > self.parts_seq:
+                self.parts_seq = seq
+                self.parts = {}
+            elif seq < self.parts_seq:
+                return []  # part of an older snapshot
+            self.parts[body.get('part', 0)] = body['matches']
+            if len(self.parts) < body.get('parts', 1):
+                return []  # the rest of this snapshot is still on its way
+            matches = {}
+            for part in self.parts.values():
+                matches.update(part)
+            self.parts = {}
+            events = []
+            if self.last_seq is None or seq > self.last_seq:
+                self.matches = {key: self._load(state) for key, state in matches.items()}
+                self.last_seq = seq
+                self.snapshots += 1
+                events.append("[FEED] Synchronised.")
+            self.requested_at = None
+            return events + self._drain()  # deltas that arrived while we were waiting
+
+        if kind == HEARTBEAT:
+            if self.last_seq is not None and seq > self.last_seq and self.requested_at is None:
+                self.gaps += 1  # the latest delta(s) never arrived
+                self.request_snapshot()
+            return []
+
+        if kind != DELTA or (self.last_seq is not None and seq <= self.last_seq):
+            return []  # duplicate or stale
+        if self.last_seq is None or seq != self.last_seq + 1:
+            # Gap: hold this delta and ask for a snapshot (once until it arrives)
+            if len(self.held) < MAX_HELD_DELTAS:
+                self.held[seq] = body
+            if self.requested_at is None:
+                self.gaps += 1
+                self.request_snapshot()
+            return []
+
+        self.last_seq = seq
+        events = self._apply(body) + self._drain()
+        if not self.held:
+            self.requested_at = None  # a late datagram closed the gap by itself
+        return events
+
+    def _drain(self):
+        self.held = {s: b for s, b in self.held.items() if s > self.last_seq}
+        events = []
+        while self.last_seq + 1 in self.held:
+            self.last_seq += 1
+            events += self._apply(self.held.pop(self.last_seq))
+        return events
+
+    @staticmethod
+    def _load(state):
+        state['boards'] = [{(r, c): mark for r, c, mark in board} for board in state['boards']]
+        return state
+
+    def _apply(self, body):
+        key = body['m']
+        if 'start' in body:
+            self.matches[key] = self._load(body['start'])
+            players = body['start']['players']
+            return [f"[FEED] New match: {players[0]} vs {players[1]}"]
+        if body.get('end'):
+            self.matches.pop(key, None)
+            return [body['event']] if body.get('event') else []
+        state = self.matches.get(key)
+        if state is None:
+            return []
+        for r, c, mark in body['cells']:
+            state['boards'][body['b']][(r, c)] = mark
+        if 'turn' in body:
+            state['turn'] = body['turn']
+        return [body['event']] if 'event' in body else []
+
+    def render(self, key, board_index, top=0, left=0, height=10, width=10):
+        """Grid lines for one board of a watched match, as a TCP spectator would see it."""
+        state = self.matches[key]
+        board = Board(state['size'])
+        board.shots = state['boards'][board_index]
+        return board.render_grid(top, left, height, width)
+
+
+def main():
+    host = sys.argv[1] if len(sys.argv) > 1 else '127.0.0.1'
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else FEED_PORT
+    watcher = FeedWatcher((host, port))
+    try:
+        while True:
+            watcher.tick()
+            events = watcher.receive(timeout=SNAPSHOT_RETRY)
+            for event in events:
+                print(event)
+            if events:
+                for key, state in watcher.matches.items():
+                    target = 1 - state['turn']  # the board the player to move is firing at
+                    print(f"{key} (Player {state['turn'] + 1} to move)")
+                    print("\n".join(watcher.render(key, target)))
+    except KeyboardInterrupt:
+        watcher.unsubscribe()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+stats_store.py
+
+Persistent per-player statistics (wins, losses, shots, hits/accuracy, rating) in SQLite.
+
+The game threads never touch the database:
+ - record_match() updates the in-memory copy and appends the result to a buffer;
+ - a background writer thread drains the buffer in batches, one transaction per batch;
+   a batch that fails (e.g. database locked or disk full) goes back to the front of the
+   buffer and is retried with exponential backoff, so results are not lost;
+ - leaderboard() is served from a top-K cache that is adjusted as results come in,
+   and only rebuilt (from memory, not the table) when a cached player drops to the bottom.
+
+All stats are loaded once at startup, which is also where the matchmaker gets its ratings.
+"""
+
+import heapq
+import sqlite3
+import threading
+import time
+import traceback
+
+from matchmaking import DEFAULT_RATING
+
+STATS_DB = "battleship_stats.db"
+TOP_K = 10
+BATCH_SIZE = 200       # flush as soon as this many results are buffered
+FLUSH_INTERVAL = 1.0   # otherwise flush at most this long after the first buffered result
+RETRY_DELAY = 0.5      # a failed batch is re-queued and retried after this long, doubling...
+MAX_RETRY_DELAY = 30   # ...up to this
+CLOSE_RETRIES = 3      # attempts left for a failing batch once close() is called
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    id      TEXT PRIMARY KEY,
+    wins    INTEGER NOT NULL DEFAULT 0,
+    losses  INTEGER NOT NULL DEFAULT 0,
+    shots   INTEGER NOT NULL DEFAULT 0,
+    hits    INTEGER NOT NULL DEFAULT 0,
+    rating  INTEGER NOT NULL DEFAULT 1000
+);
+CREATE TABLE IF NOT EXISTS matches (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    played_at REAL NOT NULL,
+    player1   TEXT NOT NULL,
+    player2   TEXT NOT NULL,
+    winner    TEXT
+);
+"""
+
+UPSERT = """
+INSERT INTO players (id, wins, losses, shots, hits, rating) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    wins = wins + excluded.wins,
+    losses = losses + excluded.losses,
+    shots = shots + excluded.shots,
+    hits = hits + excluded.hits,
+    rating = excluded.rating
+"""
+
+
+class StatsStore:
+    def __init__(self, path=STATS_DB, top_k=TOP_K):
+        self.path = path
+        self.top_k = top_k
+        self._players = {}  # id -> {'wins', 'losses', 'shots', 'hits', 'rating'}
+        self._top = []      # ids of the top_k players, best first
+        self._pending = []  # buffered match results
+        self._cond = threading.Condition()
+        self._closing = False
+        self._thread = None
+
+        db = sqlite3.connect(self.path)
+        try:
+            db.executescript(SCHEMA)
+            for row in db.execute("SELECT id, wins, losses, shots, hits, rating FROM players"):
+                self._players[row[0]] = dict(zip(('wins', 'losses', 'shots', 'hits', 'rating'), row[1:]))
+        finally:
+            db.close()
+        self._rebuild_top()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="stats-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def ratings(self):
+        return {player_id: s['rating'] for player_id, s in self._players.items()}
+
+    def record_match(self, players, winner, shots, hits, ratings):
+        """
+        Buffer one finished match. players is (id, id); winner is an id or None; shots,
+        hits and ratings are per-player values for this match, in the same order.
+        Returns immediately; the writer thread persists it.
+        """
+        with self._cond:
+            for i, player_id in enumerate(players):
+                stats = self._players.setdefault(
+                    player_id, {'wins': 0, 'losses': 0, 'shots': 0, 'hits': 0, 'rating': DEFAULT_RATING})
+                if winner is not None:
+                    stats['wins' if player_id == winner else 'losses'] += 1
+                stats['shots'] += shots[i]
+                stats['hits'] += hits[i]
+                stats['rating'] = ratings[i]
+                self._update_top(player_id)
+            self._pending.append((time.time(), tuple(players), winner, tuple(shots), tuple(hits), tuple(ratings)))
+            if len(self._pending) == 1 or len(self._pending) >= BATCH_SIZE:
+                self._cond.notify()
+
+    def leaderboard(self, k=TOP_K):
+        """Top k players by rating, best first, from the cache (k is capped at top_k)."""
+        with self._cond:
+            return [dict(self._players[player_id], id=player_id) for player_id in self._top[:k]]
+
+    def close(self):
+        """Flush everything still buffered and stop the writer thread."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        elif self._pending:
+            self._write(self._take_pending())
+
+    # --- top-K cache (caller holds self._cond) ---
+
+    def _sort_key(self, player_id):
+        return (-self._players[player_id]['rating'], player_id)
+
+    def _rebuild_top(self):
+        self._top = heapq.nsmallest(self.top_k, self._players, key=self._sort_key)
+
+    def _update_top(self, player_id):
+        was_in_top = player_id in self._top
+        if was_in_top:
+            self._top.remove(player_id)
+        elif len(self._top) == self.top_k and self._sort_key(player_id) > self._sort_key(self._top[-1]):
+            return  # still outside the top K
+
+        key = self._sort_key(player_id)
+        i = 0
+        while i < len(self._top) and self._sort_key(self._top[i]) < key:
+            i += 1
+        self._top.insert(i, player_id)
+
+        if len(self._top) > self.top_k:
+            self._top.pop()
+        elif was_in_top and i == len(self._top) - 1 and len(self._players) > self.top_k:
+            # A cached player fell to the bottom; someone outside the cache may now rank higher
+            self._rebuild_top()
+
+    # --- writer thread ---
+
+    def _take_pending(self):
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _run(self):
+        failures = 0
+        close_failures = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closing)
+                # Give more results a chance to join this batch
+                self._cond.wait_for(lambda: len(self._pending) >= BATCH_SIZE or self._closing,
+                                    timeout=FLUSH_INTERVAL)
+                batch = self._take_pending()
+                closing = self._closing
+            if batch and not self._write(batch):
+                failures += 1
+                close_failures += closing
+                with self._cond:
+                    if close_failures > CLOSE_RETRIES:
+                        print(f"[ERROR] Giving up on {len(batch)} match results after {failures} attempts")
+                        return
+                    # Older results go first: each row keeps the rating of the last result written
+                    self._pending[:0] = batch
+                    delay = RETRY_DELAY if closing else min(RETRY_DELAY * 2 ** (failures - 1), MAX_RETRY_DELAY)
+                    print(f"[INFO] Retrying {len(batch)} match results in {delay:g}s")
+                    # Back off, but stop waiting out a long delay once close() is called
+                    self._cond.wait_for(lambda: self._closing != closing, timeout=delay)
+                continue
+            failures = 0
+            if closing:
+                return
+
+    def _write(self, batch):
+        # Several results for the same player collapse into one row update. Returns False if
+        # the transaction failed, in which case nothing from the batch was written.
+        totals = {}
+        for _, players, winner, shots, hits, ratings in batch:
+            for i, player_id in enumerate(players):
+                row = totals.setdefault(player_id, [0, 0, 0, 0, DEFAULT_RATING])
+                if winner is not None:
+                    row[0 if player_id == winner else 1] += 1
+                row[2] += shots[i]
+                row[3] += hits[i]
+                row[4] = ratings[i]
+
+        try:
+            db = sqlite3.connect(self.path)
+            try:
+                with db:  # one transaction per batch
+                    db.executemany(UPSERT, [(player_id, *row) for player_id, row in totals.items()])
+                    db.executemany(
+                        "INSERT INTO matches (played_at, player1, player2, winner) VALUES (?, ?, ?, ?)",
+                        [(played_at, players[0], players[1], winner) for played_at, players, winner, *_ in batch])
+            finally:
+                db.close()
+        except sqlite3.Error as e:
+            print(f"[ERROR] Failed to write {len(batch)} match results: {e}")
+            traceback.print_exc()
+            return False
+        return True
@@ -0,0 +1,96 @@
+"""
+timers.py
+
+One shared timer service for the whole server. Turn timeouts, reconnect deadlines,
+handshake timeouts and idle-spectator reaping are all registered here instead of each
+connection polling the clock.
+
+ - schedule() pushes onto a heap ordered by deadline (O(log n)).
+ - Timer.cancel() only marks the entry (O(1)); cancelled entries are skipped when they
+   reach the top of the heap, and the heap is rebuilt if they ever make up most of it.
+ - A single thread sleeps until the earliest deadline and runs the callback when it is due.
+
+Callbacks run on the timer thread, so they should only hand work off (put an event on a
+queue, shut down a socket) rather than block.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+
+class Timer:
+    __slots__ = ("deadline", "callback", "args", "cancelled", "_service")
+
+    def __init__(self, service, deadline, callback, args):
+        self._service = service
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        if not self.cancelled:
+            self.cancelled = True
+            self._service._note_cancelled()
+
+
+class TimerService:
+    def __init__(self):
+        self._heap = []  # (deadline, tie-breaker, Timer)
+        self._counter = itertools.count()
+        self._cancelled = 0
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="timers", daemon=True)
+            self._thread.start()
+        return self
+
+    def schedule(self, delay, callback, *args):
+        """Run callback(*args) once, 'delay' seconds from now. Returns a cancellable Timer."""
+        timer = Timer(self, time.monotonic() + delay, callback, args)
+        with self._cond:
+            heapq.heappush(self._heap, (timer.deadline, next(self._counter), timer))
+            if self._heap[0][2] is timer:
+                self._cond.notify()  # new earliest deadline: wake the timer thread early
+        return timer
+
+    def _note_cancelled(self):
+        with self._cond:
+            self._cancelled += 1
+            if self._cancelled > 64 and self._cancelled > len(self._heap) // 2:
+                self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+
+    def _pop_due(self):
+        """Wait for the earliest live timer to become due, then pop and return it."""
+        with self._cond:
+            while True:
+                while self._heap and self._heap[0][2].cancelled:
+                    heapq.heappop(self._heap)
+                    self._cancelled -= 1
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                delay = self._heap[0][0] - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                timer = heapq.heappop(self._heap)[2]
+                timer.cancelled = True  # fired timers can no longer be cancelled
+                return timer
+
+    def _run(self):
+        while True:
+            timer = self._pop_due()
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                print(f"[ERROR] Timer callback {timer.callback} failed: {e}")
+                traceback.print_exc()
@@ -0,0 +1,261 @@
+"""
+trace_replay.py
+
+Load test that replays traffic traces recorded by the server (set TRACE_FILE in server.py,
+see traffic_trace.py) against a running local server, so regressions are measured on what
+real players did: logins, chat bursts, pauses, reconnects, quit / quit! and corrupted frames.
+
+Every recorded session gets its own connection. Its packets are sent at the recorded times
+divided by --speed (1 = real time, 10 = ten times faster) with fresh sequence numbers, and
+heartbeats are answered like client.py does. Several traces, and several copies of each
+(--copies), run at the same time; usernames get a suffix so the copies do not collide.
+Server deadlines (turn timeouts, reconnect windows) are not sped up, so at high speeds a
+match can play out differently than recorded.
+
+Reported per run:
+ - latency: time from sending a username or game command to the next packet from the server
+ - errors: failed or dropped connections, unanswered commands, and replies starting with
+   [ERROR], [SECURITY] or [BUSY]
+
+Results can be stored as a baseline and later runs compared against it:
+
+    python trace_replay.py traffic.trace.gz --speed 10 --save-baseline   # before a change
+    python trace_replay.py traffic.trace.gz --speed 10 --check           # after: deltas, exit 1 on regression
+"""
+
+import argparse
+import collections
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+from protocol import encode_packet, new_sequence, PacketReader, PING, PONG
+from traffic_trace import load_trace
+from transport import connect
+
+BASELINE_FILE = "replay_baseline.json"
+REPLY_TIMEOUT = 5.0  # a reply later than this is not counted as that command's latency
+LATENCY_TOLERANCE = 0.5  # --check fails if p95 latency grows by more than this share...
+LATENCY_FLOOR_MS = 2.0  # ...and by more than this many milliseconds
+ERROR_PREFIXES = {"error": "[ERROR]", "security": "[SECURITY]", "busy": "[BUSY]"}
+
+
+class SessionReplay:
+    """Replays one recorded session on its own connection."""
+
+    def __init__(self, events, address, speed, suffix=""):
+        self.events = events
+        self.address = address
+        self.speed = speed
+        self.suffix = suffix
+        self.latencies = []
+        self.errors = collections.Counter()
+        self.sent = 0
+        self.replies = 0
+        self._lock = threading.Lock()
+        self._pending = None  # send time of the last command still waiting for a reply
+        self._closing = False
+        self._seq = new_sequence()  # shared with the receiving thread, which sends the pongs
+
+    def run(self, t0):
+        sock = None
+        receiver = None
+        seq = self._seq
+        try:
+            for ms, kind, *fields in self.events:
+                delay = t0 + ms / 1000 / self.speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                if kind == 'o':
+                    try:
+                        sock = connect(self.address)
+                    except OSError:
+                        self.errors['connect_failed'] += 1
+                        return
+                    receiver = threading.Thread(target=self._receive, args=(sock,), daemon=True)
+                    receiver.start()
+                elif sock is None:
+                    continue
+                elif kind == 'c':
+                    break
+                elif kind == 'x':
+                    frame = bytearray(encode_packet(next(seq), 1, "x"))
+                    frame[-1] ^= 0xFF  # authentication tag no longer matches
+                    self._send(sock, bytes(frame))
+                else:
+                    packet_type, payload = fields
+                    if kind == 'u':
+                        payload += self.suffix
+                    if kind == 'u' or packet_type == 1:
+                        self._expect_reply()
+                    self._send(sock, encode_packet(next(seq), packet_type, payload))
+        finally:
+            self._closing = True
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                sock.close()
+            if receiver is not None:
+                receiver.join()
+
+    def _expect_reply(self):
+        with self._lock:
+            if self._pending is not None and time.monotonic() - self._pending > REPLY_TIMEOUT:
+                self.errors['unanswered'] += 1
+            self._pending = time.monotonic()
+
+    def _send(self, sock, frame):
+        try:
+            sock.sendall(frame)
+            self.sent += 1
+        except OSError:
+            self.errors['send_failed'] += 1
+
+    def _receive(self, sock):
+        reader = PacketReader(sock)
+        while True:
+            try:
+                _, packet_type, payload = reader.read_packet()
+            except ValueError:
+                self.errors['corrupt_reply'] += 1
+                continue
+            except OSError:
+                break
+            now = time.monotonic()
+            if packet_type == PING:
+                try:
+                    sock.sendall(encode_packet(next(self._seq), PONG, payload))
+                except OSError:
+                    pass
+                continue
+            self.replies += 1
+            with self._lock:
+                if self._pending is not None and now - self._pending <= REPLY_TIMEOUT:
+                    self.latencies.append(now - self._pending)
+                    self._pending = None
+            for kind, prefix in ERROR_PREFIXES.items():
+                if payload.startswith(prefix):
+                    self.errors[kind] += 1
+        if not self._closing:
+            self.errors['dropped'] += 1  # the server closed before the recorded session ended
+
+
+def percentile(values, share):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def replay(traces, address, speed, copies):
+    sessions = []
+    for i, path in enumerate(traces):
+        recorded = load_trace(path)
+        for copy in range(copies):
+            suffix = f"#{i}.{copy}" if len(traces) * copies > 1 else ""
+            sessions.extend(SessionReplay(events, address, speed, suffix) for events in recorded.values())
+
+    t0 = time.monotonic() + 0.2  # let every thread start before the first event is due
+    threads = [threading.Thread(target=s.run, args=(t0,), daemon=True) for s in sessions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.monotonic() - t0
+
+    latencies = sorted(ms * 1000 for s in sessions for ms in s.latencies)
+    errors = collections.Counter()
+    for s in sessions:
+        errors.update(s.errors)
+    return {
+        "sessions": len(sessions),
+        "packets_sent": sum(s.sent for s in sessions),
+        "replies": sum(s.replies for s in sessions),
+        "duration": duration,
+        "latency_ms": {
+            "samples": len(latencies),
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else 0.0,
+        },
+        "errors": dict(sorted(errors.items())),
+    }
+
+
+def print_report(results):
+    latency = results["latency_ms"]
+    print(f"Sessions              : {results['sessions']}")
+    print(f"Packets sent          : {results['packets_sent']} ({results['packets_sent'] / results['duration']:.1f}/sec)")
+    print(f"Server packets        : {results['replies']}")
+    print(f"Duration              : {results['duration']:.1f} s")
+    print(f"Latency (ms)          : p50 {latency['p50']:.2f}  p95 {latency['p95']:.2f}  "
+          f"p99 {latency['p99']:.2f}  max {latency['max']:.2f}  ({latency['samples']} samples)")
+    print(f"Errors                : {sum(results['errors'].values())} {results['errors'] or ''}")
+
+
+def compare(current, baseline):
+    """Print latency and error deltas against baseline; return a list of regressions."""
+    failures = []
+    print("\nDeltas against baseline")
+    for key in ("p50", "p95", "p99", "max"):
+        now, before = current["latency_ms"][key], baseline["latency_ms"][key]
+        change = f"{(now - before) / before:+.0%}" if before else ""
+        print(f"  latency {key:<4} {before:>9.2f} -> {now:>9.2f} ms  {change}")
+    before = baseline["latency_ms"]["p95"]
+    now = current["latency_ms"]["p95"]
+    if now > before * (1 + LATENCY_TOLERANCE) and now - before > LATENCY_FLOOR_MS:
+        failures.append(f"p95 latency {now:.2f} ms (baseline {before:.2f} ms)")
+
+    for kind in sorted(set(current["errors"]) | set(baseline["errors"])):
+        now, before = current["errors"].get(kind, 0), baseline["errors"].get(kind, 0)
+        print(f"  errors  {kind:<14} {before:>5} -> {now:>5}  {now - before:+d}")
+        if now > before:
+            failures.append(f"{kind}: {now} errors (baseline {before})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded traffic traces against a local server.")
+    parser.add_argument("traces", nargs="+", help="trace files written by the server (TRACE_FILE)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--address", help="server address instead of --host/--port, e.g. unix:///tmp/battleship.sock")
+    parser.add_argument("--speed", type=float, default=1.0, help="time compression, e.g. 10 replays 10x faster")
+    parser.add_argument("--copies", type=int, default=1, help="concurrent copies of each trace")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--check", action="store_true", help="exit 1 if this run regresses against the baseline")
+    args = parser.parse_args()
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+
+    address = args.address or f"tcp://{args.host}:{args.port}"
+    results = replay(args.traces, address, args.speed, args.copies)
+    print_report(results)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if args.check:
+        if not os.path.exists(args.baseline):
+            print(f"\n[ERROR] No baseline at {args.baseline}; run with --save-baseline first.")
+            sys.exit(2)
+        with open(args.baseline) as f:
+            failures = compare(results, json.load(f))
+        if failures:
+            print("\n[FAIL] Regressions against baseline:")
+            for failure in failures:
+                print("  - " + failure)
+            sys.exit(1)
+        print("\n[OK] No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
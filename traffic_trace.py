@@ -0,0 +1,93 @@
+"""
+traffic_trace.py
+
+Records decrypted inbound client traffic with timing, for replay load tests (trace_replay.py).
+
+A trace is a gzip file of JSON lines. The first line is a header, every other line is one
+event [session, ms, kind, ...] where 'session' numbers the connection and 'ms' is the time
+since recording started:
+ - [s, ms, "o"]                     connection accepted
+ - [s, ms, "u", type, username]     username candidate sent during login
+ - [s, ms, "p", type, payload]      packet after login (heartbeat replies are left out)
+ - [s, ms, "x"]                     corrupted frame
+ - [s, ms, "c"]                     connection closed
+
+The server only appends to an in-memory buffer; a background thread compresses and
+writes the buffered events every FLUSH_INTERVAL seconds.
+"""
+
+import collections
+import gzip
+import itertools
+import json
+import threading
+import time
+
+TRACE_VERSION = 1
+FLUSH_INTERVAL = 1.0
+
+
+class TrafficRecorder:
+    def __init__(self, path):
+        self.path = path
+        self._buffer = collections.deque()  # appends and pops are thread-safe
+        self._sessions = itertools.count(1)
+        self._started = time.monotonic()
+        self._closing = threading.Event()
+        self._thread = None
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._file.write(json.dumps({'version': TRACE_VERSION, 'started': time.time()}) + "\n")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def open_session(self):
+        """Number a new connection and record that it was accepted."""
+        session = next(self._sessions)
+        self.record(session, "o")
+        return session
+
+    def record(self, session, kind, *fields):
+        self._buffer.append((session, round((time.monotonic() - self._started) * 1000), kind) + fields)
+
+    def close(self):
+        """Write everything still buffered and close the file."""
+        self._closing.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._flush()
+        self._file.close()
+
+    def _run(self):
+        while not self._closing.wait(FLUSH_INTERVAL):
+            self._flush()
+
+    def _flush(self):
+        lines = []
+        while self._buffer:
+            lines.append(json.dumps(self._buffer.popleft(), separators=(",", ":")))
+        if lines:
+            self._file.write("\n".join(lines) + "\n")
+            self._file.flush()
+
+
+def load_trace(path):
+    """
+    Read a trace into {session: [(ms, kind, *fields), ...]}, sessions ordered by when they
+    connected. A trace cut short by a crash loads up to its last complete line.
+    """
+    sessions = {}
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get('version') != TRACE_VERSION:
+            raise ValueError(f"Unsupported trace version: {header.get('version')}")
+        try:
+            for line in f:
+                session, ms, kind, *fields = json.loads(line)
+                sessions.setdefault(session, []).append((ms, kind, *fields))
+        except (EOFError, ValueError):
+            pass  # truncated tail
+    return dict(sorted(sessions.items(), key=lambda item: item[1][0][0]))
@@ -0,0 +1,188 @@
+"""
+transport.py
+
+Stream transports for the game server and clients, chosen by address:
+ - tcp://HOST:PORT        TCP, the default (server.py and client.py build it from HOST and PORT)
+ - unix:///path/to.sock   Unix domain socket, for bots and tools on the same machine
+ - inproc://NAME          socketpair() inside one process, for tests and benchmarks
+
+Every transport hands out ordinary stream sockets, so the server, client.py and protocol.py
+(PacketReader, sendall, shutdown, timeouts) behave the same whichever is in use. Listeners
+return (conn, (host, port)) from accept(); local peers get ("unix", n) or ("inproc", n).
+is_local_peer() tells them apart, e.g. to exempt local peers from per-address limits.
+"""
+
+import errno
+import itertools
+import os
+import queue
+import socket
+import stat
+import threading
+
+LOCAL_SCHEMES = ("unix", "inproc")
+
+_inproc = {}  # name -> InprocListener
+_inproc_lock = threading.Lock()
+
+
+def parse_address(address):
+    """Split an address into (scheme, target): (host, port) for tcp, a path or name otherwise."""
+    scheme, sep, rest = address.partition("://")
+    if not sep:
+        raise ValueError(f"Address needs a scheme (tcp://, unix:// or inproc://): {address}")
+    if scheme == "tcp":
+        host, colon, port = rest.rpartition(":")
+        if not colon or not port.isdigit():
+            raise ValueError(f"Expected tcp://HOST:PORT, got {address}")
+        return scheme, (host.strip("[]"), int(port))
+    if scheme in ("unix", "inproc"):
+        if not rest:
+            raise ValueError(f"Missing {'path' if scheme == 'unix' else 'name'} in {address}")
+        if scheme == "unix" and not hasattr(socket, "AF_UNIX"):
+            raise ValueError("Unix domain sockets are not supported on this platform")
+        return scheme, rest
+    raise ValueError(f"Unknown transport '{scheme}' in {address}")
+
+
+class Listener:
+    """A listening TCP or Unix domain socket."""
+
+    def __init__(self, sock, scheme, path=None):
+        self.sock = sock
+        self.scheme = scheme
+        self.path = path  # socket file to remove on close (unix only)
+        self._peers = itertools.count(1)
+
+    def accept(self):
+        conn, addr = self.sock.accept()
+        if self.scheme == "unix":
+            addr = ("unix", next(self._peers))  # Unix peers have no address of their own
+        return conn, addr
+
+    def close(self):
+        self.sock.close()
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class InprocListener:
+    """
+    In-process listener. connect() makes a socketpair and queues one end for accept(),
+    so there is no port or socket file and nothing leaves the process.
+    """
+
+    def __init__(self, name, backlog):
+        self.name = name
+        self.backlog = backlog
+        self._pending = queue.Queue()  # server ends of new socketpairs; None once closed
+        self._peers = itertools.count(1)
+        self._closed = False
+
+    def connect(self):
+        if self._closed or self._pending.qsize() >= self.backlog:
+            raise ConnectionRefusedError(errno.ECONNREFUSED, f"Connection refused: inproc://{self.name}")
+        client, server = socket.socketpair()
+        self._pending.put(server)
+        return client
+
+    def accept(self):
+        conn = self._pending.get()
+        if conn is None:
+            self._pending.put(None)  # wake any other thread blocked in accept()
+            raise OSError(errno.EBADF, "Listener closed")
+        return conn, ("inproc", next(self._peers))
+
+    def close(self):
+        with _inproc_lock:
+            if _inproc.get(self.name) is self:
+                del _inproc[self.name]
+        self._closed = True
+        self._pending.put(None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def is_local_peer(addr):
+    """True for a peer address from a unix:// or inproc:// listener, which has no real address."""
+    return addr[0] in LOCAL_SCHEMES
+
+
+def listen(address, backlog=socket.SOMAXCONN):
+    """Open a listener for address (see the module docstring)."""
+    scheme, target = parse_address(address)
+    if scheme == "inproc":
+        listener = InprocListener(target, backlog)
+        with _inproc_lock:
+            if target in _inproc:
+                raise OSError(errno.EADDRINUSE, f"Address already in use: {address}")
+            _inproc[target] = listener
+        return listener
+
+    if scheme == "unix":
+        _remove_stale_socket(target)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        sock = socket.socket(socket.AF_INET6 if ":" in target[0] else socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.bind(target)
+        sock.listen(backlog)
+    except OSError:
+        sock.close()
+        raise
+    return Listener(sock, scheme, target if scheme == "unix" else None)
+
+
+def connect(address, timeout=None):
+    """Connect to a listener and return a stream socket."""
+    scheme, target = parse_address(address)
+    if scheme == "tcp":
+        return socket.create_connection(target, timeout)
+    if scheme == "unix":
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(timeout)
+            sock.connect(target)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+    with _inproc_lock:
+        listener = _inproc.get(target)
+    if listener is None:
+        raise ConnectionRefusedError(errno.ECONNREFUSED, f"Connection refused: {address}")
+    sock = listener.connect()
+    sock.settimeout(timeout)
+    return sock
+
+
+def _remove_stale_socket(path):
+    # A socket file left behind by a server that exited uncleanly would make bind() fail;
+    # one that still accepts connections belongs to a running server and is left alone.
+    try:
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            return
+    except FileNotFoundError:
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)
+    else:
+        raise OSError(errno.EADDRINUSE, f"Address already in use: unix://{path}")
+    finally:
+        probe.close()
@@ -0,0 +1,77 @@
+"""
+transport_bench.py
+
+Per-message overhead of the transports in transport.py.
+
+For each transport an echo server answers every packet with the same packet, and one
+client sends packets one at a time, waiting for each echo. The report is round trips per
+second and microseconds per round trip (framing, encryption and decoding included, as in
+the real game), so the transports can be compared directly.
+
+    python transport_bench.py --count 20000
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from protocol import encode_packet, PacketReader
+from transport import listen, connect
+
+
+def echo(listener):
+    conn, _ = listener.accept()
+    reader = PacketReader(conn)
+    try:
+        while True:
+            seq, packet_type, payload = reader.read_packet()
+            conn.sendall(encode_packet(seq, packet_type, payload))
+    except OSError:
+        pass
+    finally:
+        conn.close()
+
+
+def round_trips(address, count, payload):
+    with listen(address) as listener:
+        server = threading.Thread(target=echo, args=(listener,), daemon=True)
+        server.start()
+        with connect(address) as sock:
+            reader = PacketReader(sock)
+            packet = encode_packet(1, 1, payload)
+            for _ in range(count // 10):  # warm up
+                sock.sendall(packet)
+                reader.read_packet()
+            start = time.perf_counter()
+            for _ in range(count):
+                sock.sendall(packet)
+                reader.read_packet()
+            elapsed = time.perf_counter() - start
+        server.join()
+    return elapsed / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare round-trip cost of the server transports.")
+    parser.add_argument("--count", type=int, default=20000, help="round trips per transport")
+    parser.add_argument("--payload", default="B5", help="packet payload to echo")
+    parser.add_argument("--port", type=int, default=5099, help="TCP port for the tcp:// run")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.sock")
+    addresses = [f"tcp://127.0.0.1:{args.port}", f"unix://{path}", "inproc://bench"]
+    print(f"{'transport':<34} {'round trips/sec':>16} {'us/round trip':>14}")
+    for address in addresses:
+        try:
+            per_trip = round_trips(address, args.count, args.payload)
+        except (OSError, ValueError) as e:
+            print(f"{address:<34} skipped: {e}")
+            continue
+        print(f"{address:<34} {1 / per_trip:>16,.0f} {per_trip * 1e6:>14.1f}")
+    os.rmdir(os.path.dirname(path))
+
+
+if __name__ == "__main__":
+    main()